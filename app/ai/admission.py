@@ -0,0 +1,233 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from app import config
+from app.metrics import CollectedMetric, register
+
+# The user a request is made for; the wait queues take turns between users so one user's
+# burst of requests can't hold every slot. Copied into the graph's tasks like the deadline.
+_user: ContextVar[str] = ContextVar("admission_user", default="anonymous")
+
+
+class Overloaded(Exception):
+    """Raised when a provider's wait queue is full; the request should be retried later."""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(f"Too many requests waiting for {provider}, retry in {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+@contextmanager
+def acting_for(user_id: str):
+    """
+    Make the outbound calls of the code in the block on behalf of a user.
+
+    Args:
+        user_id (str): The id of the user the request is answered for.
+    """
+    token = _user.set(str(user_id))
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+class TokenBucket:
+    """
+    Rate limit of `rate` calls per second with bursts of up to `burst` calls.
+
+    Tokens are reserved ahead of time, so callers are served in order and each one just
+    sleeps until its token is due.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0.0)
+
+
+@dataclass
+class GateStats:
+    admitted: int = 0
+    rejected: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_wait_seconds": round(self.wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+        }
+
+
+class ProviderGate:
+    """
+    Admission control of the outbound calls to one provider.
+
+    At most `concurrency` calls run at once and at most `rate` start per second. Calls over
+    the limit wait in a queue of at most `max_queue` calls (`max_queue_per_user` per user)
+    that is served round-robin between users; when it is full the call is rejected at once
+    with Overloaded instead of piling up behind the provider's own rate limits.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, rate: float = 0.0, burst: int = 1,
+                 max_queue_per_user: int = config.ADMISSION_MAX_QUEUE_PER_USER):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.stats = GateStats()
+        self.active = 0
+        self.queued = 0
+        # user -> their waiting calls; the dict's order is the order in which users get a turn
+        self._waiters: dict[str, deque[asyncio.Future]] = {}
+        # Moving average of how long a call holds its slot, for the Retry-After estimate
+        self._hold_seconds = 1.0
+
+    def retry_after(self) -> int:
+        """Seconds after which the calls queued now should have been served."""
+        waiting = self.queued + 1
+        seconds = waiting * self._hold_seconds / self.concurrency
+        if self.bucket:
+            seconds = max(seconds, waiting / self.bucket.rate)
+        return max(math.ceil(seconds), 1)
+
+    def check(self):
+        """
+        Reject a new request up front when it would have to queue and the queue is full.
+
+        Raises:
+            Overloaded: When the queue is full.
+        """
+        if self.active >= self.concurrency and self.queued >= self.max_queue:
+            self.stats.rejected += 1
+            raise Overloaded(self.name, self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one of the provider's slots for the duration of the block.
+
+        Raises:
+            Overloaded: When the wait queue (or the user's share of it) is full.
+        """
+        started = time.monotonic()
+        await self._acquire(_user.get())
+        try:
+            if self.bucket:
+                delay = self.bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+            admitted = time.monotonic()
+            waited = admitted - started
+            self.stats.admitted += 1
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+            yield
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.monotonic() - admitted)
+        finally:
+            self._release()
+
+    async def _acquire(self, user: str):
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            return
+        waiting = self._waiters.get(user)
+        if self.queued >= self.max_queue or (waiting and len(waiting) >= self.max_queue_per_user):
+            self.stats.rejected += 1
+            raise Overloaded(self.name, self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user, deque()).append(future)
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the call was cancelled: pass it on
+                self._release()
+            else:
+                self._forget(user, future)
+            raise
+
+    def _forget(self, user: str, future: asyncio.Future):
+        waiting = self._waiters.get(user)
+        if waiting and future in waiting:
+            waiting.remove(future)
+            self.queued -= 1
+            if not waiting:
+                del self._waiters[user]
+
+    def _release(self):
+        # Hand the slot straight to the next user's oldest call, then send that user to the back
+        while self._waiters:
+            user = next(iter(self._waiters))
+            waiting = self._waiters.pop(user)
+            future = waiting.popleft()
+            self.queued -= 1
+            if waiting:
+                self._waiters[user] = waiting
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats_dict(self) -> dict:
+        return {"active": self.active, "queued": self.queued, **self.stats.as_dict()}
+
+
+# Settings of the providers the agent calls: (concurrency, max_queue, rate, burst)
+PROVIDERS = {
+    "openai": (config.ADMISSION_OPENAI_CONCURRENCY, config.ADMISSION_OPENAI_MAX_QUEUE,
+               config.ADMISSION_OPENAI_RATE, config.ADMISSION_OPENAI_BURST),
+    "tavily": (config.ADMISSION_TAVILY_CONCURRENCY, config.ADMISSION_TAVILY_MAX_QUEUE,
+               config.ADMISSION_TAVILY_RATE, config.ADMISSION_TAVILY_BURST),
+    "fetch": (config.ADMISSION_FETCH_CONCURRENCY, config.ADMISSION_FETCH_MAX_QUEUE,
+              config.ADMISSION_FETCH_RATE, config.ADMISSION_FETCH_BURST),
+}
+
+_gates: dict[str, ProviderGate] = {}
+
+
+def get_gate(provider: str) -> ProviderGate:
+    """
+    Return the gate shared by every call to a provider in this process.
+
+    Args:
+        provider (str): "openai", "tavily" or "fetch".
+
+    Returns:
+        ProviderGate: The provider's gate, created on first use.
+    """
+    if provider not in _gates:
+        _gates[provider] = ProviderGate(provider, *PROVIDERS[provider])
+    return _gates[provider]
+
+
+def admission_stats() -> dict:
+    return {provider: get_gate(provider).stats_dict() for provider in PROVIDERS}
+
+
+register(CollectedMetric("admission_active_calls", "Outbound calls holding a slot", ("provider",),
+                        lambda: {(provider,): get_gate(provider).active for provider in PROVIDERS}))
+register(CollectedMetric("admission_queued_calls", "Outbound calls waiting for a slot", ("provider",),
+                        lambda: {(provider,): get_gate(provider).queued for provider in PROVIDERS}))
+register(CollectedMetric("admission_rejected_calls_total", "Outbound calls rejected because the queue was full", ("provider",),
+                        lambda: {(provider,): get_gate(provider).stats.rejected for provider in PROVIDERS}, "counter"))
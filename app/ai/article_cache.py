@@ -0,0 +1,117 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+from app import config
+from app.ai.cache import CacheStats, SQLiteCacheStore, TTLCache
+from app.ai.fetcher import FetchedPage, PageFetcher
+
+
+@dataclass
+class ArticleCacheStats(CacheStats):
+    revalidated: int = 0
+    bytes_downloaded: int = 0
+
+
+class ArticleCache:
+    """
+    URL-keyed cache of scraped article text.
+
+    Entries are fresh for `ttl` seconds and served without any request. Older entries are
+    kept for up to `max_stale` seconds and revalidated with If-None-Match/If-Modified-Since,
+    so an unchanged page costs a 304 instead of a download and a re-parse. Entries live in an
+    in-memory LRU tier and, when `sqlite_path` is set, in an on-disk SQLite tier shared by
+    the workers of a host.
+    """
+
+    def __init__(
+        self,
+        ttl: float = config.ARTICLE_CACHE_TTL_SECONDS,
+        max_stale: float = config.ARTICLE_CACHE_STALE_SECONDS,
+        max_entries: int = config.ARTICLE_CACHE_MAX_ENTRIES,
+        sqlite_path: str = config.ARTICLE_CACHE_SQLITE_PATH,
+    ):
+        self.ttl = ttl
+        self.stats = ArticleCacheStats()
+        self.memory = TTLCache(max_entries, max_stale)
+        self.disk = SQLiteCacheStore(sqlite_path, "article_cache", max_stale) if sqlite_path else None
+        if self.disk:
+            self.disk.prune()
+
+    async def _get(self, url: str) -> dict | None:
+        entry = self.memory.get(url)
+        if entry is None and self.disk:
+            stored = await asyncio.to_thread(self.disk.get, url)
+            if stored:
+                entry = stored[1]
+                self.memory.set(url, entry, stored_at=stored[0])
+        return entry
+
+    async def _set(self, url: str, entry: dict):
+        self.memory.set(url, entry)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, url, entry)
+
+    async def load(self, url: str, fetcher: PageFetcher, extract: Callable[[FetchedPage], str],
+                   consume: Callable[[str | None], Any] | None = None) -> str:
+        """
+        Return the article text of a URL, from the cache when possible.
+
+        Args:
+            url (str): The URL of the article.
+            fetcher (PageFetcher): The fetcher used for downloads and revalidations.
+            extract (Callable[[FetchedPage], str]): Turns a downloaded page into article text.
+            consume (Callable[[str | None], Any] | None): The consumer the body is fed to while
+                it downloads, passed on to PageFetcher.fetch.
+
+        Returns:
+            str: The article text.
+
+        Raises:
+            FetchError: When the page has to be downloaded and the download fails.
+        """
+        entry = await self._get(url)
+        now = time.time()
+        if entry and now - entry["fetched_at"] <= self.ttl:
+            self.stats.hits += 1
+            return entry["text"]
+
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        page = await fetcher.fetch(url, headers=headers or None, consume=consume)
+        if page.status_code == 304 and entry:
+            self.stats.revalidated += 1
+            entry = {**entry, "fetched_at": now}
+        else:
+            self.stats.misses += 1
+            self.stats.bytes_downloaded += page.size
+            entry = {
+                "text": extract(page),
+                "etag": page.etag,
+                "last_modified": page.last_modified,
+                "fetched_at": now,
+            }
+        self.stats.stores += 1
+        await self._set(url, entry)
+        return entry["text"]
+
+    def stats_dict(self) -> dict:
+        stats = self.stats.as_dict()
+        stats["entries"] = len(self.memory)
+        if self.disk:
+            stats["disk"] = self.disk.stats.as_dict()
+        return stats
+
+
+_article_cache: ArticleCache | None = None
+
+
+def get_article_cache() -> ArticleCache:
+    global _article_cache
+    if _article_cache is None:
+        _article_cache = ArticleCache()
+    return _article_cache
@@ -0,0 +1,113 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        lookups = self.hits + self.misses
+        stats["hit_rate"] = round(self.hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class TTLCache:
+    """
+    In-memory LRU cache whose entries expire `ttl` seconds after they were stored.
+
+    Once `max_entries` is reached the least recently used entry is evicted. Values are
+    kept as-is, so callers must not mutate what they get back.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, stats: CacheStats | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, stored_at: float | None = None):
+        self._entries[key] = (stored_at or time.time(), value)
+        self._entries.move_to_end(key)
+        self.stats.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """
+    On-disk cache tier: JSON values in a SQLite table, expired `ttl` seconds after they were stored.
+
+    The store is shared by every event loop thread of the process, so access goes through a lock.
+    Calls are blocking; async callers should run them with asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, table: str, ttl: float):
+        self.table = table
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> tuple[float, Any] | None:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT stored_at, value FROM {self.table} WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, value: Any, stored_at: float | None = None):
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored_at or time.time()),
+            )
+        self.stats.stores += 1
+
+    def prune(self):
+        # Drop every expired row; called on startup so the file doesn't grow forever
+        with self._lock:
+            deleted = self._connection.execute(
+                f"DELETE FROM {self.table} WHERE stored_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+        self.stats.evictions += deleted
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
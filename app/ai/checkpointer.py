@@ -0,0 +1,580 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Sequence
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    empty_checkpoint,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.types import TASKS
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from app import config
+from app.models.ai_models import AgentCheckpoint, AgentCheckpointWrite
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS = AgentCheckpoint.__table__
+WRITES = AgentCheckpointWrite.__table__
+CHECKPOINT_KEY = ("thread_id", "checkpoint_ns", "checkpoint_id")
+WRITE_KEY = ("thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx")
+
+# Loads the latest messages of a conversation from the Message table
+Rebuild = Callable[[str], list[BaseMessage]]
+
+
+def trim_messages_tail(messages: list[BaseMessage], tail: int) -> list[BaseMessage]:
+    """
+    Keep the last `tail` messages of a conversation.
+
+    The kept messages start at a human message, so a tool result or an answer is never
+    separated from the request it belongs to. When the last human message is more than
+    `tail` messages back, everything from it is kept: the current question and all of
+    its tool calls and results.
+
+    Args:
+        messages (list[BaseMessage]): The messages of the conversation.
+        tail (int): The number of messages to keep, unless the current question needs more.
+
+    Returns:
+        list[BaseMessage]: The trimmed messages.
+    """
+    if len(messages) <= tail:
+        return messages
+    start = len(messages) - tail
+    for index in range(start, len(messages)):
+        if isinstance(messages[index], HumanMessage):
+            return messages[index:]
+    for index in range(start - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return messages[index:]
+    return messages
+
+
+def compact_checkpoint(checkpoint: Checkpoint, tail: int) -> Checkpoint:
+    messages = checkpoint["channel_values"].get("messages")
+    if not isinstance(messages, list) or len(messages) <= tail:
+        return checkpoint
+    return {**checkpoint, "channel_values": {**checkpoint["channel_values"], "messages": trim_messages_tail(messages, tail)}}
+
+
+def rebuilt_tuple(saver: BaseCheckpointSaver, config: RunnableConfig, messages: list[BaseMessage]) -> CheckpointTuple:
+    # A checkpoint holding only the conversation's messages, as if it had never been evicted
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": messages}
+    checkpoint["channel_versions"] = {"messages": saver.get_next_version(None, None)}
+    return CheckpointTuple(
+        config={
+            "configurable": {
+                "thread_id": config["configurable"]["thread_id"],
+                "checkpoint_ns": "",
+                "checkpoint_id": checkpoint["id"],
+            }
+        },
+        checkpoint=checkpoint,
+        metadata={"source": "rebuild", "step": -1, "writes": None, "parents": {}},
+        parent_config=None,
+        pending_writes=[],
+    )
+
+
+def can_rebuild(config: RunnableConfig) -> bool:
+    # Only the latest state of the main graph is rebuilt, never a specific or nested checkpoint
+    return not get_checkpoint_id(config) and not config["configurable"].get("checkpoint_ns")
+
+
+def upsert(connection: Connection, table, rows: list[dict], key: tuple[str, ...]):
+    # One statement per batch; rows already in the table are replaced
+    if connection.dialect.name in ("postgresql", "sqlite"):
+        dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: statement.excluded[column] for column in rows[0] if column not in key},
+        )
+        connection.execute(statement, rows)
+        return
+    keys = [tuple(row[column] for column in key) for row in rows]
+    connection.execute(delete(table).where(tuple_(*(table.c[column] for column in key)).in_(keys)))
+    connection.execute(insert(table), rows)
+
+
+class SQLCheckpointSaver(BaseCheckpointSaver[int]):
+    """
+    LangGraph checkpointer that keeps the agent's conversation state in the application database.
+
+    Checkpoints and pending writes are buffered in memory and written in batches: when
+    `batch_size` rows are waiting, `flush_interval` seconds after the first buffered row,
+    before every read and when flush() is called at the end of a run. Any worker can then
+    resume any thread. Threads idle for longer than `retention_days` are deleted, checked at
+    most every `prune_interval` seconds.
+
+    In compact mode only the latest checkpoint of each thread is kept, with its message list
+    cut to the last `message_tail` messages; superseded checkpoints are dropped from the
+    buffer before they are written and deleted from the tables when a batch is written.
+    Threads without a checkpoint (e.g. pruned ones) are rebuilt with `rebuild`.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        serde: Optional[SerializerProtocol] = None,
+        batch_size: int = config.CHECKPOINT_BATCH_SIZE,
+        flush_interval: float = config.CHECKPOINT_FLUSH_INTERVAL,
+        retention_days: float = config.CHECKPOINT_RETENTION_DAYS,
+        prune_interval: float = 3600,
+        compact: bool = config.CHECKPOINT_COMPACT,
+        message_tail: int = config.CHECKPOINT_MESSAGE_TAIL,
+        rebuild: Rebuild | None = None,
+    ):
+        super().__init__(serde=serde)
+        self.engine = engine
+        self.compact = compact
+        self.message_tail = message_tail
+        self.rebuild = rebuild
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        # Rows waiting to be written, by primary key
+        self._checkpoints: dict[tuple, dict] = {}
+        self._writes: dict[tuple, dict] = {}
+        self._buffer_lock = threading.Lock()
+        # Batches are committed one at a time, in the order they were taken from the buffer
+        self._flush_lock = threading.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._last_prune = time.monotonic()
+
+    # Writes
+
+    def _buffer_checkpoint(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> RunnableConfig:
+        c = checkpoint.copy()
+        c.pop("pending_sends")  # type: ignore[misc]
+        if self.compact:
+            c = compact_checkpoint(c, self.message_tail)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized_checkpoint = self.serde.dumps_typed(c)
+        _, serialized_metadata = self.serde.dumps_typed(metadata)
+        row = {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+            "parent_checkpoint_id": config["configurable"].get("checkpoint_id"),
+            "type": type_,
+            "checkpoint": serialized_checkpoint,
+            "checkpoint_metadata": serialized_metadata,
+            "created_at": datetime.utcnow(),
+        }
+        with self._buffer_lock:
+            if self.compact:
+                # The new checkpoint supersedes the buffered ones of its thread and their writes
+                for key in [key for key in self._checkpoints if key[:2] == (thread_id, checkpoint_ns)]:
+                    del self._checkpoints[key]
+                for key in [key for key in self._writes if key[:2] == (thread_id, checkpoint_ns) and key[2] != checkpoint["id"]]:
+                    del self._writes[key]
+            self._checkpoints[(thread_id, checkpoint_ns, checkpoint["id"])] = row
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _buffer_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = {}
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            type_, serialized_value = self.serde.dumps_typed(value)
+            rows[(thread_id, checkpoint_ns, checkpoint_id, task_id, idx)] = {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+                "task_id": task_id,
+                "idx": idx,
+                "channel": channel,
+                "type": type_,
+                "value": serialized_value,
+            }
+        with self._buffer_lock:
+            self._writes.update(rows)
+
+    @property
+    def pending(self) -> int:
+        return len(self._checkpoints) + len(self._writes)
+
+    def resident_stats(self) -> dict:
+        # What the saver holds in memory: the rows waiting to be written
+        with self._buffer_lock:
+            threads = {key[0] for key in self._checkpoints} | {key[0] for key in self._writes}
+            size = sum(len(row["checkpoint"]) + len(row["checkpoint_metadata"]) for row in self._checkpoints.values())
+            size += sum(len(row["value"]) for row in self._writes.values())
+        return {"backend": "sql", "threads": len(threads), "bytes": size, "pending_rows": self.pending}
+
+    def flush(self):
+        """Write the buffered checkpoints and writes in one transaction."""
+        with self._flush_lock:
+            with self._buffer_lock:
+                checkpoints, self._checkpoints = list(self._checkpoints.values()), {}
+                writes, self._writes = list(self._writes.values()), {}
+            if checkpoints or writes:
+                with self.engine.begin() as connection:
+                    if checkpoints:
+                        upsert(connection, CHECKPOINTS, checkpoints, CHECKPOINT_KEY)
+                    if writes:
+                        upsert(connection, WRITES, writes, WRITE_KEY)
+                    if self.compact:
+                        self._delete_superseded(connection, checkpoints)
+            if time.monotonic() - self._last_prune >= self.prune_interval:
+                self._last_prune = time.monotonic()
+                self.prune()
+
+    @staticmethod
+    def _delete_superseded(connection: Connection, checkpoints: list[dict]):
+        latest = {}
+        for row in checkpoints:
+            key = (row["thread_id"], row["checkpoint_ns"])
+            latest[key] = max(latest.get(key, ""), row["checkpoint_id"])
+        for (thread_id, checkpoint_ns), checkpoint_id in latest.items():
+            for table in (WRITES, CHECKPOINTS):
+                connection.execute(delete(table).where(
+                    table.c.thread_id == thread_id,
+                    table.c.checkpoint_ns == checkpoint_ns,
+                    table.c.checkpoint_id < checkpoint_id,
+                ))
+
+    async def aflush(self):
+        if self.pending:
+            await asyncio.to_thread(self.flush)
+
+    def _schedule_flush(self):
+        # Write the batch a little later unless it fills up first
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.aflush()
+        except Exception as e:
+            # The rows stay lost for this batch only; the next run writes a newer checkpoint
+            logger.warning("Checkpoint flush failed: %r", e)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        next_config = self._buffer_checkpoint(config, checkpoint, metadata)
+        if self.pending >= self.batch_size:
+            self.flush()
+        return next_config
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        self._buffer_writes(config, writes, task_id)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        next_config = self._buffer_checkpoint(config, checkpoint, metadata)
+        if self.pending >= self.batch_size:
+            await self.aflush()
+        else:
+            self._schedule_flush()
+        return next_config
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        self._buffer_writes(config, writes, task_id)
+        if self.pending >= self.batch_size:
+            await self.aflush()
+        else:
+            self._schedule_flush()
+
+    # Reads
+
+    def _to_tuple(self, connection: Connection, row) -> CheckpointTuple:
+        writes = connection.execute(
+            select(WRITES.c.task_id, WRITES.c.channel, WRITES.c.type, WRITES.c.value)
+            .where(
+                WRITES.c.thread_id == row.thread_id,
+                WRITES.c.checkpoint_ns == row.checkpoint_ns,
+                WRITES.c.checkpoint_id == row.checkpoint_id,
+            )
+            .order_by(WRITES.c.task_id, WRITES.c.idx)
+        ).all()
+        sends = []
+        if row.parent_checkpoint_id:
+            sends = connection.execute(
+                select(WRITES.c.type, WRITES.c.value)
+                .where(
+                    WRITES.c.thread_id == row.thread_id,
+                    WRITES.c.checkpoint_ns == row.checkpoint_ns,
+                    WRITES.c.checkpoint_id == row.parent_checkpoint_id,
+                    WRITES.c.channel == TASKS,
+                )
+                .order_by(WRITES.c.task_id, WRITES.c.idx)
+            ).all()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": row.checkpoint_id,
+                }
+            },
+            checkpoint={
+                **self.serde.loads_typed((row.type, row.checkpoint)),
+                "pending_sends": [self.serde.loads_typed((send.type, send.value)) for send in sends],
+            },
+            metadata=self.serde.loads_typed((row.type, row.checkpoint_metadata)),
+            parent_config={
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": row.parent_checkpoint_id,
+                }
+            }
+            if row.parent_checkpoint_id
+            else None,
+            pending_writes=[
+                (write.task_id, write.channel, self.serde.loads_typed((write.type, write.value))) for write in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self.flush()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = select(CHECKPOINTS).where(
+            CHECKPOINTS.c.thread_id == thread_id, CHECKPOINTS.c.checkpoint_ns == checkpoint_ns
+        )
+        if checkpoint_id := get_checkpoint_id(config):
+            query = query.where(CHECKPOINTS.c.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(CHECKPOINTS.c.checkpoint_id.desc()).limit(1)
+        with self.engine.connect() as connection:
+            row = connection.execute(query).first()
+            if row:
+                return self._to_tuple(connection, row)
+        if self.rebuild and can_rebuild(config):
+            if messages := self.rebuild(thread_id):
+                return rebuilt_tuple(self, config, messages)
+        return None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        self.flush()
+        query = select(CHECKPOINTS).order_by(CHECKPOINTS.c.thread_id, CHECKPOINTS.c.checkpoint_id.desc())
+        if config:
+            query = query.where(CHECKPOINTS.c.thread_id == config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query = query.where(CHECKPOINTS.c.checkpoint_ns == checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(CHECKPOINTS.c.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query = query.where(CHECKPOINTS.c.checkpoint_id < before_id)
+        if limit is not None and not filter:
+            query = query.limit(limit)
+
+        with self.engine.connect() as connection:
+            tuples = []
+            for row in connection.execute(query):
+                if limit is not None and len(tuples) >= limit:
+                    break
+                checkpoint_tuple = self._to_tuple(connection, row)
+                # Metadata is serialized, so filters are applied here rather than in SQL
+                if filter and not all(checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                tuples.append(checkpoint_tuple)
+        yield from tuples
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    # Retention
+
+    def prune(self) -> int:
+        """
+        Delete the threads whose latest checkpoint is older than the retention period.
+
+        Returns:
+            int: The number of checkpoints deleted.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        expired_threads = (
+            select(CHECKPOINTS.c.thread_id)
+            .group_by(CHECKPOINTS.c.thread_id)
+            .having(func.max(CHECKPOINTS.c.created_at) < cutoff)
+        )
+        with self.engine.begin() as connection:
+            connection.execute(delete(WRITES).where(WRITES.c.thread_id.in_(expired_threads)))
+            deleted = connection.execute(delete(CHECKPOINTS).where(CHECKPOINTS.c.thread_id.in_(expired_threads))).rowcount
+        if deleted:
+            logger.info("Pruned %d checkpoints older than %d days", deleted, self.retention_days)
+        return deleted
+
+
+class CompactingMemorySaver(MemorySaver):
+    """
+    In-process checkpointer for single-worker deployments that keeps memory bounded.
+
+    Only the latest checkpoint of each thread is kept, with its message list cut to the last
+    `message_tail` messages. Threads idle for `ttl` seconds, and the least recently used ones
+    beyond `max_threads`, are evicted; when they come back their messages are rebuilt with
+    `rebuild`.
+    """
+
+    def __init__(
+        self,
+        *,
+        serde: Optional[SerializerProtocol] = None,
+        max_threads: int = config.CHECKPOINT_MAX_THREADS,
+        ttl: float = config.CHECKPOINT_IDLE_SECONDS,
+        message_tail: int = config.CHECKPOINT_MESSAGE_TAIL,
+        rebuild: Rebuild | None = None,
+    ):
+        super().__init__(serde=serde)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.message_tail = message_tail
+        self.rebuild = rebuild
+        self.evictions = 0
+        self.rebuilds = 0
+        # thread_id -> last use, least recently used first
+        self._last_used: OrderedDict[str, float] = OrderedDict()
+
+    def _touch(self, thread_id: str):
+        self._last_used[thread_id] = time.monotonic()
+        self._last_used.move_to_end(thread_id)
+        self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._last_used:
+            thread_id, last_used = next(iter(self._last_used.items()))
+            if len(self._last_used) <= self.max_threads and now - last_used <= self.ttl:
+                break
+            del self._last_used[thread_id]
+            self._drop_thread(thread_id)
+            self.evictions += 1
+
+    def _drop_thread(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        superseded = [checkpoint_id for checkpoint_id in self.storage[thread_id][checkpoint_ns] if checkpoint_id != checkpoint["id"]]
+        next_config = super().put(config, compact_checkpoint(checkpoint, self.message_tail), metadata, new_versions)
+        for checkpoint_id in superseded:
+            del self.storage[thread_id][checkpoint_ns][checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        self._touch(thread_id)
+        return next_config
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        super().put_writes(config, writes, task_id)
+        self._touch(config["configurable"]["thread_id"])
+
+    def _get_resident(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_tuple = super().get_tuple(config)
+        if checkpoint_tuple is not None:
+            self._touch(thread_id)
+        elif thread_id not in self._last_used:
+            # get_tuple() adds empty entries for the threads it looks up
+            self._drop_thread(thread_id)
+        return checkpoint_tuple
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_tuple = self._get_resident(config)
+        if checkpoint_tuple is None and self.rebuild and can_rebuild(config):
+            if messages := self.rebuild(config["configurable"]["thread_id"]):
+                self.rebuilds += 1
+                return rebuilt_tuple(self, config, messages)
+        return checkpoint_tuple
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_tuple = self._get_resident(config)
+        if checkpoint_tuple is None and self.rebuild and can_rebuild(config):
+            # The rebuild reads the database, so it runs off the event loop
+            if messages := await asyncio.to_thread(self.rebuild, config["configurable"]["thread_id"]):
+                self.rebuilds += 1
+                return rebuilt_tuple(self, config, messages)
+        return checkpoint_tuple
+
+    def flush(self):
+        """Nothing is buffered; present for parity with SQLCheckpointSaver."""
+
+    async def aflush(self):
+        pass
+
+    def resident_stats(self) -> dict:
+        size = 0
+        for namespaces in self.storage.values():
+            for checkpoints in namespaces.values():
+                for checkpoint, metadata, _ in checkpoints.values():
+                    size += len(checkpoint[1]) + len(metadata[1])
+        for writes in self.writes.values():
+            size += sum(len(value[1]) for _, _, value in writes.values())
+        return {
+            "backend": "memory",
+            "threads": len(self._last_used),
+            "bytes": size,
+            "evictions": self.evictions,
+            "rebuilds": self.rebuilds,
+        }
+
+
+def create_checkpointer(engine: Engine, rebuild: Rebuild | None = None) -> BaseCheckpointSaver:
+    """
+    Create the checkpointer of the main agent selected by CHECKPOINT_BACKEND.
+
+    Args:
+        engine (Engine): The application database, used by the "sql" backend.
+        rebuild (Rebuild | None): Loads the messages of a conversation that has no checkpoint.
+
+    Returns:
+        BaseCheckpointSaver: A SQLCheckpointSaver ("sql") or a CompactingMemorySaver ("memory").
+    """
+    if config.CHECKPOINT_BACKEND == "memory":
+        return CompactingMemorySaver(rebuild=rebuild)
+    return SQLCheckpointSaver(engine, rebuild=rebuild)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import random
+import re
+from dataclasses import asdict, dataclass
+from app import config
+from app.ai.llm import get_llm
+from app.ai.deadline import within_budget
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_PROMPT = """You are an assistant responsible for analyzing user queries about news. Your task is to determine whether the query pertains to a single specific news item or multiple potential news items.
+Respond with only one word: "single" or "multiple", without any additional information.
+
+Here is the user query: {query}
+
+**Examples:**
+1. User Query: "What happened in the latest match between Pakistan and England?"
+   - Response: single
+2. User Query: "Can you give me all the latest updates on climate change?"
+   - Response: multiple
+3. User Query: "Tell me about the recent policy changes in the education sector."
+   - Response: single
+4. User Query: "What are the current headlines in sports and entertainment?"
+   - Response: multiple
+"""
+
+# (pattern, weight) pairs; the label with the larger total weight wins
+MULTIPLE_RULES = [
+    (re.compile(r"\b(all|every|any|top \d+|top)\b"), 2.0),
+    (re.compile(r"\b(headlines|updates|stories|developments|highlights|roundup|round-up|trends|events|articles)\b"), 2.0),
+    (re.compile(r"\b(what'?s happening|what is happening|what'?s going on|what is going on)\b"), 1.5),
+    (re.compile(r"\b(latest|today'?s|this week'?s|recent|current|breaking) news\b"), 1.0),
+    (re.compile(r"\b(today|this week|this month)\b"), 0.5),
+]
+SINGLE_RULES = [
+    (re.compile(r"\bwhat happened\b"), 2.0),
+    (re.compile(r"^(did|when did|why did|how did|who won|who is|who was)\b"), 2.0),
+    (re.compile(r"\b(match|game|final|verdict|result|score|winner|election result|announcement|attack|crash|deal)\b"), 1.5),
+    (re.compile(r"\bbetween \w+ and \w+"), 1.0),
+    (re.compile(r"\b(tell me about|explain) the\b"), 1.0),
+]
+# Several topics joined by "and" ask for several stories, unless it's "between X and Y"
+TOPIC_LIST = re.compile(r"\b\w+ (and|&) \w+")
+BETWEEN = re.compile(r"\bbetween\b")
+
+
+@dataclass
+class ClassifierStats:
+    local: int = 0
+    llm_fallbacks: int = 0
+    shadow_checks: int = 0
+    agreements: int = 0
+    disagreements: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        compared = self.agreements + self.disagreements
+        stats["agreement_rate"] = round(self.agreements / compared, 4) if compared else 0.0
+        return stats
+
+
+classifier_stats = ClassifierStats()
+# Keep references to the shadow checks so they aren't garbage collected mid-flight
+_shadow_tasks: set[asyncio.Task] = set()
+
+
+def classify_locally(query: str) -> tuple[str, float]:
+    """
+    Classify a news query as "single" or "multiple" with keyword rules.
+
+    Args:
+        query (str): The user's news query.
+
+    Returns:
+        tuple[str, float]: The label and a confidence between 0.5 and 1.0.
+    """
+    text = " ".join(query.lower().split())
+    multiple = sum(weight for pattern, weight in MULTIPLE_RULES if pattern.search(text))
+    single = sum(weight for pattern, weight in SINGLE_RULES if pattern.search(text))
+    if TOPIC_LIST.search(text) and not BETWEEN.search(text):
+        multiple += 1.0
+
+    score = multiple - single
+    label = "multiple" if score > 0 else "single"
+    confidence = 0.5 + min(abs(score), 4.0) / 8
+    return label, confidence
+
+
+def normalize_label(response: str) -> str:
+    response = response.strip().lower()
+    if "multiple" in response:
+        return "multiple"
+    if "single" in response:
+        return "single"
+    return response
+
+
+async def classify_with_llm(query: str) -> str:
+    response = await within_budget(get_llm("classifier").ainvoke(CLASSIFIER_PROMPT.format(query=query)))
+    return normalize_label(response.content)
+
+
+def _append_log(record: dict):
+    with open(config.CLASSIFIER_LOG_PATH, "a") as log_file:
+        log_file.write(json.dumps(record) + "\n")
+
+
+async def record_agreement(query: str, label: str, confidence: float, llm_label: str, source: str):
+    # Compare the local answer with the LLM's and keep the pair for offline tuning
+    if label == llm_label:
+        classifier_stats.agreements += 1
+    else:
+        classifier_stats.disagreements += 1
+    if config.CLASSIFIER_LOG_PATH:
+        record = {"query": query, "local": label, "confidence": confidence, "llm": llm_label, "source": source}
+        await asyncio.to_thread(_append_log, record)
+
+
+async def _shadow_check(query: str, label: str, confidence: float):
+    try:
+        llm_label = await classify_with_llm(query)
+    except Exception as e:
+        logger.warning("Shadow classification failed: %r", e)
+        return
+    classifier_stats.shadow_checks += 1
+    await record_agreement(query, label, confidence, llm_label, "shadow")
+
+
+async def classify_query(query: str) -> str:
+    """
+    Decide whether a news query is about a "single" story or "multiple" stories.
+
+    The local rules answer in microseconds; the LLM is only asked when their confidence is
+    below CLASSIFIER_MIN_CONFIDENCE. A sample (CLASSIFIER_SHADOW_RATE) of the confident local
+    answers is also checked against the LLM in the background to measure agreement.
+
+    Args:
+        query (str): The user's news query.
+
+    Returns:
+        str: "single" or "multiple".
+    """
+    label, confidence = classify_locally(query)
+    if confidence >= config.CLASSIFIER_MIN_CONFIDENCE:
+        classifier_stats.local += 1
+        if random.random() < config.CLASSIFIER_SHADOW_RATE:
+            task = asyncio.create_task(_shadow_check(query, label, confidence))
+            _shadow_tasks.add(task)
+            task.add_done_callback(_shadow_tasks.discard)
+        return label
+
+    classifier_stats.llm_fallbacks += 1
+    llm_label = await classify_with_llm(query)
+    await record_agreement(query, label, confidence, llm_label, "fallback")
+    return llm_label
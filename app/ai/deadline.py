@@ -0,0 +1,78 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, TypeVar
+
+T = TypeVar("T")
+
+# time.monotonic() by which the current request must be answered. Context variables are
+# copied into the tasks LangGraph starts for nodes, tools and Sends, so every stage sees it.
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """
+    Give the code in the block at most `seconds`, without extending an enclosing deadline.
+
+    Args:
+        seconds (float | None): The budget of the block; None keeps the enclosing deadline.
+    """
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    new_deadline = time.monotonic() + seconds
+    token = _deadline.set(new_deadline if current is None else min(current, new_deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left before the current deadline, None when there is none."""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return max(current - time.monotonic(), 0.0)
+
+
+def stage_budget(limit: float | None = None, reserve: float = 0.0) -> float | None:
+    """
+    The time a stage may take: its own limit, cut to what remains of the deadline.
+
+    Args:
+        limit (float | None): The stage's own limit, None for no limit.
+        reserve (float): Seconds of the deadline kept for the stages that come after.
+
+    Returns:
+        float | None: The budget in seconds, None when neither a limit nor a deadline applies.
+    """
+    left = remaining()
+    if left is None:
+        return limit
+    left = max(left - reserve, 0.0)
+    return left if limit is None else min(limit, left)
+
+
+async def within_budget(awaitable: Awaitable[T], limit: float | None = None, reserve: float = 0.0) -> T:
+    """
+    Await a stage, cancelling it when its budget runs out.
+
+    Args:
+        awaitable (Awaitable[T]): The stage, e.g. an LLM or search call.
+        limit (float | None): The stage's own limit.
+        reserve (float): Seconds of the deadline kept for the stages that come after.
+
+    Returns:
+        T: The result of the stage.
+
+    Raises:
+        TimeoutError: When the budget runs out.
+    """
+    budget = stage_budget(limit, reserve)
+    async with asyncio.timeout(budget):
+        with deadline(budget):
+            return await awaitable
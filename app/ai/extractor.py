@@ -0,0 +1,258 @@
+import codecs
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+# Elements that never hold article text
+SKIP_TAGS = {
+    "head", "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "nav", "header", "footer", "aside", "form", "button", "select", "textarea", "menu", "dialog",
+}
+# Elements whose boundaries separate words even without whitespace in the markup
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "dd", "dt", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article",
+    "main", "blockquote", "pre", "table", "tr", "td", "th", "ul", "ol", "figure", "figcaption", "hr",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# Elements that usually wrap the story itself
+ARTICLE_TAGS = {"article", "main"}
+# Skipped elements whose content is never markup: an <article> can't be found inside them
+OPAQUE_TAGS = {"head", "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+               "button", "select", "textarea"}
+# Words of the class/id names of cookie banners, menus, share bars, related links, ads and the
+# like, matched against the words of each class token ("cookie-consent", "shareBar" -> share, bar).
+# Those of the first set mark boilerplate anywhere in a token, the others only as its last word
+# ("social-share") or as its first word followed by part names ("share-bar", but not "share-price")
+BOILERPLATE_WORDS = {
+    "cookie", "cookies", "consent", "gdpr", "navbar", "breadcrumb", "breadcrumbs", "newsletter", "sidebar",
+    "footer", "masthead", "popup", "paywall", "advert", "advertisement", "sponsored", "sharedaddy",
+}
+BOILERPLATE_HEADS = {
+    "menu", "share", "sharing", "social", "subscribe", "signup", "related", "recommended", "recommendations",
+    "promo", "sponsor", "ad", "ads", "comment", "comments", "modal",
+}
+BOILERPLATE_PARTS = {
+    "bar", "bars", "button", "buttons", "links", "link", "tools", "icons", "box", "widget", "widgets", "container",
+    "wrapper", "wrap", "list", "item", "items", "area", "section", "block", "panel", "toggle", "slot", "unit",
+    "banner", "notice", "overlay", "posts", "stories", "articles", "content", "form", "module", "title",
+}
+# Tokens naming a state of the page rather than a part of it: "has-sidebar", "menu-open", "cookies-not-set"
+STATE_PREFIXES = {"has", "is", "no", "not", "with", "show", "hide"}
+STATE_SUFFIXES = {"open", "opened", "closed", "active", "visible", "hidden", "shown", "enabled", "disabled",
+                  "set", "pending", "accepted", "loaded", "expanded", "collapsed"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog"}
+# The page's root elements hold everything, the story included, whatever their classes say
+ROOT_TAGS = {"html", "body"}
+
+# Below this many characters the <article>/<main> text is probably a teaser, not the story
+MIN_ARTICLE_CHARS = 200
+DEFAULT_MAX_BYTES = 1_000_000
+
+
+@lru_cache(maxsize=4096)
+def is_boilerplate_name(token: str) -> bool:
+    """
+    Whether a class or id token names a boilerplate part of a page.
+
+    Args:
+        token (str): One class name, or an id.
+
+    Returns:
+        bool: True for names like "cookie-consent", "share-bar" or "site-footer", False for
+            names like "article-banner", "share-price" or states like "has-sidebar".
+    """
+    words = re.findall(r"[a-z0-9]+", re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", token).lower())
+    if not words or words[0] in STATE_PREFIXES or words[-1] in STATE_SUFFIXES:
+        return False
+    if any(word in BOILERPLATE_WORDS for word in words):
+        return True
+    if words[-1] in BOILERPLATE_HEADS:
+        return True
+    return words[0] in BOILERPLATE_HEADS and all(word in BOILERPLATE_PARTS or word in BOILERPLATE_HEADS for word in words[1:])
+
+
+class ArticleExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text extractor for news pages.
+
+    Bytes are fed as they arrive and parsed in a single pass: boilerplate elements (scripts,
+    navigation, footers, cookie banners, share bars, ...) are dropped as they are opened and
+    whitespace is collapsed while the text is collected, so no clean-up pass over the whole
+    string is needed. Input past `max_bytes` is ignored, and the extractor is `done` once
+    that much was read or the article has `max_chars` of text. The text inside
+    <article>/<main> is returned when there is enough of it, the text of the whole page
+    otherwise.
+    """
+
+    def __init__(self, encoding: str | None = None, max_bytes: int = DEFAULT_MAX_BYTES, max_chars: int | None = None):
+        super().__init__(convert_charrefs=True)
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.bytes_read = 0
+        self.article_chars = 0
+        self._decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        self._stack: list[str] = []
+        self._skip_depth: int | None = None
+        self._skip_tag: str | None = None
+        self._article_depth: int | None = None
+        self._page_parts: list[str] = []
+        self._article_parts: list[str] = []
+        self._page_space = False
+        self._article_space = False
+
+    @property
+    def exhausted(self) -> bool:
+        return self.bytes_read >= self.max_bytes
+
+    @property
+    def done(self) -> bool:
+        return self.exhausted or (self.max_chars is not None and self.article_chars >= self.max_chars)
+
+    def feed_bytes(self, chunk: bytes):
+        if self.exhausted:
+            return
+        chunk = chunk[:self.max_bytes - self.bytes_read]
+        self.bytes_read += len(chunk)
+        self.feed(self._decoder.decode(chunk, final=self.exhausted))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag in BLOCK_TAGS:
+                self._break()
+            return
+        self._stack.append(tag)
+        is_article = tag in ARTICLE_TAGS or ("itemprop", "articleBody") in attrs or ("role", "main") in attrs
+        if self._skip_depth is not None and is_article and self._contains_the_story(tag):
+            # Whatever holds the story isn't boilerplate (a layout wrapper named "has-sidebar"
+            # or an ASP.NET page's <form>): collect from here on
+            self._skip_depth = self._skip_tag = None
+        if self._skip_depth is None and self._is_boilerplate(tag, attrs):
+            self._skip_depth = len(self._stack)
+            self._skip_tag = tag
+        elif self._skip_depth is None and self._article_depth is None and is_article:
+            self._article_depth = len(self._stack)
+        if tag in BLOCK_TAGS:
+            self._break()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag not in self._stack:
+            # Stray closing tag in malformed markup
+            return
+        # Close the tag and whatever was left open inside it
+        while self._stack:
+            depth = len(self._stack)
+            if self._skip_depth == depth:
+                self._skip_depth = self._skip_tag = None
+            if self._article_depth == depth:
+                self._article_depth = None
+            if self._stack.pop() == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self._break()
+
+    def handle_data(self, data):
+        if self._skip_depth is not None:
+            return
+        words = data.split()
+        if not words:
+            self._page_space = self._article_space = True
+            return
+        text = " ".join(words)
+        leading_space = data[0].isspace()
+        trailing_space = data[-1].isspace()
+        self._page_space = self._append(self._page_parts, text, self._page_space or leading_space, trailing_space)
+        if self._article_depth is not None:
+            self._article_space = self._append(self._article_parts, text, self._article_space or leading_space, trailing_space)
+            self.article_chars += len(text) + 1
+
+    @staticmethod
+    def _append(parts: list[str], text: str, space_before: bool, space_after: bool) -> bool:
+        if parts and space_before:
+            parts.append(" ")
+        parts.append(text)
+        return space_after
+
+    def _break(self):
+        self._page_space = True
+        if self._article_depth is not None:
+            self._article_space = True
+
+    def _contains_the_story(self, tag: str) -> bool:
+        # <main> is the page's main content; of <article>s only the first one is taken as the
+        # story, later ones inside boilerplate are teasers of related stories
+        if self._skip_tag in OPAQUE_TAGS:
+            return False
+        return tag != "article" or not self._article_parts
+
+    def _is_boilerplate(self, tag: str, attrs: list[tuple[str, str | None]]) -> bool:
+        if tag in ROOT_TAGS:
+            return False
+        if tag == "header" and self._article_depth is not None:
+            # The header of the article itself holds the headline
+            return False
+        if tag in SKIP_TAGS:
+            return True
+        for name, value in attrs:
+            if not value:
+                continue
+            if name in ("class", "id") and any(is_boilerplate_name(token) for token in value.split()):
+                return True
+            if name == "role" and value in BOILERPLATE_ROLES:
+                return True
+            if name == "aria-hidden" and value == "true":
+                return True
+        return False
+
+    def text(self) -> str:
+        self.close()
+        article = "".join(self._article_parts)
+        if len(article) >= MIN_ARTICLE_CHARS:
+            return article
+        return "".join(self._page_parts)
+
+
+def create_extractor(encoding: str | None = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                     max_chars: int | None = None) -> ArticleExtractor:
+    """
+    Create an ArticleExtractor for a page, reading it as UTF-8 when its charset is unknown.
+
+    Args:
+        encoding (str | None): The charset of the page.
+        max_bytes (int): The number of bytes of HTML to parse at most.
+        max_chars (int | None): The article text after which the extractor is done.
+
+    Returns:
+        ArticleExtractor: The extractor the page's bytes are fed to.
+    """
+    try:
+        return ArticleExtractor(encoding, max_bytes, max_chars)
+    except LookupError:
+        return ArticleExtractor(None, max_bytes, max_chars)
+
+
+def extract_article_text(body: bytes, encoding: str | None = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                         chunk_size: int = 16384) -> str:
+    """
+    Extract the main article text of an HTML page already in memory.
+
+    Downloads feed their chunks to an extractor from create_extractor as they arrive instead.
+
+    Args:
+        body (bytes): The HTML of the page.
+        encoding (str | None): The charset of the page, UTF-8 when unknown.
+        max_bytes (int): The number of bytes of HTML to parse at most.
+        chunk_size (int): The size of the chunks fed to the parser.
+
+    Returns:
+        str: The article text with collapsed whitespace.
+    """
+    extractor = create_extractor(encoding, max_bytes)
+    for start in range(0, len(body), chunk_size):
+        extractor.feed_bytes(body[start:start + chunk_size])
+        if extractor.done:
+            break
+    return extractor.text()
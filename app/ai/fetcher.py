@@ -0,0 +1,180 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Callable
+from urllib.parse import urlsplit
+import httpx
+from app import config
+from app.ai.admission import Overloaded, get_gate
+from app.metrics import fetch_bytes, fetch_errors
+
+# Content types that never contain article text worth scraping
+BLOCKED_CONTENT_TYPES = ("application/pdf", "application/zip", "application/octet-stream", "video/", "audio/", "image/")
+
+USER_AGENT = "Mozilla/5.0 (compatible; HeadlineAI/1.0)"
+
+
+class FetchError(Exception):
+    """Raised when a page can't be fetched within the fetcher's limits."""
+
+
+@dataclass
+class FetchedPage:
+    url: str
+    status_code: int
+    content_type: str
+    encoding: str | None
+    body: bytes
+    truncated: bool = False
+    etag: str | None = None
+    last_modified: str | None = None
+    # The bytes downloaded, and what consumed them when the body went to a consumer instead
+    size: int | None = None
+    consumer: Any = None
+
+    def __post_init__(self):
+        if self.size is None:
+            self.size = len(self.body)
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding or "utf-8", errors="replace")
+
+
+class PageFetcher:
+    """
+    Shared, bounded HTTP client for downloading news pages.
+
+    A single httpx.AsyncClient is reused for every URL so connections are pooled and kept
+    alive between requests. Every fetch is bounded by connect/read timeouts, an overall
+    deadline, a per-host connection limit and a maximum body size, and pages whose content
+    type can't hold an article (PDFs, video, ...) are skipped before their body is read.
+    Downloads also take a slot of the process-wide "fetch" admission gate.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = config.FETCH_MAX_CONNECTIONS,
+        max_connections_per_host: int = config.FETCH_MAX_CONNECTIONS_PER_HOST,
+        connect_timeout: float = config.FETCH_CONNECT_TIMEOUT,
+        read_timeout: float = config.FETCH_READ_TIMEOUT,
+        total_timeout: float = config.FETCH_TOTAL_TIMEOUT,
+        max_body_bytes: int = config.FETCH_MAX_BODY_BYTES,
+    ):
+        self.max_connections_per_host = max_connections_per_host
+        self.total_timeout = total_timeout
+        self.max_body_bytes = max_body_bytes
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        )
+        # host -> [semaphore, number of fetches holding or waiting for it]
+        self._hosts: dict[str, list] = {}
+
+    async def fetch(self, url: str, headers: dict | None = None,
+                    consume: Callable[[str | None], Any] | None = None) -> FetchedPage:
+        """
+        Download a page within the fetcher's limits.
+
+        Args:
+            url (str): The URL of the page.
+            headers (dict | None): Extra request headers.
+            consume (Callable[[str | None], Any] | None): Called with the page's charset once
+                its headers have arrived, returns a consumer the body is fed to chunk by chunk
+                instead of being buffered: an object with a feed_bytes(chunk) method and a
+                `done` property, e.g. an ArticleExtractor. The download stops once it is done.
+
+        Returns:
+            FetchedPage: The page; its body is cut at max_body_bytes (truncated=True). With a
+                consumer the body is empty and the page holds the consumer instead.
+
+        Raises:
+            FetchError: On network errors, timeouts, error statuses and blocked content types,
+                and when too many downloads are already waiting.
+        """
+        host = urlsplit(url).netloc
+        entry = self._hosts.setdefault(host, [asyncio.Semaphore(self.max_connections_per_host), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], get_gate("fetch").slot():
+                async with asyncio.timeout(self.total_timeout):
+                    return await self._fetch(url, headers, consume)
+        except FetchError:
+            fetch_errors.inc()
+            raise
+        except Overloaded as e:
+            fetch_errors.inc()
+            raise FetchError(f"Not fetching {url}: {e}") from e
+        except TimeoutError as e:
+            fetch_errors.inc()
+            raise FetchError(f"Fetching {url} took longer than {self.total_timeout}s") from e
+        except httpx.HTTPError as e:
+            fetch_errors.inc()
+            raise FetchError(f"Fetching {url} failed: {e!r}") from e
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._hosts[host]
+
+    async def _fetch(self, url: str, headers: dict | None, consume: Callable[[str | None], Any] | None) -> FetchedPage:
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.is_error:
+                raise FetchError(f"Fetching {url} returned status {response.status_code}")
+
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type.startswith(BLOCKED_CONTENT_TYPES):
+                raise FetchError(f"Skipping {url} with content type {content_type}")
+
+            consumer = consume(response.charset_encoding) if consume and response.status_code != 304 else None
+            body = bytearray()
+            size = 0
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                if size + len(chunk) > self.max_body_bytes:
+                    truncated = True
+                    chunk = chunk[:self.max_body_bytes - size]
+                size += len(chunk)
+                if consumer is None:
+                    body.extend(chunk)
+                else:
+                    consumer.feed_bytes(chunk)
+                    # The rest of the page isn't needed, e.g. the extractor has the article
+                    truncated = truncated or consumer.done
+                if truncated:
+                    break
+            fetch_bytes.inc(amount=size)
+
+            return FetchedPage(
+                url=str(response.url),
+                status_code=response.status_code,
+                content_type=content_type,
+                encoding=response.charset_encoding,
+                body=bytes(body),
+                truncated=truncated,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+                size=size,
+                consumer=consumer,
+            )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_fetcher: PageFetcher | None = None
+
+
+def get_fetcher() -> PageFetcher:
+    # The fetcher is created lazily so its client binds to the running event loop
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = PageFetcher()
+    return _fetcher
+
+
+async def close_fetcher():
+    global _fetcher
+    if _fetcher is not None:
+        await _fetcher.aclose()
+        _fetcher = None
@@ -1,9 +1,156 @@
+import time
+from dataclasses import dataclass
+from typing import Any
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import ensure_config
 from langchain_openai import ChatOpenAI
 from app import config
-llm = ChatOpenAI(
-      model="gpt-4o",
-      temperature=0.7,
-      max_tokens=None,
-      timeout=None,
-      max_retries=2,
-      api_key=config.OPENAI_API_KEY)
\ No newline at end of file
+from app.ai.llm_cache import get_llm_response_cache
+from app.ai.admission import get_gate
+from app.metrics import llm_tokens
+
+
+@dataclass(frozen=True)
+class ModelSettings:
+    model: str
+    temperature: float
+    max_tokens: int | None
+    timeout: float | None
+
+
+# The model each graph node calls; "assistant" writes the answers, "classifier" labels
+# queries as single/multiple when the local rules aren't confident
+MODEL_SETTINGS = {
+    "assistant": ModelSettings(
+        config.ASSISTANT_MODEL, config.ASSISTANT_TEMPERATURE, config.ASSISTANT_MAX_TOKENS, config.ASSISTANT_TIMEOUT
+    ),
+    "classifier": ModelSettings(
+        config.CLASSIFIER_MODEL, config.CLASSIFIER_TEMPERATURE, config.CLASSIFIER_MAX_TOKENS, config.CLASSIFIER_TIMEOUT
+    ),
+}
+
+
+@dataclass
+class NodeLatency:
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "average_seconds": round(self.total_seconds / self.calls, 4) if self.calls else 0.0,
+            "max_seconds": round(self.max_seconds, 4),
+        }
+
+
+class LatencyCallback(BaseCallbackHandler):
+    """Times every call of a node's model, cache hits included."""
+
+    # Only bookkeeping, so it runs on the event loop instead of a thread
+    run_inline = True
+
+    def __init__(self, latency: NodeLatency):
+        self.latency = latency
+        self._started: dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        self._record(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self.latency.errors += 1
+        self._record(run_id)
+
+    def _record(self, run_id: UUID):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        self.latency.calls += 1
+        self.latency.total_seconds += elapsed
+        self.latency.max_seconds = max(self.latency.max_seconds, elapsed)
+
+
+def record_usage(run_manager: Any, model: str, usage: dict | None):
+    if not usage:
+        return
+    # The graph node making the call is in the run's metadata; streamed calls get no
+    # run_manager, but run inside the node's config
+    metadata = run_manager.metadata if run_manager else ensure_config().get("metadata", {})
+    node = metadata.get("langgraph_node", "unknown")
+    llm_tokens.inc(node, model, "prompt", amount=usage.get("input_tokens", 0))
+    llm_tokens.inc(node, model, "completion", amount=usage.get("output_tokens", 0))
+
+
+class AdmittedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose requests go through the "openai" admission gate.
+
+    Only the requests that reach OpenAI take a slot: cache hits are answered before these
+    methods run. The client's retries happen inside the slot, so they don't add concurrency.
+    The token usage of these requests is counted in llm_tokens_total.
+    """
+
+    async def _agenerate(self, messages: list, stop: list | None = None, run_manager: Any = None, **kwargs: Any):
+        if self.streaming:
+            # Delegates to _astream, which takes the slot itself
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        async with get_gate("openai").slot():
+            result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        for generation in result.generations:
+            record_usage(run_manager, self.model_name, generation.message.usage_metadata)
+        return result
+
+    async def _astream(self, messages: list, stop: list | None = None, run_manager: Any = None, **kwargs: Any):
+        # The slot is held until the last chunk has arrived
+        async with get_gate("openai").slot():
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                # With stream_usage the last chunk reports the usage of the whole call
+                record_usage(run_manager, self.model_name, chunk.message.usage_metadata)
+                yield chunk
+
+
+node_latency = {node: NodeLatency() for node in MODEL_SETTINGS}
+_models: dict[str, ChatOpenAI] = {}
+
+
+def get_llm(node: str) -> ChatOpenAI:
+    """
+    Return the chat model configured for a graph node.
+
+    Args:
+        node (str): The name of the node, a key of MODEL_SETTINGS.
+
+    Returns:
+        ChatOpenAI: The node's model, created on first use and shared afterwards.
+    """
+    if node not in _models:
+        settings = MODEL_SETTINGS[node]
+        _models[node] = AdmittedChatOpenAI(
+            model=settings.model,
+            temperature=settings.temperature,
+            max_tokens=settings.max_tokens,
+            timeout=settings.timeout,
+            max_retries=2,
+            # Also report the token usage of streamed answers
+            stream_usage=True,
+            api_key=config.OPENAI_API_KEY,
+            base_url=config.OPENAI_BASE_URL,
+            # Identical prompts within LLM_CACHE_TTL_SECONDS are answered without calling OpenAI
+            cache=get_llm_response_cache() if config.LLM_CACHE_ENABLED else False,
+            callbacks=[LatencyCallback(node_latency[node])],
+        )
+    return _models[node]
+
+
+def latency_stats() -> dict:
+    return {
+        node: {"model": MODEL_SETTINGS[node].model, **latency.as_dict()}
+        for node, latency in node_latency.items()
+    }
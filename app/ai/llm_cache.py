@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Optional, Sequence
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from app import config
+from app.ai.cache import CacheStats, SQLiteCacheStore, TTLCache
+
+
+def without_message_ids(prompt: str) -> str:
+    # Every message of the graph state gets a random id, which would make every prompt unique
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    for message in messages:
+        if isinstance(message, dict) and isinstance(message.get("kwargs"), dict):
+            message["kwargs"].pop("id", None)
+    return json.dumps(messages, sort_keys=True)
+
+
+def make_key(prompt: str, llm_string: str) -> str:
+    # llm_string holds the model, its parameters and the bound tools; prompt the serialized messages
+    return hashlib.sha256(f"{llm_string}\0{without_message_ids(prompt)}".encode()).hexdigest()
+
+
+def fresh_copies(generations: Sequence[Generation]) -> list[Generation]:
+    # Every hit gets its own message objects without the original message ids, so answers
+    # replayed into the same conversation don't replace the earlier ones in the graph state
+    copies = [generation.model_copy(deep=True) for generation in generations]
+    for generation in copies:
+        if hasattr(generation, "message"):
+            generation.message.id = None
+    return copies
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Exact-match cache of chat model responses.
+
+    Responses are keyed on a hash of the model, its parameters (including bound tools) and
+    the prompt messages, so only byte-identical requests are served from the cache. Entries
+    expire `ttl` seconds after they were stored and live in an in-memory LRU tier and, when
+    `sqlite_path` is set, in an on-disk SQLite tier shared by the workers of a host.
+    """
+
+    def __init__(
+        self,
+        ttl: float = config.LLM_CACHE_TTL_SECONDS,
+        max_entries: int = config.LLM_CACHE_MAX_ENTRIES,
+        sqlite_path: str = config.LLM_CACHE_SQLITE_PATH,
+    ):
+        self.stats = CacheStats()
+        self.memory = TTLCache(max_entries, ttl, stats=self.stats)
+        self.disk = SQLiteCacheStore(sqlite_path, "llm_cache", ttl) if sqlite_path else None
+        if self.disk:
+            self.disk.prune()
+
+    def _from_disk(self, key: str, stored: tuple[float, Any] | None) -> Optional[list[Generation]]:
+        if stored is None:
+            return None
+        generations = [loads(generation) for generation in stored[1]]
+        self.memory.set(key, generations, stored_at=stored[0])
+        return generations
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = make_key(prompt, llm_string)
+        generations = self.memory.get(key)
+        if generations is None and self.disk:
+            generations = self._from_disk(key, self.disk.get(key))
+        return fresh_copies(generations) if generations is not None else None
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = make_key(prompt, llm_string)
+        generations = self.memory.get(key)
+        if generations is None and self.disk:
+            generations = self._from_disk(key, await asyncio.to_thread(self.disk.get, key))
+        return fresh_copies(generations) if generations is not None else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = make_key(prompt, llm_string)
+        generations = fresh_copies(return_val)
+        self.memory.set(key, generations)
+        if self.disk:
+            self.disk.set(key, [dumps(generation) for generation in generations])
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = make_key(prompt, llm_string)
+        generations = fresh_copies(return_val)
+        self.memory.set(key, generations)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, [dumps(generation) for generation in generations])
+
+    def clear(self, **kwargs: Any) -> None:
+        self.memory = TTLCache(self.memory.max_entries, self.memory.ttl, stats=self.stats)
+
+    def stats_dict(self) -> dict:
+        stats = self.stats.as_dict()
+        stats["entries"] = len(self.memory)
+        if self.disk:
+            stats["disk"] = self.disk.stats.as_dict()
+        return stats
+
+
+_llm_cache: LLMResponseCache | None = None
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache()
+    return _llm_cache
@@ -1,23 +1,108 @@
-import requests
+import asyncio
 from langgraph.graph import MessagesState
-from langchain_core.messages import  HumanMessage, SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import  AIMessage, HumanMessage, SystemMessage, ToolCall, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import START, StateGraph, END
 from langgraph.prebuilt import tools_condition, ToolNode
+from langgraph.prebuilt.tool_node import TOOL_CALL_ERROR_TEMPLATE
 from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import MessagesState
-import requests
 import os
-from datetime import datetime
 from app.ai.sub_agent import compile_sub_agent
-from app.ai.tools import SubState, format_ai_response, llm
+from app.ai.checkpointer import create_checkpointer, trim_messages_tail
+from app.db import engine
+from app.history_handlers import recent_messages_query
+from app import config
+from sqlmodel import Session
+from app.ai.tools import SubState, format_ai_response
+from app.ai.llm import get_llm
+from app.ai.prompts import assistant_system_messages
+from app.ai.deadline import deadline, within_budget
+from app.ai.admission import Overloaded
+from app.ai.turn import new_turn, turn_stats
+from app.metrics import node_metrics
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Messages of the conversation the assistant sees, more when the current question's tool
+# calls need them (see trim_messages_tail)
+ASSISTANT_CONTEXT_MESSAGES = 6
+
+def rebuild_messages(thread_id: str) -> list:
+    """
+    Rebuild the messages of a conversation whose checkpoint was evicted or pruned.
+
+    Args:
+        thread_id (str): The conversation_id of the conversation.
+
+    Returns:
+        list: The last CHECKPOINT_MESSAGE_TAIL messages of the conversation's history.
+    """
+    with Session(engine) as session:
+        # Called from the checkpointer's threads, so this one reads through the sync engine
+        messages = reversed(session.exec(recent_messages_query(thread_id, config.CHECKPOINT_MESSAGE_TAIL)).all())
+    return [
+        HumanMessage(content=message.content) if message.role == "human" else AIMessage(content=message.content)
+        for message in messages
+    ]
+
+def tool_rounds(messages: list) -> int:
+    """
+    Count the tool-calling turns of the assistant since the user's last message.
+
+    Args:
+        messages (list): The messages of the conversation.
+
+    Returns:
+        int: The number of assistant messages with tool calls after the last HumanMessage.
+    """
+    rounds = 0
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, AIMessage) and message.tool_calls:
+            rounds += 1
+    return rounds
+
+class AssistantToolNode(ToolNode):
+    """
+    ToolNode that fails the run when a provider is overloaded.
+
+    Like ToolNode's own error handling, a failed tool call (invalid arguments, the search
+    running out of time, ...) goes back to the assistant as an error message, so it answers
+    without those articles. Overloaded is raised instead: the request gets its 503 rather
+    than the assistant searching again into the same full queue.
+    """
+
+    def __init__(self, tools: list):
+        # The pinned langgraph only takes a bool for handle_tool_errors, so errors are
+        # handled here
+        super().__init__(tools, handle_tool_errors=False)
+
+    @staticmethod
+    def _error_message(call: ToolCall, error: Exception) -> ToolMessage:
+        return ToolMessage(TOOL_CALL_ERROR_TEMPLATE.format(error=repr(error)), name=call["name"], tool_call_id=call["id"])
+
+    async def _arun_one(self, call: ToolCall, config: RunnableConfig) -> ToolMessage:
+        try:
+            return await super()._arun_one(call, config)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return self._error_message(call, e)
+
+    def _run_one(self, call: ToolCall, config: RunnableConfig) -> ToolMessage:
+        try:
+            return super()._run_one(call, config)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return self._error_message(call, e)
+
 def compile_main_agent(compiled_sub_agent):
-    def fetch_news(query:str) ->str:
+    async def fetch_news(query:str) ->str:
         """
             Perform a search for news articles based on the user's query.
 
@@ -41,59 +126,45 @@ def compile_main_agent(compiled_sub_agent):
             scrapped_news = [],
             final_news = []
         )
-        messages = compiled_sub_agent.invoke(initial_state)
+        # Keep part of the request's time for writing the answer
+        messages = await within_budget(compiled_sub_agent.ainvoke(initial_state), reserve=config.ANSWER_RESERVE_SECONDS)
         return messages['final_news']
 
-    today = datetime.today()
-    date = today.strftime("%B %d, %Y")
-
-    sys_msg = SystemMessage(content=f"""
-    You are a news assistant, tasked with helping users find the most relevant news articles, whether they are recent or from the past, based on their queries. You will respond with the clarity and precision of a seasoned news reporter, maintaining an engaging and authoritative tone.
-
-    ### Responsibilities:
-    - **Fetch News Articles**: Utilize the **fetch_news** tool to conduct a web search for up to 5 articles related to the user's query. Construct the search query thoughtfully. If the user asks for the latest news, include today's date {date} in your search to ensure the results are timely. Always refine the query by adding additional context or keywords to enhance clarity and maximize the relevance of the articles retrieved. This tool will return the following for each article:
-    - **URL**: Direct link to the article.
-    - **Content**: A brief snippet of the article's main idea.
-    - **Details**: Comprehensive information, including full article content, images, and additional context when available.
-
-    ### Structure of News:
-    - **Titles**: Extract or generate clear, concise titles for each article.
-    - **Details**: Present the full content of the articles without omitting any information, including key facts, images, and additional relevant details.
-    - **Source URL**: Clearly link to the article's source for easy access.
-
-    ### Best Practices:
-    - Organize responses using structured headings and bullet points for clarity.
-    - Ensure all articles are well-formatted and complete, providing users with a thorough understanding of the topic. Don't miss any information. 
-    - Maintain an informative and neutral tone throughout your responses.
-    - If the first attempt does not yield sufficient details, refine the search and scrape for additional information.
-    Always leverage the **fetch_news** tool to provide users with detailed, up-to-date news articles tailored to their interests. Do not claim a lack of access to real-time news; consistently utilize the **fetch_news** tool.
-    """)
-
-
     # Define the LLM with tools
     tools = [fetch_news]
-    llm_with_tools = llm.bind_tools(tools)
+    llm_with_tools = get_llm("assistant").bind_tools(tools)
+    # Keeps the tool definitions the earlier tool messages refer to, but can't call them
+    llm_answer_only = get_llm("assistant").bind_tools(tools, tool_choice="none")
 
     # Node definition
-    def assistant(state: MessagesState):
-        return {"messages": [llm_with_tools.invoke([sys_msg] + state["messages"][-6:])]}
+    async def assistant(state: MessagesState):
+        # After MAX_TOOL_ROUNDS rounds of searches the model has to answer with what it has
+        model = llm_with_tools
+        if tool_rounds(state["messages"]) >= config.MAX_TOOL_ROUNDS:
+            turn_stats.tool_round_caps += 1
+            model = llm_answer_only
+        # The system messages are built once per day, so the date stays current without
+        # recompiling and the long instructions stay byte-identical for OpenAI's prompt cache
+        context = trim_messages_tail(state["messages"], ASSISTANT_CONTEXT_MESSAGES)
+        return {"messages": [await within_budget(model.ainvoke(assistant_system_messages() + context))]}
 
     builder = StateGraph(MessagesState)
 
 
     builder.add_node("assistant", assistant)
-    builder.add_node("tools", ToolNode(tools))
+    builder.add_node("tools", AssistantToolNode(tools))
 
     builder.add_edge(START, "assistant")
     builder.add_conditional_edges("assistant", tools_condition)
     builder.add_edge("tools", "assistant")
 
-    memory = MemorySaver()
-    main_agent = builder.compile(checkpointer=memory)
+    # Conversation state lives in the database so any worker can continue any conversation
+    checkpointer = create_checkpointer(engine, rebuild=rebuild_messages)
+    main_agent = builder.compile(checkpointer=checkpointer)
     return main_agent
 
 
-def call_main_agent(query: str, thread_id: str, main_agent):
+async def call_main_agent(query: str, thread_id: str, main_agent, timeout: float | None = config.AGENT_REQUEST_TIMEOUT_SECONDS):
     """
     Function to fetch detailed news articles based on the user's query
     and a thread ID for tracking purposes.
@@ -101,18 +172,91 @@ def call_main_agent(query: str, thread_id: str, main_agent):
     Args:
         query (str): The search query provided by the user.
         thread_id (str): The ID of the thread for maintaining conversation context.
+        timeout (float | None): The deadline of the whole run in seconds; every stage gets
+            its budget from what remains of it.
+    
+    Raises:
+        TimeoutError: When the run doesn't complete in time; in-flight calls are cancelled.
     
     Returns:
         None: The function will print out the messages with detailed articles.
     """
-    config = {"configurable": {"thread_id": thread_id}}
+    # node_metrics times every node of the run, the sub agent's included
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [node_metrics]}
     
     # Create a HumanMessage using the query input
     messages = [HumanMessage(content=f"{query}")]
     
     # Call the agent with the messages and thread-specific config
-    response = main_agent.invoke({"messages": messages}, config)
+    # The fetch_news calls of the run share their page loads and returned articles
+    with new_turn():
+        response = await within_budget(main_agent.ainvoke({"messages": messages}, config), limit=timeout)
+    # Make the new state visible to the other workers before answering
+    await main_agent.checkpointer.aflush()
 
     formatted_response = format_ai_response(response)  
     
-    return formatted_response
\ No newline at end of file
+    return formatted_response
+
+async def stream_main_agent(query: str, thread_id: str, main_agent, timeout: float | None = config.AGENT_REQUEST_TIMEOUT_SECONDS):
+    """
+    Streaming variant of call_main_agent built on the graph's event stream.
+
+    Args:
+        query (str): The search query provided by the user.
+        thread_id (str): The ID of the thread for maintaining conversation context.
+        timeout (float | None): The deadline of the whole run in seconds; every stage gets
+            its budget from what remains of it.
+
+    Yields:
+        dict: Events with an "event" name and a "data" payload:
+            - "progress": a stage of the news search, e.g. {"stage": "searching"} or
+              {"stage": "loading", "pages": 3}.
+            - "token": a chunk of the assistant's answer as it is generated.
+            - "done": the formatted response, the same as call_main_agent returns.
+
+    Raises:
+        TimeoutError: When the run doesn't complete in time; in-flight calls are cancelled.
+    """
+    # node_metrics times every node of the run, the sub agent's included
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [node_metrics]}
+    messages = [HumanMessage(content=f"{query}")]
+
+    streamed = False
+    events = main_agent.astream_events({"messages": messages}, config, version="v2")
+    # The whole run, the final answer's generation included, ends at the deadline; a timeout
+    # here can't span the yields, so every step of the stream is bounded by it
+    ends_at = None if timeout is None else asyncio.get_running_loop().time() + timeout
+
+    async def next_event():
+        async with asyncio.timeout_at(ends_at):
+            return await anext(events, None)
+
+    with deadline(timeout), new_turn():
+        # The first step of the stream starts the graph's task, which inherits the deadline
+        # and the turn
+        event = await next_event()
+    while event is not None:
+        kind = event["event"]
+        if kind == "on_custom_event" and event["name"] == "progress":
+            yield {"event": "progress", "data": event["data"]}
+        elif kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "assistant":
+            content = event["data"]["chunk"].content
+            if content:
+                streamed = True
+                yield {"event": "token", "data": {"content": content}}
+        elif kind == "on_chat_model_start" and event["metadata"].get("langgraph_node") == "assistant":
+            # Only the last assistant turn is the answer; earlier turns may be tool calls
+            streamed = False
+        event = await next_event()
+
+    # Make the new state visible to the other workers before answering
+    await main_agent.checkpointer.aflush()
+    state = await main_agent.aget_state(config)
+    formatted_response = format_ai_response(state.values)
+
+    # Responses that were not streamed token by token (e.g. served from a cache) are sent whole
+    if not streamed and formatted_response["messages"]:
+        yield {"event": "token", "data": {"content": formatted_response["messages"][-1]["content"]}}
+
+    yield {"event": "done", "data": formatted_response}
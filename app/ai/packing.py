@@ -0,0 +1,152 @@
+import re
+from dataclasses import asdict, dataclass
+
+# A sentence ends with . ! or ? followed by a capitalised word, a digit or a quote
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"'”’)]?\s+(?=[A-Z0-9\"'“‘(])")
+WORD = re.compile(r"\w+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "me", "news", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "with",
+    "about", "latest", "today", "tell", "give", "show",
+}
+# Share of an article's budget always spent on its opening sentences
+LEAD_SHARE = 0.5
+# Tokens of the url/content fields and JSON punctuation around each article
+ARTICLE_OVERHEAD_TOKENS = 40
+
+
+@dataclass
+class PackingStats:
+    articles: int = 0
+    trimmed: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["tokens_saved"] = self.tokens_in - self.tokens_out
+        return stats
+
+
+packing_stats = PackingStats()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of an English text without a tokenizer.
+
+    GPT tokenizers average about four characters per token on news prose; the word count
+    keeps the estimate honest for texts made of many short words and numbers.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    if not text:
+        return 0
+    return max((len(text) + 3) // 4, len(text.split()))
+
+
+def article_budget(total_budget: int, article_count: int, min_tokens: int, max_tokens: int) -> int:
+    """
+    Split a token budget between the articles of a fetch_news call.
+
+    Args:
+        total_budget (int): The tokens available for all the articles.
+        article_count (int): The number of articles to fit.
+        min_tokens (int): The smallest budget given to an article.
+        max_tokens (int): The largest budget given to an article.
+
+    Returns:
+        int: The number of tokens each article's details may use.
+    """
+    if article_count == 0:
+        return 0
+    share = total_budget // article_count - ARTICLE_OVERHEAD_TOKENS
+    return max(min_tokens, min(max_tokens, share))
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence for sentence in SENTENCE_END.split(text) if sentence]
+
+
+def keywords(text: str) -> set[str]:
+    return {word for word in WORD.findall(text.lower()) if word not in STOP_WORDS and len(word) > 2}
+
+
+def trim_text(text: str, budget: int, query: str = "", snippet: str = "") -> str:
+    """
+    Shorten an article to a token budget by extracting its most useful sentences.
+
+    The lead sentences are kept first, since news stories put the essentials at the top.
+    The rest of the budget goes to the later sentences that share the most words with the
+    query and the search snippet. Selected sentences keep their original order.
+
+    Args:
+        text (str): The article text.
+        budget (int): The number of tokens the result may use.
+        query (str): The user's search query.
+        snippet (str): The search engine's summary of the article.
+
+    Returns:
+        str: The trimmed article, or the article itself when it already fits.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    sentences = split_sentences(text)
+    costs = [estimate_tokens(sentence) for sentence in sentences]
+
+    selected = set()
+    used = 0
+    # Lead paragraph
+    for index, cost in enumerate(costs):
+        if used + cost > budget * LEAD_SHARE:
+            break
+        selected.add(index)
+        used += cost
+
+    # Best matching sentences from the rest of the article
+    terms = keywords(query) | keywords(snippet)
+    ranked = sorted(
+        (index for index in range(len(sentences)) if index not in selected),
+        key=lambda index: (-len(keywords(sentences[index]) & terms), index),
+    )
+    for index in ranked:
+        if used + costs[index] <= budget:
+            selected.add(index)
+            used += costs[index]
+
+    if not selected:
+        # A single sentence longer than the budget: cut it at a word boundary
+        return text[:budget * 4].rsplit(" ", 1)[0]
+    return " ".join(sentences[index] for index in sorted(selected))
+
+
+def pack_articles(articles: list[dict], query: str, total_budget: int, min_tokens: int, max_tokens: int) -> list[dict]:
+    """
+    Fit the details of the articles returned by fetch_news into a token budget.
+
+    Args:
+        articles (list[dict]): Articles with 'url', 'content' and 'details'.
+        query (str): The user's search query.
+        total_budget (int): The tokens available for all the articles.
+        min_tokens (int): The smallest budget given to an article.
+        max_tokens (int): The largest budget given to an article.
+
+    Returns:
+        list[dict]: The articles with their details trimmed to the per-article budget.
+    """
+    budget = article_budget(total_budget, len(articles), min_tokens, max_tokens)
+    packed = []
+    for article in articles:
+        details = article.get('details') or ""
+        trimmed = trim_text(details, budget, query, article.get('content') or "")
+        packing_stats.articles += 1
+        packing_stats.tokens_in += estimate_tokens(details)
+        packing_stats.tokens_out += estimate_tokens(trimmed)
+        if trimmed != details:
+            packing_stats.trimmed += 1
+        packed.append({**article, "details": trimmed})
+    return packed
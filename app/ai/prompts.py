@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from langchain_core.messages import SystemMessage
+from app.ai.packing import estimate_tokens
+
+# The assistant's instructions. They never change while the app runs, so every request starts
+# with the same bytes (after the tool definitions) and OpenAI can serve them from its prompt
+# cache; anything that varies, like the date, goes into the messages that follow.
+ASSISTANT_INSTRUCTIONS = """\
+You are a news assistant, tasked with helping users find the most relevant news articles, whether they are recent or from the past, based on their queries. You will respond with the clarity and precision of a seasoned news reporter, maintaining an engaging and authoritative tone.
+
+### Responsibilities:
+- **Fetch News Articles**: Utilize the **fetch_news** tool to conduct a web search for up to 5 articles related to the user's query. Construct the search query thoughtfully. If the user asks for the latest news, include today's date (given below) in your search to ensure the results are timely. Always refine the query by adding additional context or keywords to enhance clarity and maximize the relevance of the articles retrieved. This tool will return the following for each article:
+- **URL**: Direct link to the article.
+- **Content**: A brief snippet of the article's main idea.
+- **Details**: Comprehensive information, including full article content, images, and additional context when available.
+
+### Structure of News:
+- **Titles**: Extract or generate clear, concise titles for each article.
+- **Details**: Present the full content of the articles without omitting any information, including key facts, images, and additional relevant details.
+- **Source URL**: Clearly link to the article's source for easy access.
+
+### Best Practices:
+- Organize responses using structured headings and bullet points for clarity.
+- Ensure all articles are well-formatted and complete, providing users with a thorough understanding of the topic. Don't miss any information.
+- Maintain an informative and neutral tone throughout your responses.
+- If the first attempt does not yield sufficient details, refine the search and scrape for additional information.
+Always leverage the **fetch_news** tool to provide users with detailed, up-to-date news articles tailored to their interests. Do not claim a lack of access to real-time news; consistently utilize the **fetch_news** tool."""
+
+
+@dataclass(frozen=True)
+class PromptSegment:
+    message: SystemMessage
+    tokens: int  # estimated, see estimate_tokens
+
+
+def segment(text: str) -> PromptSegment:
+    return PromptSegment(SystemMessage(content=text), estimate_tokens(text))
+
+
+ASSISTANT_PREFIX = segment(ASSISTANT_INSTRUCTIONS)
+
+
+@lru_cache(maxsize=4)
+def date_segment(day: date) -> PromptSegment:
+    # Built once per day; a new day gets a new segment without recompiling the graph
+    return segment(f"Today's date is {day.strftime('%B %d, %Y')}.")
+
+
+def assistant_system_messages(day: date | None = None) -> list[SystemMessage]:
+    """
+    The system messages of the assistant: the static instructions, then today's date.
+
+    Args:
+        day (date | None): The date to give the assistant, today by default.
+
+    Returns:
+        list[SystemMessage]: The messages, reused between calls on the same day.
+    """
+    return [ASSISTANT_PREFIX.message, date_segment(day or date.today()).message]
+
+
+def assistant_system_tokens(day: date | None = None) -> int:
+    """Estimated tokens of the assistant's system messages, for prompt budgets."""
+    return ASSISTANT_PREFIX.tokens + date_segment(day or date.today()).tokens
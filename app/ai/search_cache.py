@@ -0,0 +1,93 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from app import config
+from app.ai.cache import CacheStats, TTLCache
+
+
+@dataclass
+class SearchCacheStats(CacheStats):
+    coalesced: int = 0
+    upstream_calls: int = 0
+    upstream_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        stats = super().as_dict()
+        # Every hit or coalesced call is a search we didn't pay for, in quota and in latency
+        average_latency = self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0
+        stats["saved_calls"] = self.hits + self.coalesced
+        stats["average_upstream_seconds"] = round(average_latency, 4)
+        stats["saved_seconds"] = round(stats["saved_calls"] * average_latency, 2)
+        return stats
+
+
+class SearchCache:
+    """
+    Short-lived cache of search results keyed on the normalized query and max_results.
+
+    Concurrent identical searches are de-duplicated (single-flight): the first caller starts
+    the upstream search as a task and every other caller awaits that same task. The task is
+    shielded, so a caller that is cancelled doesn't cancel the search for the others.
+    """
+
+    def __init__(self, ttl: float = config.SEARCH_CACHE_TTL_SECONDS, max_entries: int = config.SEARCH_CACHE_MAX_ENTRIES):
+        self.stats = SearchCacheStats()
+        self.memory = TTLCache(max_entries, ttl, stats=self.stats)
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(query: str, max_results: int) -> str:
+        return f"{max_results}:{' '.join(query.lower().split())}"
+
+    async def search(self, query: str, max_results: int, upstream: Callable[[], Awaitable[list]]) -> list:
+        """
+        Return the results of a search, calling `upstream` only on a cache miss.
+
+        Args:
+            query (str): The search query.
+            max_results (int): The number of results requested.
+            upstream (Callable[[], Awaitable[list]]): Performs the actual search.
+
+        Returns:
+            list: The search results; shared between callers, so they must not be mutated.
+        """
+        key = self.make_key(query, max_results)
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._search_upstream(key, upstream))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.stats.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _search_upstream(self, key: str, upstream: Callable[[], Awaitable[list]]) -> list:
+        started = time.perf_counter()
+        try:
+            results = await upstream()
+        finally:
+            self.stats.upstream_calls += 1
+            self.stats.upstream_seconds += time.perf_counter() - started
+        self.memory.set(key, results)
+        return results
+
+    def stats_dict(self) -> dict:
+        stats = self.stats.as_dict()
+        stats["entries"] = len(self.memory)
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+_search_cache: SearchCache | None = None
+
+
+def get_search_cache() -> SearchCache:
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache()
+    return _search_cache
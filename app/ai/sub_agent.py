@@ -1,6 +1,6 @@
 from langgraph.graph import START, StateGraph, END
 import os
-from app.ai.tools import (SubState, check_single_or_multiple, tavily_search, web_loader, combine_news, continue_to_url_loads)
+from app.ai.tools import (SubState, check_single_or_multiple, tavily_search, web_loader, combine_news, pack_news, continue_to_url_loads)
 from dotenv import load_dotenv
 
 # Load variables from .env file
@@ -20,14 +20,18 @@ def compile_sub_agent() :
     sub_builder.add_node("news_search", tavily_search)
     sub_builder.add_node("web_loader", web_loader)
     sub_builder.add_node("combine_news", combine_news)
+    sub_builder.add_node("pack_news", pack_news)
 
     #Edges
     sub_builder.add_edge(START, "check_single_or_multiple")
     sub_builder.add_edge("check_single_or_multiple", "news_search")
-    sub_builder.add_conditional_edges("news_search", continue_to_url_loads, ["web_loader"])
+    sub_builder.add_conditional_edges("news_search", continue_to_url_loads, ["web_loader", "combine_news"])
     sub_builder.add_edge("web_loader", "combine_news")
-    sub_builder.add_edge("combine_news", END)
-    compiled_sub_agent = sub_builder.compile()
+    sub_builder.add_edge("combine_news", "pack_news")
+    sub_builder.add_edge("pack_news", END)
+    # The sub agent always runs to completion inside one fetch_news call, so its
+    # checkpoints (full of scraped articles) are never resumed and aren't saved
+    compiled_sub_agent = sub_builder.compile(checkpointer=False)
     return compiled_sub_agent
 
 
@@ -1,81 +1,173 @@
 
+import asyncio
 import json
+import logging
+import time
+from dataclasses import asdict, dataclass
 from datetime import datetime
 from typing import TypedDict
-from app.ai.llm import llm
 from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.utilities import tavily_search as tavily_search_utils
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.document_loaders import WebBaseLoader
+from langchain_core.callbacks import adispatch_custom_event
+from langchain_core.runnables import RunnableConfig
+from app.ai.fetcher import FetchedPage, get_fetcher
+from app.ai.article_cache import get_article_cache
+from app.ai.search_cache import get_search_cache
+from app.ai.classifier import classify_query
+from app.ai.extractor import ArticleExtractor, create_extractor, extract_article_text
+from app.ai.packing import pack_articles
+from app.ai.deadline import stage_budget, within_budget
+from app.ai.admission import get_gate
+from app.ai.turn import current_turn, turn_stats
+from app.config import SEARCH_TIMEOUT_SECONDS
 import os
 from typing import Dict, List
 from typing import Annotated
 import operator
 from app import config
 os.environ['TAVILY_API_KEY'] = config.TAVILY_API_KEY
+# The Tavily wrapper reads its endpoint from a module constant
+tavily_search_utils.TAVILY_API_URL = config.TAVILY_API_URL
 from langgraph.constants import Send
 
+logger = logging.getLogger(__name__)
+
 class SubState(TypedDict):
   query: str
   single_or_multiple:str
   tavily_news: List[Dict[str, str]]
-  tavily_urls: List[str]
-  scrapped_news: Annotated[list, operator.add]
+  tavily_urls: List[str]  # URLs whose raw content from Tavily isn't usable and must be scraped
+  scrapped_news: Annotated[list, operator.add]  # {"url": ..., "details": ...} in completion order
   final_news: list[Dict[str, str]]
 
 class UrlState(TypedDict):
   url: str
+  deadline: float  # time.monotonic() after which the page is no longer waited for
 
 class News(TypedDict):
   news:str
 
 
+@dataclass
+class RawContentStats:
+  reused: int = 0
+  scraped: int = 0
+
+  def as_dict(self) -> dict:
+    stats = asdict(self)
+    total = self.reused + self.scraped
+    stats["fetches_avoided_rate"] = round(self.reused / total, 4) if total else 0.0
+    return stats
+
+
+raw_content_stats = RawContentStats()
+
+
+@dataclass
+class ScrapeStats:
+  timed_out: int = 0
+  failed: int = 0
+  snippet_fallbacks: int = 0
+
+  def as_dict(self) -> dict:
+    return asdict(self)
+
+
+scrape_stats = ScrapeStats()
+# Keep references to the loads that outlived their deadline so they can finish filling the cache
+_straggler_tasks: set[asyncio.Task] = set()
+
+
+async def report_progress(config: RunnableConfig, stage: str, **details):
+    """
+    Emit a "progress" custom event for streaming clients (see stream_main_agent).
+
+    Args:
+        config (RunnableConfig): The config of the node reporting the progress.
+        stage (str): The name of the stage, e.g. "searching" or "loading".
+        **details: Extra information about the stage, e.g. the number of pages.
+    """
+    await adispatch_custom_event("progress", {"stage": stage, **details}, config=config)
+
+
+DUPLICATE_DETAILS = "Already returned in full by another fetch_news call for this question."
+
+
 def combine_news(state:SubState) -> list[dict]:
     """
     Combine tavily_news and scrapped_news into a final news list.
 
     Args:
-        tavily_news (list[dict]): List of dictionaries containing 'url' and 'content'.
-        scrapped_news (list[str]): List of scrapped news details corresponding to each URL.
+        tavily_news (list[dict]): List of dictionaries containing 'url', 'content' and 'raw_content'.
+        scrapped_news (list[dict]): List of dictionaries with the 'url' and scrapped 'details'
+            of the URLs that had to be scraped, in any order.
+
+    Articles another fetch_news call of the same turn already returned keep only their
+    snippet, so the assistant doesn't get the same page twice.
 
     Returns:
         list[dict]: A combined list of dictionaries with 'url', 'content', and 'details'.
     """
+    scrapped_details = {news['url']: news['details'] for news in state['scrapped_news']}
     final_news = []
-
-    # Ensure both lists have the same length before combining
-    if len(state['tavily_news']) != len(state['scrapped_news']):
-        raise ValueError("The length of tavily_news and scrapped_news must be the same.")
-
-    # Iterate over both lists and combine them into a single list of dictionaries
-    for i in range(len(state['tavily_news'])):
+    turn = current_turn()
+
+    # Use the scrapped page where there is one, the raw content from Tavily otherwise, and
+    # the search snippet when the page timed out or failed and there is no raw content
+    for news in state['tavily_news']:
+        if turn and not turn.claim(news['url']):
+            # Another fetch_news call of this turn already returned the article in full
+            turn_stats.duplicate_articles += 1
+            final_news.append({"url": news['url'], "content": news['content'], "details": DUPLICATE_DETAILS})
+            continue
+        details = scrapped_details.get(news['url']) or clean_text(news.get('raw_content') or "")
+        if not details:
+            scrape_stats.snippet_fallbacks += 1
+            details = news['content']
         final_news.append({
-            "url": state['tavily_news'][i]['url'],
-            "content": state['tavily_news'][i]['content'],
-            "details": state['scrapped_news'][i]
+            "url": news['url'],
+            "content": news['content'],
+            "details": details
         })
 
     return {"final_news": final_news}
 
 
+def pack_news(state: SubState) -> SubState:
+    """
+    Fit the combined news into the FETCH_NEWS_TOKEN_BUDGET before it reaches the assistant.
+
+    Every article gets an equal share of the budget (within ARTICLE_MIN_TOKENS and
+    ARTICLE_MAX_TOKENS), and longer details are trimmed to their lead and the sentences
+    closest to the query.
+
+    Args:
+        state (SubState): The state with the query and the combined final_news.
+
+    Returns:
+        SubState: The final_news with trimmed details.
+    """
+    final_news = pack_articles(
+        state['final_news'],
+        state['query'],
+        config.FETCH_NEWS_TOKEN_BUDGET,
+        config.ARTICLE_MIN_TOKENS,
+        config.ARTICLE_MAX_TOKENS,
+    )
+    return {"final_news": final_news}
 
 
-def web_loader(state: UrlState) -> list[News]:
+def clean_text(text: str) -> str:
     """
-    Retrieve the full content of a web page, article, or blog post from the given URL.
-    This function uses the WebBaseLoader to fetch and extract the entire content of the web
-    page and returns the cleaned textual content by removing unnecessary spaces and
-    excessive newlines.
+    Collapse the whitespace of a text.
 
     Args:
-        state (UrlState): The state containing the URL of the web page.
+        text (str): The raw text.
 
     Returns:
-        list[News]: A list containing a dictionary with the cleaned text content of the web page.
+        str: The text without unnecessary spaces and excessive newlines.
     """
-    loader = WebBaseLoader(state['url'])
-    data = loader.load()
-    text = data[0].page_content
-
     # Step 1: Replace multiple newlines and tabs with a single space to remove excessive blank spaces
     cleaned_text = text.replace('\n', ' ').replace('\t', ' ')
 
@@ -85,16 +177,123 @@ def web_loader(state: UrlState) -> list[News]:
     # Step 3: Optionally, strip any leading or trailing spaces
     cleaned_text = cleaned_text.strip()
 
-    return {"scrapped_news": [cleaned_text]}
+    return cleaned_text
 
 
-def tavily_search(state: SubState) -> SubState:
+def needs_scraping(news: dict) -> bool:
+    """
+    Check whether the raw content Tavily returned for a search result is missing or truncated.
+
+    Args:
+        news (dict): A search result with 'url', 'content' and 'raw_content'.
+
+    Returns:
+        bool: True when the page has to be scraped to get its full content.
+    """
+    raw_content = (news.get('raw_content') or "").strip()
+    if len(raw_content) < config.RAW_CONTENT_MIN_CHARS:
+        return True
+    return raw_content.endswith(("...", "…", "[truncated]"))
+
+
+def page_extractor(encoding: str | None) -> ArticleExtractor:
+    """
+    Create the extractor a page's body is fed to while it downloads (see PageFetcher.fetch).
+
+    Args:
+        encoding (str | None): The charset of the page.
+
+    Returns:
+        ArticleExtractor: An extractor within the configured byte and character limits.
+    """
+    return create_extractor(encoding, config.EXTRACT_MAX_BYTES, config.EXTRACT_MAX_CHARS)
+
+
+def page_to_text(page: FetchedPage) -> str:
+    """
+    Extract the main article text of a downloaded web page, without navigation, footers,
+    cookie banners and other boilerplate.
+
+    Args:
+        page (FetchedPage): The page downloaded by the PageFetcher.
+
+    Returns:
+        str: The article text without unnecessary spaces and excessive newlines.
+    """
+    if isinstance(page.consumer, ArticleExtractor):
+        # Extracted while it downloaded
+        return page.consumer.text()
+    return extract_article_text(page.body, page.encoding, config.EXTRACT_MAX_BYTES)
+
+
+async def web_loader(state: UrlState) -> list[News]:
+    """
+    Retrieve the full content of a web page, article, or blog post from the given URL.
+    This function looks the URL up in the article cache and otherwise uses the shared
+    PageFetcher to download (or revalidate) the web page over a pooled connection within its
+    time and size limits, and returns the cleaned textual content of the page.
+    Pages that can't be fetched (timeouts, errors, PDFs, videos) yield an empty text, and so
+    do pages still loading at the stage deadline; those keep loading in the background so the
+    article cache has them next time.
+
+    Args:
+        state (UrlState): The state containing the URL of the web page and the stage deadline.
+
+    Returns:
+        list[News]: A list containing a dictionary with the URL and the cleaned text content of the web page.
+    """
+    # A page another fetch_news call of this turn is already loading is loaded only once
+    turn = current_turn()
+    entry = turn.pages.get(state['url']) if turn else None
+    if entry is None:
+        entry = [asyncio.create_task(get_article_cache().load(state['url'], get_fetcher(), page_to_text, consume=page_extractor)), 0]
+        if turn:
+            turn.pages[state['url']] = entry
+    else:
+        turn_stats.shared_loads += 1
+    task = entry[0]
+    entry[1] += 1
+    try:
+        cleaned_text = await asyncio.wait_for(asyncio.shield(task), timeout=max(state['deadline'] - time.monotonic(), 0))
+    except TimeoutError:
+        logger.info("Dropped %s: still loading at the scrape deadline", state['url'])
+        scrape_stats.timed_out += 1
+        if task not in _straggler_tasks:
+            _straggler_tasks.add(task)
+            task.add_done_callback(_finish_straggler)
+        cleaned_text = ""
+    except asyncio.CancelledError:
+        # The request was cancelled (client gone or deadline passed): stop the download too,
+        # unless another call of the turn is still waiting for it
+        if entry[1] == 1:
+            task.cancel()
+        raise
+    except Exception as e:
+        # One broken site must not fail the whole search
+        logger.warning("Failed to load %s: %r", state['url'], e)
+        scrape_stats.failed += 1
+        cleaned_text = ""
+    finally:
+        entry[1] -= 1
+
+    return {"scrapped_news": [{"url": state['url'], "details": cleaned_text}]}
+
+
+def _finish_straggler(task: asyncio.Task):
+    _straggler_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background load failed: %r", task.exception())
+
+
+async def tavily_search(state: SubState, config: RunnableConfig) -> SubState:
     """
     Perform a web search for news articles based on the user's query.
 
     This function utilizes the TavilySearchResults tool to search for news articles
     related to the given query. It retrieves up to 10 results and returns the relevant
     information, including article content, images, and additional context where available.
+    Results are served from the search cache when the same query was made recently, and
+    concurrent identical queries share a single Tavily call.
 
     Args:
         state (State): The state containing the search query input provided by the user.
@@ -116,36 +315,54 @@ def tavily_search(state: SubState) -> SubState:
         include_images=True,
 
     )
-    response = tool.invoke({'query': state['query']})
 
-    urls = [item['url'] for item in response]
+    async def search():
+        # The raw results, unlike the tool's output, keep the raw content of each page
+        async with get_gate("tavily").slot():
+            raw_results = await tool.api_wrapper.raw_results_async(
+                state['query'],
+                tool.max_results,
+                tool.search_depth,
+                tool.include_domains,
+                tool.exclude_domains,
+                tool.include_answer,
+                tool.include_raw_content,
+                tool.include_images,
+            )
+        return [
+            {"url": item['url'], "content": item['content'], "raw_content": item.get('raw_content')}
+            for item in raw_results['results']
+        ]
+
+    await report_progress(config, "searching", query=state['query'])
+    response = await within_budget(get_search_cache().search(state['query'], max_results, search),
+                                   limit=SEARCH_TIMEOUT_SECONDS)
+
+    # Only pages whose raw content is missing or truncated are scraped again, and not the
+    # ones an earlier fetch_news call of this turn already returned
+    turn = current_turn()
+    urls = [
+        item['url'] for item in response
+        if needs_scraping(item) and not (turn and item['url'] in turn.delivered)
+    ]
+    raw_content_stats.reused += len(response) - len(urls)
+    raw_content_stats.scraped += len(urls)
+    await report_progress(config, "loading", pages=len(urls))
 
     return {"tavily_news": response, 'tavily_urls': urls}
 
 
 def continue_to_url_loads(state: SubState):
-    return [Send("web_loader", {"url": u}) for u in state["tavily_urls"]]
-
-
+    # Go straight to combine_news when every result came with usable raw content.
+    # The scrape stage gets SCRAPE_DEADLINE_SECONDS, or what remains of the request's deadline.
+    deadline = time.monotonic() + stage_budget(config.SCRAPE_DEADLINE_SECONDS)
+    return [Send("web_loader", {"url": u, "deadline": deadline}) for u in state["tavily_urls"]] or "combine_news"
 
-def check_single_or_multiple(state: SubState) ->SubState:
-  prompt = """You are an assistant responsible for analyzing user queries about news. Your task is to determine whether the query pertains to a single specific news item or multiple potential news items.
-Respond with only one word: "single" or "multiple", without any additional information.
 
-Here is the user query: {query}
 
-**Examples:**
-1. User Query: "What happened in the latest match between Pakistan and England?"
-   - Response: single
-2. User Query: "Can you give me all the latest updates on climate change?"
-   - Response: multiple
-3. User Query: "Tell me about the recent policy changes in the education sector."
-   - Response: single
-4. User Query: "What are the current headlines in sports and entertainment?"
-   - Response: multiple
-"""
-  formatted_prompt = prompt.format(query = state['query'])
-  response = llm.invoke(formatted_prompt).content.strip()
+async def check_single_or_multiple(state: SubState) ->SubState:
+  # Local keyword rules first; the LLM is only asked when they aren't confident
+  response = await classify_query(state['query'])
   return {"single_or_multiple": response}
 
 
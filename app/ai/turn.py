@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class TurnStats:
+    shared_loads: int = 0
+    duplicate_articles: int = 0
+    tool_round_caps: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+turn_stats = TurnStats()
+
+
+@dataclass
+class Turn:
+    """
+    What the fetch_news calls of one user turn share, so concurrent and follow-up calls
+    don't download or return the same page twice.
+    """
+
+    # url -> [load task, number of web_loader calls waiting for it]
+    pages: dict[str, list] = field(default_factory=dict)
+    # URLs whose article was already returned to the assistant in this turn
+    delivered: set[str] = field(default_factory=set)
+
+    def claim(self, url: str) -> bool:
+        """Mark a URL's article as returned; False when another call already returned it."""
+        if url in self.delivered:
+            return False
+        self.delivered.add(url)
+        return True
+
+
+# Set for the duration of an agent run and copied into its node and tool tasks
+_turn: ContextVar[Turn | None] = ContextVar("agent_turn", default=None)
+
+
+@contextmanager
+def new_turn():
+    """Share page loads and returned articles between the tool calls started in the block."""
+    token = _turn.set(Turn())
+    try:
+        yield
+    finally:
+        _turn.reset(token)
+
+
+def current_turn() -> Turn | None:
+    return _turn.get()
+
@@ -4,7 +4,8 @@ from datetime import datetime, timedelta
 from app import config
 from app.db import get_session
 from app.models.user_models import User
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
@@ -42,9 +43,9 @@ def decode_token(token: str) -> str:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # Get the current logged-in user
-def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)) -> User:
     user_id = decode_token(token)
-    user = session.exec(select(User).where(User.id == user_id)).first()
+    user = (await session.exec(select(User).where(User.id == user_id))).first()
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     return user
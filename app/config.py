@@ -8,8 +8,137 @@ except FileNotFoundError:
 
 # Retrieve configuration values from the environment or .env file
 DATABASE_URL = config("DATABASE_URL", cast=str)
+# URL of the request handlers' async engine; derived from DATABASE_URL when unset
+ASYNC_DATABASE_URL = config("ASYNC_DATABASE_URL", cast=str, default=None)
 JWT_SECRET_KEY = config("JWT_SECRET_KEY", cast=str)
 ALGORITHM = config("ALGORITHM", cast=str, default="HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES", cast=int, default=30)
 OPENAI_API_KEY = config("OPENAI_API_KEY")
-TAVILY_API_KEY = config("TAVILY_API_KEY")
\ No newline at end of file
+TAVILY_API_KEY = config("TAVILY_API_KEY")
+# Endpoints of the providers; benchmarks/loadtest.py points them at local stand-ins
+OPENAI_BASE_URL = config("OPENAI_BASE_URL", cast=str, default=None)
+TAVILY_API_URL = config("TAVILY_API_URL", cast=str, default="https://api.tavily.com")
+
+# Level of the app's own log messages (dropped and failed page loads, failed checkpoint
+# flushes, slow queries, ...); uvicorn's access and error logs are configured by uvicorn
+LOG_LEVEL = config("LOG_LEVEL", cast=str, default="INFO")
+
+# Connection pools. Each worker process has two engines (sync and async), each holding up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections: keep workers * 2 * (size + overflow) below
+# Postgres' max_connections. DB_STATEMENT_TIMEOUT_MS (Postgres only, 0 for none) stops runaway queries
+DB_POOL_SIZE = config("DB_POOL_SIZE", cast=int, default=5)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", cast=int, default=5)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", cast=float, default=10.0)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", cast=int, default=1800)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", cast=bool, default=True)
+DB_STATEMENT_TIMEOUT_MS = config("DB_STATEMENT_TIMEOUT_MS", cast=int, default=15000)
+
+# SQL logging: DB_ECHO prints every statement (for debugging only); statements slower than
+# DB_SLOW_QUERY_SECONDS are counted, and a DB_SLOW_QUERY_SAMPLE_RATE share of them logged
+DB_ECHO = config("DB_ECHO", cast=bool, default=False)
+DB_SLOW_QUERY_SECONDS = config("DB_SLOW_QUERY_SECONDS", cast=float, default=0.5)
+DB_SLOW_QUERY_SAMPLE_RATE = config("DB_SLOW_QUERY_SAMPLE_RATE", cast=float, default=0.1)
+
+# Pages of the history routes: messages or conversations per page when the client doesn't
+# pass ?limit, and the most it may ask for
+HISTORY_PAGE_SIZE = config("HISTORY_PAGE_SIZE", cast=int, default=50)
+HISTORY_MAX_PAGE_SIZE = config("HISTORY_MAX_PAGE_SIZE", cast=int, default=200)
+
+# Model of each agent node: a small, deterministic model is enough for the one-word
+# single/multiple classification, the answers are written by the larger one
+ASSISTANT_MODEL = config("ASSISTANT_MODEL", cast=str, default="gpt-4o")
+ASSISTANT_TEMPERATURE = config("ASSISTANT_TEMPERATURE", cast=float, default=0.7)
+ASSISTANT_MAX_TOKENS = config("ASSISTANT_MAX_TOKENS", cast=int, default=None)
+ASSISTANT_TIMEOUT = config("ASSISTANT_TIMEOUT", cast=float, default=None)
+CLASSIFIER_MODEL = config("CLASSIFIER_MODEL", cast=str, default="gpt-4o-mini")
+CLASSIFIER_TEMPERATURE = config("CLASSIFIER_TEMPERATURE", cast=float, default=0.0)
+CLASSIFIER_MAX_TOKENS = config("CLASSIFIER_MAX_TOKENS", cast=int, default=5)
+CLASSIFIER_TIMEOUT = config("CLASSIFIER_TIMEOUT", cast=float, default=10.0)
+
+# Deadline of an agent run; fetch_news stops early enough to leave ANSWER_RESERVE_SECONDS
+# for the answer, and the Tavily search gets at most SEARCH_TIMEOUT_SECONDS
+AGENT_REQUEST_TIMEOUT_SECONDS = config("AGENT_REQUEST_TIMEOUT_SECONDS", cast=float, default=90.0)
+ANSWER_RESERVE_SECONDS = config("ANSWER_RESERVE_SECONDS", cast=float, default=30.0)
+SEARCH_TIMEOUT_SECONDS = config("SEARCH_TIMEOUT_SECONDS", cast=float, default=15.0)
+
+# Rounds of fetch_news calls the assistant may make per question before it has to answer;
+# the calls of one round run concurrently
+MAX_TOOL_ROUNDS = config("MAX_TOOL_ROUNDS", cast=int, default=3)
+
+# Outbound calls per provider: at most CONCURRENCY at once and RATE per second (bursts of
+# BURST, 0 for no rate limit). Calls over the limit wait in a queue of MAX_QUEUE calls,
+# served in turns between users; when it is full requests get a 503 with Retry-After
+ADMISSION_OPENAI_CONCURRENCY = config("ADMISSION_OPENAI_CONCURRENCY", cast=int, default=16)
+ADMISSION_OPENAI_MAX_QUEUE = config("ADMISSION_OPENAI_MAX_QUEUE", cast=int, default=64)
+ADMISSION_OPENAI_RATE = config("ADMISSION_OPENAI_RATE", cast=float, default=8.0)
+ADMISSION_OPENAI_BURST = config("ADMISSION_OPENAI_BURST", cast=int, default=16)
+ADMISSION_TAVILY_CONCURRENCY = config("ADMISSION_TAVILY_CONCURRENCY", cast=int, default=4)
+ADMISSION_TAVILY_MAX_QUEUE = config("ADMISSION_TAVILY_MAX_QUEUE", cast=int, default=32)
+ADMISSION_TAVILY_RATE = config("ADMISSION_TAVILY_RATE", cast=float, default=1.5)
+ADMISSION_TAVILY_BURST = config("ADMISSION_TAVILY_BURST", cast=int, default=5)
+ADMISSION_FETCH_CONCURRENCY = config("ADMISSION_FETCH_CONCURRENCY", cast=int, default=32)
+ADMISSION_FETCH_MAX_QUEUE = config("ADMISSION_FETCH_MAX_QUEUE", cast=int, default=256)
+ADMISSION_FETCH_RATE = config("ADMISSION_FETCH_RATE", cast=float, default=0.0)
+ADMISSION_FETCH_BURST = config("ADMISSION_FETCH_BURST", cast=int, default=1)
+ADMISSION_MAX_QUEUE_PER_USER = config("ADMISSION_MAX_QUEUE_PER_USER", cast=int, default=8)
+
+# Agent checkpoints in the database: rows are written in batches, and conversations idle
+# for longer than the retention period are deleted
+CHECKPOINT_BATCH_SIZE = config("CHECKPOINT_BATCH_SIZE", cast=int, default=50)
+CHECKPOINT_FLUSH_INTERVAL = config("CHECKPOINT_FLUSH_INTERVAL", cast=float, default=0.5)
+CHECKPOINT_RETENTION_DAYS = config("CHECKPOINT_RETENTION_DAYS", cast=float, default=30)
+# "sql" for the database, "memory" for a single worker. Compaction keeps only the latest
+# checkpoint of each conversation and its last CHECKPOINT_MESSAGE_TAIL messages; the memory
+# backend also evicts idle conversations (rebuilt from the message history when they resume)
+CHECKPOINT_BACKEND = config("CHECKPOINT_BACKEND", cast=str, default="sql")
+CHECKPOINT_COMPACT = config("CHECKPOINT_COMPACT", cast=bool, default=True)
+CHECKPOINT_MESSAGE_TAIL = config("CHECKPOINT_MESSAGE_TAIL", cast=int, default=20)
+CHECKPOINT_MAX_THREADS = config("CHECKPOINT_MAX_THREADS", cast=int, default=1000)
+CHECKPOINT_IDLE_SECONDS = config("CHECKPOINT_IDLE_SECONDS", cast=float, default=3600)
+
+# Shared page fetcher used by the web_loader node
+FETCH_MAX_CONNECTIONS = config("FETCH_MAX_CONNECTIONS", cast=int, default=100)
+FETCH_MAX_CONNECTIONS_PER_HOST = config("FETCH_MAX_CONNECTIONS_PER_HOST", cast=int, default=4)
+FETCH_CONNECT_TIMEOUT = config("FETCH_CONNECT_TIMEOUT", cast=float, default=5.0)
+FETCH_READ_TIMEOUT = config("FETCH_READ_TIMEOUT", cast=float, default=10.0)
+FETCH_TOTAL_TIMEOUT = config("FETCH_TOTAL_TIMEOUT", cast=float, default=15.0)
+FETCH_MAX_BODY_BYTES = config("FETCH_MAX_BODY_BYTES", cast=int, default=2_000_000)
+
+# Scraped-article cache in front of web_loader; the SQLite tier is off unless a path is set
+ARTICLE_CACHE_TTL_SECONDS = config("ARTICLE_CACHE_TTL_SECONDS", cast=float, default=900)
+ARTICLE_CACHE_STALE_SECONDS = config("ARTICLE_CACHE_STALE_SECONDS", cast=float, default=86400)
+ARTICLE_CACHE_MAX_ENTRIES = config("ARTICLE_CACHE_MAX_ENTRIES", cast=int, default=1000)
+ARTICLE_CACHE_SQLITE_PATH = config("ARTICLE_CACHE_SQLITE_PATH", cast=str, default="")
+
+# Search-result cache in front of tavily_search
+SEARCH_CACHE_TTL_SECONDS = config("SEARCH_CACHE_TTL_SECONDS", cast=float, default=120)
+SEARCH_CACHE_MAX_ENTRIES = config("SEARCH_CACHE_MAX_ENTRIES", cast=int, default=500)
+
+# Exact-match cache of chat model responses; the SQLite tier is off unless a path is set
+LLM_CACHE_ENABLED = config("LLM_CACHE_ENABLED", cast=bool, default=True)
+LLM_CACHE_TTL_SECONDS = config("LLM_CACHE_TTL_SECONDS", cast=float, default=300)
+LLM_CACHE_MAX_ENTRIES = config("LLM_CACHE_MAX_ENTRIES", cast=int, default=1000)
+LLM_CACHE_SQLITE_PATH = config("LLM_CACHE_SQLITE_PATH", cast=str, default="")
+
+# Local single/multiple classifier: below the confidence threshold the LLM decides,
+# and a sample of the local answers is checked against the LLM (logged when a path is set)
+CLASSIFIER_MIN_CONFIDENCE = config("CLASSIFIER_MIN_CONFIDENCE", cast=float, default=0.75)
+CLASSIFIER_SHADOW_RATE = config("CLASSIFIER_SHADOW_RATE", cast=float, default=0.02)
+CLASSIFIER_LOG_PATH = config("CLASSIFIER_LOG_PATH", cast=str, default="")
+
+# Tavily's raw content is used instead of scraping the page when it is at least this long
+RAW_CONTENT_MIN_CHARS = config("RAW_CONTENT_MIN_CHARS", cast=int, default=1500)
+
+# Pages still loading this long after the search are dropped in favour of the Tavily snippet
+SCRAPE_DEADLINE_SECONDS = config("SCRAPE_DEADLINE_SECONDS", cast=float, default=8.0)
+
+# Bytes of HTML parsed per page by the article extractor
+EXTRACT_MAX_BYTES = config("EXTRACT_MAX_BYTES", cast=int, default=1_000_000)
+# Pages stop downloading once their article has this many characters, far more than the
+# ARTICLE_MAX_TOKENS it is trimmed to
+EXTRACT_MAX_CHARS = config("EXTRACT_MAX_CHARS", cast=int, default=60_000)
+
+# Token budget of the articles returned by fetch_news, split evenly between them
+FETCH_NEWS_TOKEN_BUDGET = config("FETCH_NEWS_TOKEN_BUDGET", cast=int, default=6000)
+ARTICLE_MIN_TOKENS = config("ARTICLE_MIN_TOKENS", cast=int, default=400)
+ARTICLE_MAX_TOKENS = config("ARTICLE_MAX_TOKENS", cast=int, default=4000)
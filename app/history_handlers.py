@@ -1,35 +1,134 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
 from fastapi import HTTPException
-from sqlmodel import Session, select
+from sqlalchemy import and_, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import config
 from app.models.history_models import Conversation, Message
 from app.models.user_models import User
 
-def create_conversation(session: Session, user_id: int) -> Conversation:
+
+def encode_cursor(created_at: datetime, key: int | str) -> str:
+    # The sort key of a page's last row; clients pass it back as is to get the next page
+    raw = json.dumps([created_at.isoformat(), key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: type[int] | type[str]) -> tuple[datetime, int | str]:
+    """
+    Read a cursor made by encode_cursor.
+
+    Args:
+        cursor (str): The next_cursor of the previous page.
+        key_type (type[int] | type[str]): The type of the ids of the paginated rows.
+
+    Returns:
+        tuple[datetime, int | str]: The created_at and id of the previous page's last row.
+
+    Raises:
+        HTTPException: 400 when the cursor wasn't made by encode_cursor for these rows.
+    """
+    try:
+        created_at, key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # A key of the wrong type would reach the database and fail there (bool is an int to Python)
+    if not isinstance(key, key_type) or isinstance(key, bool):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, key
+
+
+def history_etag(conversation_id: str, updated_at: datetime, limit: int, cursor: str | None) -> str:
+    # Strong ETag of a page of a conversation's history: the page changes only when the
+    # conversation does, and every change to it or its messages moves updated_at
+    raw = json.dumps([conversation_id, updated_at.isoformat(), limit, cursor]).encode()
+    return f'"{hashlib.sha256(raw).hexdigest()[:32]}"'
+
+
+async def deactivate_active_conversation(session: AsyncSession, user_id: int, keep: str | None = None):
+    # A unique index allows one active conversation per user, so the current one is marked
+    # inactive, and flushed, before another one becomes active
+    active_conversation = (await session.exec(select(Conversation).where(Conversation.user_id == user_id, Conversation.is_active == True))).first()
+
+    if active_conversation and active_conversation.conversation_id != keep:
+        active_conversation.is_active = False
+        session.add(active_conversation)
+        await session.flush()
+
+
+async def commit_activation(session: AsyncSession):
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Another request of the same user activated a conversation at the same time
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Another conversation was activated at the same time, please retry")
+
+
+async def create_conversation(session: AsyncSession, user_id: int) -> Conversation:
     # Check if the user exists before creating the conversation
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Check for any active conversation and mark it inactive
-    active_conversation = session.exec(select(Conversation).where(Conversation.user_id == user_id, Conversation.is_active == True)).first()
-    
-    if active_conversation:
-        active_conversation.is_active = False
-        session.add(active_conversation)
+    # Mark the active conversation, if any, inactive
+    await deactivate_active_conversation(session, user_id)
     
     # Proceed to create the new conversation
     conversation = Conversation(user_id=user_id)
     session.add(conversation)
-    session.commit()
-    session.refresh(conversation)
+    await commit_activation(session)
+    await session.refresh(conversation)
     
     return conversation
 
 
 
-def add_message_to_conversation(session: Session, conversation_id: str, role: str, content: str):
+async def get_or_create_active_conversation(session: AsyncSession, user_id: int) -> Conversation:
+    # Reuse the user's active conversation (there is at most one) or start a new one
+    active_conversation = (await session.exec(
+        select(Conversation).where(Conversation.user_id == user_id, Conversation.is_active == True)
+    )).first()
+
+    if not active_conversation:
+        try:
+            active_conversation = await create_conversation(session, user_id)
+        except HTTPException as e:
+            if e.status_code != 409:
+                raise
+            # A concurrent request of the user created one first: use it
+            active_conversation = (await session.exec(
+                select(Conversation).where(Conversation.user_id == user_id, Conversation.is_active == True)
+            )).one()
+
+    return active_conversation
+
+
+def recent_messages_query(conversation_id: str, limit: int):
+    # Shared with the checkpointer's rebuild, which runs in a thread on the sync engine
+    return (
+        select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc(), Message.message_id.desc())
+        .limit(limit)
+    )
+
+
+async def get_recent_messages(session: AsyncSession, conversation_id: str, limit: int) -> list[Message]:
+    # The last `limit` messages of a conversation, oldest first
+    messages = (await session.exec(recent_messages_query(conversation_id, limit))).all()
+    return list(reversed(messages))
+
+
+async def add_message_to_conversation(session: AsyncSession, conversation_id: str, role: str, content: str):
     # Check if the conversation exists
-    conversation = session.get(Conversation, conversation_id)
+    conversation = await session.get(Conversation, conversation_id)
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -37,113 +136,184 @@ def add_message_to_conversation(session: Session, conversation_id: str, role: st
     # Add the message to the conversation if it exists
     message = Message(conversation_id=conversation_id, role=role, content=content)
     session.add(message)
-    session.commit()
-    session.refresh(message)
+    conversation.updated_at = datetime.utcnow()
+    await session.commit()
+    await session.refresh(message)
     return message
 
 
 # Delete conversation handler
-def delete_conversation(session: Session, conversation_id: str):
-    conversation = session.get(Conversation, conversation_id)
+async def delete_conversation(session: AsyncSession, conversation_id: str):
+    conversation = await session.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    session.delete(conversation)
-    session.commit()
+    await session.delete(conversation)
+    await session.commit()
 
-# Get all conversations by user handler
-def get_all_user_conversations(session: Session, user_id: int):
-    user = session.get(User, user_id)
+# Get all conversations by user handler, a page at a time
+async def get_all_user_conversations(session: AsyncSession, user_id: int, limit: int = config.HISTORY_PAGE_SIZE,
+                                     cursor: str | None = None):
+    """
+    A page of the user's conversations, newest first.
+
+    Args:
+        session (AsyncSession): The database session.
+        user_id (int): The user whose conversations to list.
+        limit (int): Conversations per page.
+        cursor (str | None): The next_cursor of the previous page, None for the first page.
+
+    Returns:
+        dict: The page's conversations and the next_cursor of the following page (None on the last page).
+    """
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    conversations = session.exec(select(Conversation).where(Conversation.user_id == user_id)).all()
-    return conversations
+    query = select(Conversation).where(Conversation.user_id == user_id)
+    if cursor is not None:
+        created_at, conversation_id = decode_cursor(cursor, str)
+        query = query.where(tuple_(Conversation.created_at, Conversation.conversation_id) < (created_at, conversation_id))
+    # One row more than the page tells whether there is a next page
+    conversations = (await session.exec(
+        query.order_by(Conversation.created_at.desc(), Conversation.conversation_id.desc()).limit(limit + 1)
+    )).all()
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_cursor = encode_cursor(conversations[-1].created_at, conversations[-1].conversation_id)
+    return {"conversations": conversations, "next_cursor": next_cursor}
 
 
-def mark_conversation_as_inactive(session: Session, conversation_id: str):
+async def mark_conversation_as_inactive(session: AsyncSession, conversation_id: str):
     # Fetch the conversation by ID
-    conversation = session.get(Conversation, conversation_id)
+    conversation = await session.get(Conversation, conversation_id)
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     # Mark the conversation as inactive
     conversation.is_active = False
-    session.commit()
-    session.refresh(conversation)
+    await session.commit()
+    await session.refresh(conversation)
     
     return conversation
     
 
-def mark_conversation_as_active(session: Session, conversation_id: str):
+async def mark_conversation_as_active(session: AsyncSession, conversation_id: str):
     # Fetch the conversation by ID
-    conversation = session.get(Conversation, conversation_id)
+    conversation = await session.get(Conversation, conversation_id)
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Mark the conversation as active
+    # Mark the conversation as active, and the user's previously active one inactive
+    await deactivate_active_conversation(session, conversation.user_id, keep=conversation_id)
     conversation.is_active = True
-    session.commit()
-    session.refresh(conversation)
+    await commit_activation(session)
+    await session.refresh(conversation)
     
     return conversation
 
 
 
-def update_message_handler(session: Session, message_id: int, new_content: str):
+async def update_message_handler(session: AsyncSession, message_id: int, new_content: str):
     # Fetch the message by its ID
-    message = session.get(Message, message_id)
+    message = await session.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
 
-    # Update only the message content
+    # Update only the message content, and mark its conversation as changed
     message.content = new_content
+    await session.exec(
+        update(Conversation).where(Conversation.conversation_id == message.conversation_id).values(updated_at=datetime.utcnow())
+    )
     
     # Commit the changes
-    session.commit()
-    session.refresh(message)
+    await session.commit()
+    await session.refresh(message)
     
     return message
 
 
 
-def get_conversation_history(session: Session, conversation_id: str):
-    # Log the conversation ID being queried
-    print(f"Fetching conversation with ID: {conversation_id}")
-    
-    # Fetch the conversation by its primary key 'conversation_id'
-    conversation = session.exec(select(Conversation).where(Conversation.conversation_id == conversation_id)).first()
+async def get_conversation_updated_at(session: AsyncSession, conversation_id: str) -> datetime:
+    """
+    When a conversation or one of its messages last changed, to check a client's ETag
+    without reading the messages.
 
-    if not conversation:
+    Args:
+        session (AsyncSession): The database session.
+        conversation_id (str): The conversation to check.
+
+    Returns:
+        datetime: The conversation's updated_at.
+
+    Raises:
+        HTTPException: 404 when the conversation doesn't exist.
+    """
+    updated_at = (await session.exec(
+        select(Conversation.updated_at).where(Conversation.conversation_id == conversation_id)
+    )).first()
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return updated_at
+
+
+async def get_conversation_history(session: AsyncSession, conversation_id: str, limit: int = config.HISTORY_PAGE_SIZE,
+                                   cursor: str | None = None):
+    """
+    A conversation with a page of its messages, read in one query. The first page holds the
+    latest messages and each next_cursor leads to older ones; within a page messages are oldest first.
+
+    Args:
+        session (AsyncSession): The database session.
+        conversation_id (str): The conversation to read.
+        limit (int): Messages per page.
+        cursor (str | None): The next_cursor of the previous page, None for the latest messages.
+
+    Returns:
+        dict: The conversation, its page of messages and the next_cursor of the older messages
+            (None when the page reaches the first message).
+
+    Raises:
+        HTTPException: 404 when the conversation doesn't exist.
+    """
+    # The page's messages, newest first and one more to tell whether older ones remain, joined
+    # to their conversation; the outer join keeps the conversation's row when the page is empty
+    on = [Message.conversation_id == Conversation.conversation_id]
+    if cursor is not None:
+        created_at, message_id = decode_cursor(cursor, int)
+        on.append(tuple_(Message.created_at, Message.message_id) < (created_at, message_id))
+    rows = (await session.exec(
+        select(Conversation.user_id, Conversation.created_at, Conversation.is_active, Conversation.updated_at,
+               Message.message_id, Message.role, Message.content, Message.created_at.label("message_created_at"))
+        .select_from(Conversation)
+        .outerjoin(Message, and_(*on))
+        .where(Conversation.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc(), Message.message_id.desc())
+        .limit(limit + 1)
+    )).all()
+
+    if not rows:
         print(f"Conversation with ID {conversation_id} not found.")
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Retrieve all messages related to this conversation
-    messages = session.exec(select(Message).where(Message.conversation_id == conversation_id)).all()
+    conversation = rows[0]
+    messages = [row for row in rows if row.message_id is not None]
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].message_created_at, messages[-1].message_id)
 
-    if not messages:
-        return {
-        "conversation_id": conversation.conversation_id,  # Use conversation_id as defined in the Conversation model
-        "user_id": conversation.user_id,
-        "created_at": conversation.created_at,
-        "is_active": conversation.is_active,
-        "messages": []
-    }
-    
-    # Return conversation history
-    conversation_history = []
-    for message in messages:
-        conversation_history.append({
-            "message_id": message.message_id,  # Use message_id from the Message model
-            "role": message.role,
-            "content": message.content,
-            "created_at": message.created_at
-        })
-    
     return {
-        "conversation_id": conversation.conversation_id,  # Use conversation_id as defined in the Conversation model
+        "conversation_id": conversation_id,
         "user_id": conversation.user_id,
         "created_at": conversation.created_at,
         "is_active": conversation.is_active,
-        "messages": conversation_history
+        "updated_at": conversation.updated_at,
+        "messages": [
+            {"message_id": message.message_id, "role": message.role, "content": message.content,
+             "created_at": message.message_created_at}
+            for message in reversed(messages)
+        ],
+        "next_cursor": next_cursor,
     }
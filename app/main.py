@@ -1,19 +1,34 @@
-from fastapi import FastAPI
+import logging
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import config
 from app.routes import auth_routes, ai_routes, history_routes, user_routes
-from app.db import create_db_and_tables
+from app.db import async_engine, engine
+from app.migrations import upgrade
 from app.ai.main_agent import compile_main_agent
 from app.ai.sub_agent import compile_sub_agent
+from app.ai.fetcher import close_fetcher
+from app.ai.admission import Overloaded
+from app.metrics import RequestMetricsMiddleware, render_metrics
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
+# uvicorn only sets up its own loggers: the app's go to stderr unless logging is already set up
+logging.getLogger("app").setLevel(config.LOG_LEVEL.upper())
+if not logging.getLogger().handlers:
+    logging.basicConfig(format="%(levelname)s:     %(name)s: %(message)s", level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+
 main_agent = None
 sub_agent = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Creating tables...")
-    create_db_and_tables()
-    print("Table created")
+    print("Migrating the database...")
+    await run_in_threadpool(upgrade, engine)
+    print("Database up to date")
     global sub_agent
     print("Compiling Sub Agent...")
     sub_agent = compile_sub_agent()  # Await sub_agent compilation
@@ -25,11 +40,27 @@ async def lifespan(app: FastAPI):
     try:
         yield
     finally:
+        try:
+            await main_agent.checkpointer.aflush()
+        except Exception as e:
+            logger.warning("Failed to write the last checkpoints: %r", e)
+        await close_fetcher()
+        await async_engine.dispose()
         print("Lifespan context ended")
 
 app = FastAPI(lifespan=lifespan)
 
 
+# An outbound provider's wait queue is full: ask the client to come back instead of queueing
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The news assistant is busy, please try again shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # replace with your frontend URL
@@ -37,6 +68,8 @@ app.add_middleware(
     allow_methods=["*"],  # allows all methods, adjust as needed
     allow_headers=["*"],  # allows all headers, adjust as needed
 )
+# Times every request by route; added last so it also times the CORS middleware
+app.add_middleware(RequestMetricsMiddleware)
 
 # Include authentication and AI routes separately
 app.include_router(auth_routes.auth_router)
@@ -44,6 +77,11 @@ app.include_router(ai_routes.ai_router)
 app.include_router(user_routes.user_router)
 app.include_router(history_routes.history_router)
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Headline AI Backend!"}
@@ -0,0 +1,232 @@
+"""
+Schema migrations, applied in order at startup instead of creating the tables from the models.
+
+Each migration upgrades the schema by one version and is never edited once released: a
+change to the models needs a new migration doing the same to existing databases. The tables
+a migration works on are declared here as they were at that version, not imported from the
+models, so old migrations keep doing what they did. The database's version is stored in
+the schema_version table.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, MetaData, String, Table,
+                        and_, exists, func, inspect, or_, select, text, update)
+from sqlalchemy.engine import Connection, Engine
+
+# Postgres advisory lock key held while migrating, so that of several workers starting at
+# once one migrates and the others wait for it
+MIGRATION_LOCK_KEY = 4_180_223
+
+schema_version = Table(
+    "schema_version", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class MigrationError(RuntimeError):
+    """Raised when the data of a database keeps a migration from being applied."""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, description: str):
+    # Registers the decorated function as the migration to `version`
+    def register(upgrade: Callable[[Connection], None]):
+        assert version == len(MIGRATIONS) + 1, "migrations must be numbered consecutively"
+        MIGRATIONS.append(Migration(version, description, upgrade))
+        return upgrade
+    return register
+
+
+# The schema as create_all made it before migrations existed
+baseline = MetaData()
+user_v1 = Table(
+    "user", baseline,
+    Column("id", Integer, primary_key=True),
+    Column("username", String, nullable=False),
+    Column("email", String, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+conversation_v1 = Table(
+    "conversation", baseline,
+    Column("conversation_id", String, primary_key=True),
+    Column("user_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("is_active", Boolean, nullable=False),
+)
+message_v1 = Table(
+    "message", baseline,
+    Column("message_id", Integer, primary_key=True),
+    Column("conversation_id", String, ForeignKey("conversation.conversation_id"), nullable=False),
+    Column("role", String, nullable=False),
+    Column("content", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+Table(
+    "agent_checkpoint", baseline,
+    Column("thread_id", String, primary_key=True, index=True),
+    Column("checkpoint_ns", String, primary_key=True),
+    Column("checkpoint_id", String, primary_key=True),
+    Column("parent_checkpoint_id", String),
+    Column("type", String, nullable=False),
+    Column("checkpoint", LargeBinary, nullable=False),
+    Column("checkpoint_metadata", LargeBinary, nullable=False),
+    Column("created_at", DateTime, nullable=False, index=True),
+)
+Table(
+    "agent_checkpoint_write", baseline,
+    Column("thread_id", String, primary_key=True, index=True),
+    Column("checkpoint_ns", String, primary_key=True),
+    Column("checkpoint_id", String, primary_key=True),
+    Column("task_id", String, primary_key=True),
+    Column("idx", Integer, primary_key=True),
+    Column("channel", String, nullable=False),
+    Column("type", String, nullable=False),
+    Column("value", LargeBinary, nullable=False),
+)
+
+
+@migration(1, "Baseline tables")
+def create_baseline(connection: Connection):
+    # Databases made by create_all already have them
+    baseline.create_all(connection, checkfirst=True)
+
+
+@migration(2, "Indexes of the login, active conversation and history queries")
+def add_query_indexes(connection: Connection):
+    # Indexes attach to their table, so they are built on copies of the baseline tables
+    tables = MetaData()
+    user, conversation, message = (table.to_metadata(tables) for table in (user_v1, conversation_v1, message_v1))
+
+    # Only one conversation per user may stay active: keep the latest one of each user
+    newer = conversation.alias("newer")
+    connection.execute(
+        update(conversation)
+        .where(conversation.c.is_active == True, exists(
+            select(newer.c.conversation_id).where(
+                newer.c.user_id == conversation.c.user_id,
+                newer.c.is_active == True,
+                or_(newer.c.created_at > conversation.c.created_at,
+                    and_(newer.c.created_at == conversation.c.created_at,
+                         newer.c.conversation_id > conversation.c.conversation_id)),
+            )
+        ))
+        .values(is_active=False)
+    )
+    # Signup's check for a taken email was racy, so an existing database may hold the same
+    # email twice. Which account to keep is for a person to decide, not the migration
+    duplicates = connection.execute(
+        select(user.c.email, func.count(), func.min(user.c.id), func.max(user.c.id))
+        .group_by(user.c.email)
+        .having(func.count() > 1)
+        .order_by(user.c.email)
+    ).all()
+    if duplicates:
+        listed = "; ".join(f"{email} ({count} users, ids {first_id} to {last_id})"
+                           for email, count, first_id, last_id in duplicates)
+        raise MigrationError(f"Can't make user emails unique, some are used by several users: {listed}. "
+                             "Merge or delete the extra users, or change their emails, then restart.")
+
+    indexes = [
+        # Login and signup look users up by email; signup already refuses duplicates
+        Index("ux_user_email", user.c.email, unique=True),
+        # The user's active conversation, at most one
+        Index("ux_conversation_active_user", conversation.c.user_id, unique=True,
+              sqlite_where=text("is_active = 1"), postgresql_where=text("is_active")),
+        # The user's conversations, newest first
+        Index("ix_conversation_user_id_created_at", conversation.c.user_id, conversation.c.created_at),
+        # A conversation's messages in order, and its latest ones for rebuilds
+        Index("ix_message_conversation_id_created_at", message.c.conversation_id, message.c.created_at,
+              message.c.message_id),
+    ]
+    for index in indexes:
+        index.create(connection, checkfirst=True)
+
+
+@migration(3, "Conversation index ordered like the paginated conversation list")
+def add_conversation_page_index(connection: Connection):
+    tables = MetaData()
+    conversation = conversation_v1.to_metadata(tables)
+    # Pages are ordered by (created_at, conversation_id); with the id in the index no page needs a sort
+    Index("ix_conversation_user_id_created_at", conversation.c.user_id, conversation.c.created_at).drop(connection, checkfirst=True)
+    Index("ix_conversation_user_id_created_at_id", conversation.c.user_id, conversation.c.created_at,
+          conversation.c.conversation_id).create(connection, checkfirst=True)
+
+
+@migration(4, "Last change of each conversation, for the history's ETag")
+def add_conversation_updated_at(connection: Connection):
+    if "updated_at" in {column["name"] for column in inspect(connection).get_columns("conversation")}:
+        return
+    column_type = DateTime().compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE conversation ADD COLUMN updated_at {column_type}"))
+    # Existing conversations date from their latest message
+    tables = MetaData()
+    conversation, message = (table.to_metadata(tables) for table in (conversation_v1, message_v1))
+    conversation.append_column(Column("updated_at", DateTime))
+    latest_message = (select(func.max(message.c.created_at))
+                      .where(message.c.conversation_id == conversation.c.conversation_id)
+                      .scalar_subquery())
+    connection.execute(update(conversation).values(updated_at=func.coalesce(latest_message, conversation.c.created_at)))
+    if connection.dialect.name == "postgresql":
+        # SQLite can't add the constraint to an existing column; the app always sets the value
+        connection.execute(text("ALTER TABLE conversation ALTER COLUMN updated_at SET NOT NULL"))
+
+
+def current_version(connection: Connection) -> int:
+    """
+    The schema version of the database.
+
+    Args:
+        connection (Connection): A connection to the database.
+
+    Returns:
+        int: The version of the last migration applied, 0 for a database without any.
+    """
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+
+def upgrade(engine: Engine, target: int | None = None) -> list[int]:
+    """
+    Apply the migrations the database is missing, all in one transaction.
+
+    Args:
+        engine (Engine): The database to migrate.
+        target (int | None): The version to migrate to, the latest by default.
+
+    Returns:
+        list[int]: The versions applied, empty when the database was up to date.
+
+    Raises:
+        MigrationError: When the data of the database keeps a migration from being applied;
+            nothing is applied then.
+    """
+    target = len(MIGRATIONS) if target is None else target
+    applied = []
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Released when the transaction ends
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        schema_version.create(connection, checkfirst=True)
+        version = current_version(connection)
+        for step in MIGRATIONS[version:target]:
+            print(f"Migrating the database to version {step.version}: {step.description}")
+            step.upgrade(connection)
+            connection.execute(schema_version.insert().values(
+                version=step.version, description=step.description, applied_at=datetime.utcnow()
+            ))
+            applied.append(step.version)
+    return applied
@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlmodel import Field, SQLModel
+
+
+class AgentCheckpoint(SQLModel, table=True):
+    __tablename__ = "agent_checkpoint"
+    thread_id: str = Field(primary_key=True, index=True)  # the conversation_id
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    checkpoint_id: str = Field(primary_key=True)
+    parent_checkpoint_id: str | None = None
+    type: str
+    checkpoint: bytes
+    checkpoint_metadata: bytes
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class AgentCheckpointWrite(SQLModel, table=True):
+    __tablename__ = "agent_checkpoint_write"
+    thread_id: str = Field(primary_key=True, index=True)
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    checkpoint_id: str = Field(primary_key=True)
+    task_id: str = Field(primary_key=True)
+    idx: int = Field(primary_key=True)
+    channel: str
+    type: str
+    value: bytes
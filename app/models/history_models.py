@@ -2,17 +2,27 @@
 from datetime import datetime
 from typing import List
 import uuid
+from sqlalchemy import Index, text
 from sqlmodel import Field, Relationship, SQLModel
 
 
+# Indexes are created by the migrations in app/migrations.py; keep both in step
 class Conversation(SQLModel, table=True):
+    __table_args__ = (
+        Index("ux_conversation_active_user", "user_id", unique=True,
+              sqlite_where=text("is_active = 1"), postgresql_where=text("is_active")),
+        Index("ix_conversation_user_id_created_at_id", "user_id", "created_at", "conversation_id"),
+    )
     conversation_id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = Field(default=True)
+    # Changes whenever the conversation or one of its messages does; the history's ETag derives from it
+    updated_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow})
     messages: List["Message"] = Relationship(back_populates="conversation")
 
 class Message(SQLModel, table=True):
+    __table_args__ = (Index("ix_message_conversation_id_created_at", "conversation_id", "created_at", "message_id"),)
     message_id: int = Field(default=None, primary_key=True)
     conversation_id: str = Field(foreign_key="conversation.conversation_id")
     role: str  # 'user' or 'ai'
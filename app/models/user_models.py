@@ -2,7 +2,10 @@ from sqlmodel import SQLModel, Field
 from datetime import datetime
 from typing import Optional  # Keep the import for Optional
 from pydantic import EmailStr
+from sqlalchemy import Index
+
 class User(SQLModel, table=True):
+    __table_args__ = (Index("ux_user_email", "email", unique=True),)
     id: int | None = Field(default=None, primary_key=True)
     username: str
     email: EmailStr
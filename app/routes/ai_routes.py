@@ -1,15 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+import asyncio
+import json
+import logging
+from typing import Awaitable, TypeVar
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.auth import get_current_user
 from app.db import get_session
-from app.history_handlers import add_message_to_conversation, create_conversation
-from app.models.history_models import Conversation
+from app.history_handlers import add_message_to_conversation, get_or_create_active_conversation
 from app.models.user_models import User
-from app.ai.main_agent import call_main_agent
+from app.ai.main_agent import call_main_agent, stream_main_agent
+from app.ai.article_cache import get_article_cache
+from app.ai.search_cache import get_search_cache
+from app.ai.llm_cache import get_llm_response_cache
+from app.ai.llm import latency_stats
+from app.ai.classifier import classifier_stats
+from app.ai.tools import raw_content_stats, scrape_stats
+from app.ai.packing import packing_stats
+from app.ai.turn import turn_stats
+from app.ai.prompts import ASSISTANT_PREFIX, assistant_system_tokens
+from app.ai.admission import Overloaded, acting_for, admission_stats, get_gate
 from app.schemas.ai_schemas import AIResponse, AIRequest
-import uuid
 ai_router = APIRouter(prefix = "/ai")
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
 
 # Dependency to get the compiled main_agent
 def get_main_agent():
@@ -18,27 +35,128 @@ def get_main_agent():
         raise HTTPException(status_code=500, detail="Main agent is not initialized")
     return main_agent
 
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await the agent run, cancelling it (and its LLM, search and scrape calls) if the client
+    disconnects first.
+
+    Args:
+        request (Request): The request being answered; its body has already been read.
+        awaitable (Awaitable[T]): The agent run.
+
+    Returns:
+        T: The result of the run.
+
+    Raises:
+        HTTPException: 499 when the client disconnected.
+    """
+    async def wait_for_disconnect():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    run = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({run, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not run.done():
+            run.cancel()
+            await asyncio.wait({run})
+    if run.cancelled():
+        logger.info("Client disconnected, agent run cancelled")
+        raise HTTPException(status_code=499, detail="Client closed request")
+    return run.result()
+
+
+# The route runs on the event loop, DB calls included, so slow LLM/search calls don't hold a worker thread.
 @ai_router.post("/call_agent", response_model=AIResponse)
-def call_agent(ai_request: AIRequest,
+async def call_agent(ai_request: AIRequest,
+               request: Request,
                main_agent = Depends(get_main_agent),
                  current_user: User = Depends(get_current_user),
-                 session: Session = Depends(get_session)):
-    active_conversation = session.exec(
-    select(Conversation)
-    .where(Conversation.user_id == current_user.id, Conversation.is_active == True)
-    .order_by(Conversation.created_at.desc())  # Assuming `id` is the primary key
-    ).first()
-
-    if not active_conversation:
-
-        active_conversation = create_conversation(session, current_user.id)
-    
+                 session: AsyncSession = Depends(get_session)):
+    # Turn the request away before doing any work when OpenAI's wait queue is already full
+    get_gate("openai").check()
+    user_id = current_user.id
+    active_conversation = await get_or_create_active_conversation(session, user_id)
     conversation_id = active_conversation.conversation_id
+    # End the read transaction, so its pooled connection isn't held for the whole agent run
+    await session.close()
 
-    response = call_main_agent(query=ai_request.query, thread_id = conversation_id, main_agent = main_agent)
+    try:
+        with acting_for(user_id):
+            response = await cancel_on_disconnect(
+                request, call_main_agent(query=ai_request.query, thread_id = conversation_id, main_agent = main_agent)
+            )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="The news search took too long, please try again")
     ai_message_content = response["messages"][-1]["content"]
-    add_message_to_conversation(session, conversation_id,"human", ai_request.query)
-    add_message_to_conversation(session, conversation_id, "ai", ai_message_content)
+    await add_message_to_conversation(session, conversation_id, "human", ai_request.query)
+    await add_message_to_conversation(session, conversation_id, "ai", ai_message_content)
 
     return response
 
+
+def format_sse(event: dict) -> str:
+    # Server-sent events framing: a named event followed by a JSON data line
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+# Same as /call_agent but streams progress events and the answer's tokens as they arrive.
+# The messages are persisted once the graph run completes, before the final "done" event.
+# StreamingResponse cancels the stream, and with it the graph run, when the client disconnects.
+@ai_router.post("/call_agent/stream")
+async def call_agent_stream(ai_request: AIRequest,
+               main_agent = Depends(get_main_agent),
+                 current_user: User = Depends(get_current_user),
+                 session: AsyncSession = Depends(get_session)):
+    get_gate("openai").check()
+    user_id = current_user.id
+    active_conversation = await get_or_create_active_conversation(session, user_id)
+    conversation_id = active_conversation.conversation_id
+    # End the read transaction, so its pooled connection isn't held for the whole agent run
+    await session.close()
+
+    async def event_stream():
+        with acting_for(user_id):
+            try:
+                async for event in stream_main_agent(query=ai_request.query, thread_id = conversation_id, main_agent = main_agent):
+                    if event["event"] == "done":
+                        ai_message_content = event["data"]["messages"][-1]["content"]
+                        await add_message_to_conversation(session, conversation_id, "human", ai_request.query)
+                        await add_message_to_conversation(session, conversation_id, "ai", ai_message_content)
+                    yield format_sse(event)
+            except TimeoutError:
+                yield format_sse({"event": "error", "data": {"detail": "The news search took too long, please try again"}})
+            except Overloaded as e:
+                # The response has started, so the 503's Retry-After goes into the event instead
+                yield format_sse({"event": "error", "data": {"detail": str(e), "retry_after": e.retry_after}})
+            except Exception:
+                # Anything else would cut the stream off without a word: the client gets an error event
+                logger.exception("Streaming the answer to conversation %s failed", conversation_id)
+                yield format_sse({"event": "error", "data": {"detail": "The news assistant failed to answer, please try again"}})
+            finally:
+                # The session's dependency has already exited when the stream runs, so it is closed here
+                await session.close()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Counters of the caches in front of the agent's outbound calls
+@ai_router.get("/stats")
+async def get_stats(main_agent = Depends(get_main_agent), current_user: User = Depends(get_current_user)):
+    return {
+        "checkpoints": main_agent.checkpointer.resident_stats(),
+        "models": latency_stats(),
+        "llm_cache": get_llm_response_cache().stats_dict(),
+        "article_cache": get_article_cache().stats_dict(),
+        "search_cache": get_search_cache().stats_dict(),
+        "classifier": classifier_stats.as_dict(),
+        "raw_content": raw_content_stats.as_dict(),
+        "scrape": scrape_stats.as_dict(),
+        "packing": packing_stats.as_dict(),
+        "turns": turn_stats.as_dict(),
+        "prompt": {"static_tokens": ASSISTANT_PREFIX.tokens, "system_tokens": assistant_system_tokens()},
+        "admission": admission_stats(),
+    }
@@ -1,7 +1,9 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.schemas.user_schemas import UserCreate, UserResponse, Token
 from app.models.user_models import User
 from app.auth import get_password_hash, verify_password, create_access_token, get_current_user
@@ -11,26 +13,33 @@ auth_router = APIRouter(prefix = "/auth")
 
 # Signup Endpoint
 @auth_router.post("/signup", response_model=UserResponse)
-def signup(user_create: UserCreate, session: Session = Depends(get_session)):
+async def signup(user_create: UserCreate, session: AsyncSession = Depends(get_session)):
     # Check if user already exists
-    user_exists = session.exec(select(User).where(User.email == user_create.email)).first()
+    user_exists = (await session.exec(select(User).where(User.email == user_create.email))).first()
     if user_exists:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
 
-    # Hash the password and create user
-    hashed_password = get_password_hash(user_create.password)
+    # Hash the password and create user; bcrypt is slow on purpose, so it runs in the threadpool,
+    # and the pooled connection goes back to the pool meanwhile
+    await session.close()
+    hashed_password = await run_in_threadpool(get_password_hash, user_create.password)
     new_user = User(username=user_create.username, email=user_create.email, hashed_password=hashed_password)
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # The same email signed up concurrently; the unique index turned the second one down
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+    await session.refresh(new_user)
     return new_user
 
 # Login Endpoint
 #NOTE: You have to tell the frontend developer that he has to send the email in the key of username and should ask from the user the email but put it against the username key in the header.
 @auth_router.post("/login", response_model=Token)
-def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends(OAuth2PasswordRequestForm)], session: Session = Depends(get_session)):
-    db_user = session.exec(select(User).where(User.email == form_data.username)).first()
-    if not db_user or not verify_password(form_data.password, db_user.hashed_password):
+async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends(OAuth2PasswordRequestForm)], session: AsyncSession = Depends(get_session)):
+    db_user = (await session.exec(select(User).where(User.email == form_data.username))).first()
+    await session.close()  # don't hold the connection while bcrypt runs
+    if not db_user or not await run_in_threadpool(verify_password, form_data.password, db_user.hashed_password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid credentials")
     
     # Create JWT token
@@ -39,6 +48,6 @@ def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends(OAuth2Password
 
 # Token Refresh Endpoint
 @auth_router.post("/token/refresh", response_model=Token)
-def refresh_token(current_user: User = Depends(get_current_user)):
+async def refresh_token(current_user: User = Depends(get_current_user)):
     access_token = create_access_token(data={"sub": str(current_user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
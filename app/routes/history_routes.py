@@ -1,87 +1,113 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.models.history_models import Conversation, Message
-from app.schemas.history_schemas import HistoryResponse, MessageCreate, MessageUpdateContent
+from app import config
+from app.schemas.history_schemas import ConversationsPage, HistoryResponse, MessageCreate, MessageUpdateContent
 from app.db import get_session
-from app.history_handlers import create_conversation, add_message_to_conversation, delete_conversation, get_all_user_conversations, get_conversation_history, mark_conversation_as_active, mark_conversation_as_inactive, update_message_handler
+from app.history_handlers import create_conversation, add_message_to_conversation, delete_conversation, get_all_user_conversations, get_conversation_history, get_conversation_updated_at, history_etag, mark_conversation_as_active, mark_conversation_as_inactive, update_message_handler
 from app.auth import get_current_user
 from app.models.user_models import User
 history_router = APIRouter(prefix='/history')
 
+# ?limit= of the paginated routes
+PageLimit = Query(default=config.HISTORY_PAGE_SIZE, ge=1, le=config.HISTORY_MAX_PAGE_SIZE)
+
+# Clients may keep a history page but must check it's still current before using it
+HISTORY_CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match holds "*" or a comma-separated list of ETags, possibly weak (W/"...")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
 # Create a new conversation
 @history_router.post("/start_new_conversation/")
-def start_conversation(session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    conversation = create_conversation(session, current_user.id)
+async def start_conversation(session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    conversation = await create_conversation(session, current_user.id)
     return conversation
 
 # Add a message to an existing conversation
 @history_router.post("/add_message/{conversation_id}/")
-def send_message(conversation_id: str, message: MessageCreate, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    new_message = add_message_to_conversation(session, conversation_id, message.role, message.content)
+async def send_message(conversation_id: str, message: MessageCreate, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    new_message = await add_message_to_conversation(session, conversation_id, message.role, message.content)
     return new_message
 
 
 @history_router.get("/resume_old_conversation/{conversation_id}", response_model=HistoryResponse)
-def resume_conversation_route(conversation_id: str, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-
-    user_id = current_user.id
-    active_conversation = session.exec(select(Conversation).where(Conversation.user_id == user_id, Conversation.is_active == True)).first()
-    
-    if active_conversation:
-        active_conversation.is_active = False
-        session.add(active_conversation)
-    mark_conversation_as_active(session, conversation_id)
-    history = get_conversation_history(session, conversation_id)
+async def resume_conversation_route(conversation_id: str, response: Response, limit: int = PageLimit, cursor: str | None = None,
+                                    session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    # Marks the user's previously active conversation inactive too
+    await mark_conversation_as_active(session, conversation_id)
+    history = await get_conversation_history(session, conversation_id, limit, cursor)
+    response.headers["ETag"] = history_etag(conversation_id, history["updated_at"], limit, cursor)
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
     return history
 
 @history_router.get("/exit_conversation/{conversation_id}")
-def exit_conversation_route(conversation_id: str, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    conversation = mark_conversation_as_inactive(session, conversation_id)
+async def exit_conversation_route(conversation_id: str, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    conversation = await mark_conversation_as_inactive(session, conversation_id)
     return conversation
 
 # **New** Route to delete conversation
 @history_router.delete("/delete_conversation/{conversation_id}")
-def delete_conversation_route(conversation_id: str, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    delete_conversation(session, conversation_id)
+async def delete_conversation_route(conversation_id: str, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    await delete_conversation(session, conversation_id)
     return {"detail": "Conversation deleted"}
 
 # **New** Route to get all conversations by user
-@history_router.get("/get_all_user_conversations/")
-def get_all_user_conversations_route(session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    return get_all_user_conversations(session, current_user.id)
+@history_router.get("/get_all_user_conversations/", response_model=ConversationsPage)
+async def get_all_user_conversations_route(limit: int = PageLimit, cursor: str | None = None,
+                                           session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    return await get_all_user_conversations(session, current_user.id, limit, cursor)
                     
 @history_router.put("/inactive_conversation/{conversation_id}/")
-def mark_conversation_inactive(conversation_id: str, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    return mark_conversation_as_inactive(session, conversation_id)
+async def mark_conversation_inactive(conversation_id: str, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    return await mark_conversation_as_inactive(session, conversation_id)
 
 
 
 @history_router.put("/active_conversation/{conversation_id}/")
-def mark_conversation_active(conversation_id: str, session: Session = Depends(get_session), 
+async def mark_conversation_active(conversation_id: str, session: AsyncSession = Depends(get_session), 
                              current_user: User = Depends(get_current_user)):
-    return mark_conversation_as_active(session, conversation_id)
+    return await mark_conversation_as_active(session, conversation_id)
 
 
 @history_router.patch("/update_message/{message_id}/")
-def update_message_route(message_id: int, updated_message: MessageUpdateContent, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+async def update_message_route(message_id: int, updated_message: MessageUpdateContent, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
     # Fetch the message by ID and verify ownership
-    message = session.get(Message, message_id)
+    message = await session.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
 
-    # Verify if the user owns the conversation
-    if message.conversation.user_id != current_user.id:
+    # Verify if the user owns the conversation (loaded explicitly: relationships can't lazy load in async code)
+    conversation = await session.get(Conversation, message.conversation_id)
+    if conversation.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this message")
 
     # Call the handler to update the message content
-    updated_message_obj = update_message_handler(session, message_id, updated_message.content)
+    updated_message_obj = await update_message_handler(session, message_id, updated_message.content)
 
     return {"detail": "Message content updated", "message": updated_message_obj}
 
 
-@history_router.get('/get_conversation_history/{conversation_id}')
-def get_conversation_history_route(conversation_id:str, session: Session = Depends(get_session), 
+@history_router.get('/get_conversation_history/{conversation_id}', response_model=HistoryResponse)
+async def get_conversation_history_route(conversation_id:str, request: Request, response: Response,
+                             limit: int = PageLimit, cursor: str | None = None,
+                             session: AsyncSession = Depends(get_session), 
                              current_user: User = Depends(get_current_user)):
-    history = get_conversation_history(session, conversation_id)
+    # A client polling with the ETag of its copy gets a 304 while the conversation is unchanged,
+    # checked on the conversation's row alone without reading the messages
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        updated_at = await get_conversation_updated_at(session, conversation_id)
+        etag = history_etag(conversation_id, updated_at, limit, cursor)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                            headers={"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL})
+
+    history = await get_conversation_history(session, conversation_id, limit, cursor)
+    response.headers["ETag"] = history_etag(conversation_id, history["updated_at"], limit, cursor)
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
     return history
\ No newline at end of file
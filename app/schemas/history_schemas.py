@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from sqlmodel import SQLModel
 
 
@@ -22,7 +22,19 @@ class HistoryResponse(SQLModel):
     user_id: int
     created_at: datetime
     is_active: bool
+    updated_at: datetime  # last change to the conversation or its messages
     messages: List[MessagesResponse]
+    next_cursor: Optional[str] = None  # pass as ?cursor= to get the older messages
+
+class ConversationResponse(SQLModel):
+    conversation_id: str
+    user_id: int
+    created_at: datetime
+    is_active: bool
+
+class ConversationsPage(SQLModel):
+    conversations: List[ConversationResponse]
+    next_cursor: Optional[str] = None  # pass as ?cursor= to get the older conversations
 
 class MessageUpdateContent(SQLModel):
     content: str
\ No newline at end of file
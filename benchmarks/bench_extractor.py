@@ -0,0 +1,64 @@
+"""
+Compare the article extractor used by web_loader with the previous BeautifulSoup implementation.
+
+For every page of a corpus directory it reports the CPU time per extraction and the size of
+the extracted text. benchmarks/corpus/ holds synthetic pages modelled on common news CMS
+layouts (WordPress, single-page apps, table layouts, live blogs) with their usual
+boilerplate: inline state scripts, style blocks, menus, cookie banners, share bars, related
+links and footers. They show the relative speed, but only real pages tell how well the text
+is extracted: save article pages as served (WordPress, SPA shells, live blogs, paywalled
+layouts) and pass their directory with --corpus.
+
+Usage:
+    python benchmarks/bench_extractor.py [--repeat N] [--corpus DIR]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.ai.extractor import extract_article_text  # noqa: E402
+
+CORPUS = Path(__file__).resolve().parent / "corpus"
+
+
+def beautifulsoup_text(body: bytes) -> str:
+    # The previous web_loader: full parse, get_text(), then several whitespace passes
+    text = BeautifulSoup(body.decode("utf-8", errors="replace"), "html.parser").get_text()
+    cleaned_text = text.replace('\n', ' ').replace('\t', ' ')
+    cleaned_text = " ".join(cleaned_text.split())
+    return cleaned_text.strip()
+
+
+def cpu_time(function, body: bytes, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        function(body)
+    return (time.process_time() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="extractions per page and implementation")
+    parser.add_argument("--corpus", type=Path, default=CORPUS, help="directory of the *.html pages to extract")
+    args = parser.parse_args()
+
+    print(f"{'page':<36}{'html KB':>9}{'bs4 ms':>9}{'new ms':>9}{'speedup':>9}{'bs4 chars':>11}{'new chars':>11}")
+    totals = [0.0, 0.0, 0, 0]
+    for path in sorted(args.corpus.glob("*.html")):
+        body = path.read_bytes()
+        old_seconds = cpu_time(beautifulsoup_text, body, args.repeat)
+        new_seconds = cpu_time(extract_article_text, body, args.repeat)
+        old_chars = len(beautifulsoup_text(body))
+        new_chars = len(extract_article_text(body))
+        totals = [totals[0] + old_seconds, totals[1] + new_seconds, totals[2] + old_chars, totals[3] + new_chars]
+        print(f"{path.name:<36}{len(body) / 1024:>9.1f}{old_seconds * 1000:>9.2f}{new_seconds * 1000:>9.2f}"
+              f"{old_seconds / new_seconds:>8.1f}x{old_chars:>11}{new_chars:>11}")
+    print(f"{'total':<36}{'':>9}{totals[0] * 1000:>9.2f}{totals[1] * 1000:>9.2f}"
+          f"{totals[0] / totals[1]:>8.1f}x{totals[2]:>11}{totals[3]:>11}")
+
+
+if __name__ == "__main__":
+    main()
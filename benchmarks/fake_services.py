@@ -0,0 +1,224 @@
+"""
+Local stand-ins for the services the agent calls, for load tests without network or API keys.
+
+- OpenAI: an OpenAI-compatible /v1/chat/completions (plain and streamed). Requests with
+  tools follow a script: the assistant asks for `rounds` rounds of `parallel` fetch_news
+  calls and then answers. Requests without tools are the single/multiple classifier.
+  Like OpenAI, it answers 400 when a tool message doesn't follow the tool calls it answers.
+- Tavily: a Tavily-compatible /search returning results on the news server. A share of
+  them come without usable raw content, so the agent has to scrape those pages.
+- News: static article pages, served from benchmarks/corpus/.
+
+Each service waits a configurable latency (with jitter) before answering.
+
+Usage:
+    python benchmarks/fake_services.py [--openai-latency S] [--rounds N] [--parallel N] ...
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+
+CORPUS = Path(__file__).resolve().parent / "corpus"
+
+
+@dataclass
+class Settings:
+    openai_latency: float = 0.5
+    tavily_latency: float = 0.3
+    news_latency: float = 0.1
+    jitter: float = 0.2  # +/- share of the latency
+    rounds: int = 1
+    parallel: int = 1
+    scrape_ratio: float = 0.5
+    answer_words: int = 200
+    news_url: str = "http://127.0.0.1:18003"
+
+
+settings = Settings()
+
+
+async def wait(latency: float):
+    await asyncio.sleep(latency * random.uniform(1 - settings.jitter, 1 + settings.jitter))
+
+
+def usage(messages: list, content: str) -> dict:
+    prompt_tokens = sum(len(str(message.get("content") or "")) for message in messages) // 4
+    completion_tokens = len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def tool_message_error(messages: list) -> str | None:
+    # OpenAI's rules: the tool messages right after an assistant message with tool_calls
+    # answer each of its calls, and tool messages appear nowhere else
+    pending: set[str] = set()
+    for message in messages:
+        if message["role"] == "tool":
+            if message.get("tool_call_id") not in pending:
+                return "Invalid parameter: messages with role 'tool' must be a response to a preceding message with 'tool_calls'."
+            pending.discard(message["tool_call_id"])
+            continue
+        if pending:
+            break
+        if message["role"] == "assistant":
+            pending = {call["id"] for call in message.get("tool_calls") or []}
+    if pending:
+        return ("An assistant message with 'tool_calls' must be followed by tool messages responding to each "
+                f"'tool_call_id'. The following tool_call_ids did not have response messages: {', '.join(sorted(pending))}")
+    return None
+
+
+def scripted_reply(body: dict) -> dict:
+    messages = body["messages"]
+    if not body.get("tools"):
+        # The classifier
+        return {"role": "assistant", "content": random.choice(["single", "multiple"])}
+
+    # Rounds of tool calls since the user's question
+    rounds = 0
+    for message in reversed(messages):
+        if message["role"] == "user":
+            break
+        if message["role"] == "assistant" and message.get("tool_calls"):
+            rounds += 1
+    if rounds < settings.rounds and body.get("tool_choice") != "none":
+        question = next(message["content"] for message in reversed(messages) if message["role"] == "user")
+        return {"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+             "function": {"name": "fetch_news", "arguments": json.dumps({"query": f"{question} {call}"})}}
+            for call in range(settings.parallel)
+        ]}
+    return {"role": "assistant", "content": " ".join(["news"] * settings.answer_words)}
+
+
+openai_app = FastAPI()
+
+
+@openai_app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await wait(settings.openai_latency)
+    error = tool_message_error(body["messages"])
+    if error:
+        return JSONResponse(status_code=400, content={"error": {
+            "message": error, "type": "invalid_request_error", "param": "messages", "code": None,
+        }})
+    message = scripted_reply(body)
+    finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": body["model"]}
+    content = message.get("content") or ""
+
+    if not body.get("stream"):
+        return {**base, "object": "chat.completion", "usage": usage(body["messages"], content),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}]}
+
+    async def chunks():
+        def chunk(delta: dict, finish: str | None = None, **extra) -> str:
+            data = {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            return f"data: {json.dumps(data)}\n\n"
+
+        if message.get("tool_calls"):
+            calls = [{"index": index, **call} for index, call in enumerate(message["tool_calls"])]
+            yield chunk({"role": "assistant", "tool_calls": calls})
+        else:
+            for word in content.split(" "):
+                yield chunk({"content": word + " "})
+                await asyncio.sleep(0.002)
+        yield chunk({}, finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            data = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage(body["messages"], content)}
+            yield f"data: {json.dumps(data)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+tavily_app = FastAPI()
+
+
+@tavily_app.post("/search")
+async def search(request: Request):
+    body = await request.json()
+    await wait(settings.tavily_latency)
+    results = []
+    for _ in range(body.get("max_results", 5)):
+        page = random.randrange(1_000_000)
+        scrape = random.random() < settings.scrape_ratio
+        results.append({
+            "url": f"{settings.news_url}/article/{page}",
+            "title": f"Story {page}",
+            "content": f"Snippet of story {page} about {body['query']}.",
+            # Short raw content makes the agent scrape the page
+            "raw_content": "Too short." if scrape else "Full text of the story. " * 120,
+            "score": 0.9,
+        })
+    return {"query": body["query"], "answer": "", "images": [], "results": results}
+
+
+news_app = FastAPI()
+PAGES = [path.read_text() for path in sorted(CORPUS.glob("*.html"))]
+
+
+@news_app.get("/article/{page}", response_class=HTMLResponse)
+async def article(page: int):
+    await wait(settings.news_latency)
+    return PAGES[page % len(PAGES)]
+
+
+def start(openai_port: int = 18001, tavily_port: int = 18002, news_port: int = 18003) -> list[uvicorn.Server]:
+    """Run the three services in background threads and return once they accept requests."""
+    settings.news_url = f"http://127.0.0.1:{news_port}"
+    servers = []
+    for app, port in ((openai_app, openai_port), (tavily_app, tavily_port), (news_app, news_port)):
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        servers.append(server)
+    while not all(server.started for server in servers):
+        time.sleep(0.05)
+    return servers
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = Settings()
+    parser.add_argument("--openai-latency", type=float, default=defaults.openai_latency, help="seconds per chat completion")
+    parser.add_argument("--tavily-latency", type=float, default=defaults.tavily_latency, help="seconds per search")
+    parser.add_argument("--news-latency", type=float, default=defaults.news_latency, help="seconds per news page")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="+/- share of every latency")
+    parser.add_argument("--rounds", type=int, default=defaults.rounds, help="rounds of fetch_news calls per question")
+    parser.add_argument("--parallel", type=int, default=defaults.parallel, help="fetch_news calls per round")
+    parser.add_argument("--scrape-ratio", type=float, default=defaults.scrape_ratio,
+                        help="share of search results without usable raw content")
+    parser.add_argument("--answer-words", type=int, default=defaults.answer_words, help="words per answer")
+
+
+def configure(args: argparse.Namespace):
+    for name in ("openai_latency", "tavily_latency", "news_latency", "jitter", "rounds", "parallel",
+                 "scrape_ratio", "answer_words"):
+        setattr(settings, name, getattr(args, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    configure(parser.parse_args())
+    start()
+    print("OPENAI_BASE_URL=http://127.0.0.1:18001/v1 TAVILY_API_URL=http://127.0.0.1:18002")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
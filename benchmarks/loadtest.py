@@ -0,0 +1,193 @@
+"""
+Offline load test of the /ai/call_agent pipeline.
+
+Starts the local stand-ins for OpenAI, Tavily and the news sites (fake_services.py), runs the
+app with uvicorn in a subprocess pointed at them, and drives concurrent users through
+signup, login, call_agent and their conversation history. It reports the throughput, the
+p50/p95/p99 latency of every step and the peak RSS of the app process. Nothing leaves the
+machine: the API keys are fake and every service listens on 127.0.0.1.
+
+Usage:
+    python benchmarks/loadtest.py [--users N] [--questions N] [--stream] [--workers N] ...
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+import httpx
+import fake_services
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def rss_bytes(pid: int) -> int:
+    # Resident memory of a process and its children (the uvicorn workers), from /proc
+    total = 0
+    for process in [str(pid)] + children(pid):
+        try:
+            for line in Path(f"/proc/{process}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def children(pid: int) -> list[str]:
+    try:
+        return Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except OSError:
+        return []
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def timed(self, step: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            self.errors[step] = self.errors.get(step, 0) + 1
+            print(f"{step} failed: {e!r}")
+            return None
+        finally:
+            self.latencies.setdefault(step, []).append(time.perf_counter() - started)
+
+
+async def stream_answer(client: httpx.AsyncClient, question: str, headers: dict):
+    async with client.stream("POST", "/ai/call_agent/stream", json={"query": question}, headers=headers) as response:
+        async for _ in response.aiter_lines():
+            pass
+    return response
+
+
+async def user(client: httpx.AsyncClient, recorder: Recorder, questions: int, stream: bool):
+    name = f"load-{uuid.uuid4().hex[:12]}"
+    email = f"{name}@example.com"
+    await recorder.timed("signup", client.post("/auth/signup", json={"username": name, "email": email, "password": "password"}))
+    login = await recorder.timed("login", client.post("/auth/login", data={"username": email, "password": "password"}))
+    if login is None:
+        return
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    for question in range(questions):
+        # Distinct questions, so the caches only help where real traffic would repeat itself
+        query = f"latest news about topic {uuid.uuid4().hex[:8]} number {question}"
+        if stream:
+            await recorder.timed("call_agent/stream", stream_answer(client, query, headers))
+        else:
+            await recorder.timed("call_agent", client.post("/ai/call_agent", json={"query": query}, headers=headers))
+        conversations = await recorder.timed("history", client.get("/history/get_all_user_conversations/", headers=headers))
+        if conversations is not None and conversations.json()["conversations"]:
+            conversation_id = conversations.json()["conversations"][0]["conversation_id"]
+            await recorder.timed("history/conversation",
+                                 client.get(f"/history/get_conversation_history/{conversation_id}", headers=headers))
+
+
+async def sample_rss(pid: int, peak: list[int], done: asyncio.Event):
+    while not done.is_set():
+        peak[0] = max(peak[0], rss_bytes(pid))
+        await asyncio.sleep(0.2)
+
+
+async def drive(base_url: str, pid: int, args: argparse.Namespace) -> tuple[Recorder, float, int, int]:
+    recorder = Recorder()
+    peak = [0]
+    done = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        idle_rss = rss_bytes(pid)
+        sampler = asyncio.create_task(sample_rss(pid, peak, done))
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client, recorder, args.questions, args.stream) for _ in range(args.users)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await sampler
+    return recorder, elapsed, idle_rss, peak[0]
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen):
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"The app exited with code {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/", timeout=1).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    sys.exit("The app didn't start within 60s")
+
+
+def report(recorder: Recorder, elapsed: float, idle_rss: int, peak_rss: int):
+    print(f"\n{'step':<24}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for step, latencies in recorder.latencies.items():
+        print(f"{step:<24}{len(latencies):>7}{recorder.errors.get(step, 0):>8}"
+              f"{percentile(latencies, 0.50) * 1000:>9.0f}{percentile(latencies, 0.95) * 1000:>9.0f}"
+              f"{percentile(latencies, 0.99) * 1000:>9.0f}{max(latencies) * 1000:>9.0f}")
+    agent_calls = sum(len(latencies) for step, latencies in recorder.latencies.items() if step.startswith("call_agent"))
+    requests = sum(len(latencies) for latencies in recorder.latencies.values())
+    print(f"\nwall time {elapsed:.1f}s, {requests / elapsed:.1f} requests/s, {agent_calls / elapsed:.2f} agent calls/s")
+    print(f"app RSS: {idle_rss / 2**20:.0f} MB idle, {peak_rss / 2**20:.0f} MB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent users")
+    parser.add_argument("--questions", type=int, default=3, help="questions per user")
+    parser.add_argument("--stream", action="store_true", help="use /ai/call_agent/stream")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--port", type=int, default=18000, help="port of the app")
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request")
+    parser.add_argument("--database-url", default=None, help="database of the app (a fresh SQLite file by default)")
+    parser.add_argument("--show-metrics", action="store_true", help="print the app's /metrics after the run")
+    fake_services.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake_services.configure(args)
+    fake_services.start()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir}/loadtest.db",
+        "JWT_SECRET_KEY": "loadtest",
+        "OPENAI_API_KEY": "sk-loadtest",
+        "TAVILY_API_KEY": "tvly-loadtest",
+        "OPENAI_BASE_URL": "http://127.0.0.1:18001/v1",
+        "TAVILY_API_URL": "http://127.0.0.1:18002",
+    }
+    base_url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=workdir, env={**env, "PYTHONPATH": str(ROOT)}, stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(base_url, process)
+        recorder, elapsed, idle_rss, peak_rss = asyncio.run(drive(base_url, process.pid, args))
+        report(recorder, elapsed, idle_rss, peak_rss)
+        if args.show_metrics:
+            print(httpx.get(f"{base_url}/metrics").text)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
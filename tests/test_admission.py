@@ -0,0 +1,114 @@
+import asyncio
+import time
+import pytest
+from app.ai.admission import Overloaded, ProviderGate, acting_for
+
+
+async def hold(gate: ProviderGate, user: str, release: asyncio.Event, served: list):
+    with acting_for(user):
+        async with gate.slot():
+            served.append(user)
+            await release.wait()
+
+
+def test_calls_over_the_limit_queue_and_overflow_is_rejected():
+    async def run():
+        gate = ProviderGate("test", concurrency=1, max_queue=1)
+        release = asyncio.Event()
+        served = []
+        first = asyncio.create_task(hold(gate, "a", release, served))
+        second = asyncio.create_task(hold(gate, "b", release, served))
+        await asyncio.sleep(0.01)
+        assert (gate.active, gate.queued) == (1, 1)
+
+        with pytest.raises(Overloaded) as rejected:
+            async with gate.slot():
+                pass
+        assert rejected.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(first, second)
+        return gate, served
+
+    gate, served = asyncio.run(run())
+    assert served == ["a", "b"]
+    assert (gate.active, gate.queued) == (0, 0)
+    assert gate.stats.admitted == 2 and gate.stats.rejected == 1
+
+
+def test_waiting_users_take_turns():
+    async def run():
+        gate = ProviderGate("test", concurrency=1, max_queue=10)
+        served = []
+        started = []
+
+        async def call(user: str):
+            with acting_for(user):
+                async with gate.slot():
+                    served.append(user)
+                    await asyncio.sleep(0)
+
+        blocker = asyncio.Event()
+        started.append(asyncio.create_task(hold(gate, "a", blocker, [])))
+        await asyncio.sleep(0)
+        # User a queues a burst before user b's single call
+        for user in ["a", "a", "a", "b"]:
+            started.append(asyncio.create_task(call(user)))
+        await asyncio.sleep(0.01)
+        blocker.set()
+        await asyncio.gather(*started)
+        return served
+
+    assert asyncio.run(run()) == ["a", "b", "a", "a"]
+
+
+def test_a_user_cant_fill_the_whole_queue():
+    async def run():
+        gate = ProviderGate("test", concurrency=1, max_queue=10, max_queue_per_user=2)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(gate, "a", release, [])) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        with acting_for("a"), pytest.raises(Overloaded):
+            async with gate.slot():
+                pass
+        # Other users still get a place in the queue
+        tasks.append(asyncio.create_task(hold(gate, "b", release, [])))
+        await asyncio.sleep(0.01)
+        queued = gate.queued
+        release.set()
+        await asyncio.gather(*tasks)
+        return queued
+
+    assert asyncio.run(run()) == 3
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def run():
+        gate = ProviderGate("test", concurrency=1, max_queue=5)
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(gate, "a", release, []))
+        waiter = asyncio.create_task(hold(gate, "b", release, []))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        queued = gate.queued
+        release.set()
+        await first
+        return gate, queued
+
+    gate, queued = asyncio.run(run())
+    assert queued == 0
+    assert gate.active == 0
+
+
+def test_token_bucket_spaces_out_calls():
+    async def run():
+        gate = ProviderGate("test", concurrency=10, max_queue=10, rate=20, burst=1)
+        started = time.monotonic()
+        for _ in range(3):
+            async with gate.slot():
+                pass
+        return time.monotonic() - started
+
+    # The burst allows one call at once, the next two wait 1/20s each
+    assert asyncio.run(run()) >= 0.09
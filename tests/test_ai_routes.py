@@ -1,22 +1,39 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from uuid import uuid4
+import httpx
+import openai
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import SQLModel, Session, create_engine, text
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.main import app
-from app.db import get_session
+from app.db import async_url, get_session
+from app.ai import main_agent as main_agent_module
+from app.ai.checkpointer import CompactingMemorySaver
+from app.ai.main_agent import compile_main_agent, stream_main_agent
+from app.ai.sub_agent import compile_sub_agent
+from app.routes import ai_routes
+from app.routes.ai_routes import get_main_agent
 from app.models.history_models import Message
 from app.schemas.ai_schemas import AIRequest, AIResponse  # Import your AI schemas
 
 # Create SQLite database for testing
 SQLITE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLITE_URL, connect_args={"check_same_thread": False})
+async_engine = create_async_engine(async_url(SQLITE_URL))
 
 # Override the get_session function to use the test SQLite database
-def override_get_session():
-    session = Session(engine)
-    try:
+async def override_get_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
-    finally:
-        session.close()
 
 app.dependency_overrides[get_session] = override_get_session
 
@@ -57,6 +74,64 @@ def access_token(client):
     token_data = login_response.json()
     return token_data["access_token"]
 
+class SearchesOnce(BaseChatModel):
+    """Searches the news for each question, then answers in a few streamed tokens."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "searches-once"
+
+    def _reply(self, messages) -> AIMessage:
+        if isinstance(messages[-1], HumanMessage):
+            return AIMessage("", tool_calls=[{"name": "fetch_news", "args": {"query": messages[-1].content}, "id": str(uuid4())}])
+        return AIMessage("Here is the news.")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            call = reply.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+            ]))
+            return
+        for token in ("Here ", "is ", "the ", "news."):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**kwargs)
+
+
+@pytest.fixture
+def offline_agent(client, monkeypatch):
+    # The real graph with a scripted assistant in place of OpenAI; returns a factory taking the sub agent
+    monkeypatch.setattr(main_agent_module, "get_llm", lambda node: SearchesOnce())
+    monkeypatch.setattr(main_agent_module, "create_checkpointer", lambda engine, rebuild: CompactingMemorySaver())
+
+    def use(sub_agent):
+        agent = compile_main_agent(sub_agent)
+        app.dependency_overrides[get_main_agent] = lambda: agent
+        return agent
+
+    yield use
+    app.dependency_overrides.pop(get_main_agent, None)
+
+
+def stream_events(client, access_token, query: str) -> list[tuple[str, dict]]:
+    with client.stream("POST", "/ai/call_agent/stream", json={"query": query},
+                       headers={"Authorization": f"Bearer {access_token}"}) as response:
+        assert response.status_code == 200
+        lines = [line for line in response.iter_lines() if line]
+    names = [line.split(": ", 1)[1] for line in lines if line.startswith("event: ")]
+    data = [json.loads(line.split(": ", 1)[1]) for line in lines if line.startswith("data: ")]
+    return list(zip(names, data))
+
+
 def test_ai_route(client, access_token):
     # Define the query for the AI
     ai_request_data = {"query": "hi how are you?"}
@@ -89,3 +164,182 @@ def test_ai_route(client, access_token):
     # You can also assert specific values for the first message if necessary
     assert first_message["role"] == "human"  # or whatever expected role
     assert isinstance(first_message["created_at"], str)  # Check that created_at is a string
+
+class FakeSubAgent:
+    async def ainvoke(self, state):
+        return {"final_news": [{"url": "https://example.com/news", "content": "Markets rallied."}]}
+
+
+def test_ai_stream_route(client, access_token, offline_agent, monkeypatch):
+    agent = offline_agent(FakeSubAgent())
+    flushes = []
+    flush = agent.checkpointer.aflush
+
+    async def counting_flush():
+        flushes.append(True)
+        await flush()
+
+    monkeypatch.setattr(agent.checkpointer, "aflush", counting_flush)
+
+    # Stream the answer for the same query as server-sent events
+    with client.stream(
+        "POST",
+        "/ai/call_agent/stream",
+        json={"query": "hi how are you?"},
+        headers={"Authorization": f"Bearer {access_token}"}
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line.split(": ", 1)[1] for line in response.iter_lines() if line.startswith("event: ")]
+
+    # The answer arrives as tokens followed by a single final event
+    assert events.count("token") == 4
+    assert events[-1] == "done"
+
+    # The exchange is persisted in the user's active conversation
+    with Session(engine) as session:
+        messages = session.exec(select(Message)).all()
+        assert [message.role for message in messages] == ["human", "ai"]
+        assert messages[-1].content == "Here is the news."
+
+    # The run's checkpoints were flushed for the other workers
+    assert flushes == [True]
+
+
+class WaitsForCompany:
+    """Sub agent that only answers once another search is running at the same time."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.together = None
+
+    async def ainvoke(self, state):
+        # Created on the app's event loop
+        self.together = self.together or asyncio.Event()
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        if self.running == 2:
+            self.together.set()
+        try:
+            await asyncio.wait_for(self.together.wait(), timeout=5)
+        except TimeoutError:
+            pass
+        finally:
+            self.running -= 1
+        return {"final_news": []}
+
+
+def test_agent_calls_run_concurrently(client, access_token, offline_agent):
+    sub_agent = WaitsForCompany()
+    offline_agent(sub_agent)
+    client.post("/auth/signup", json={"username": "other", "email": "other@example.com", "password": "otherpassword"})
+    other_token = client.post("/auth/login", data={"username": "other@example.com", "password": "otherpassword"}).json()["access_token"]
+
+    def ask(token):
+        return client.post("/ai/call_agent", json={"query": "latest news"}, headers={"Authorization": f"Bearer {token}"})
+
+    # Neither run blocks the event loop, so both searches are in flight at once
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        responses = list(pool.map(ask, [access_token, other_token]))
+    assert [response.status_code for response in responses] == [200, 200]
+    assert sub_agent.peak == 2
+
+
+class Unreachable(SearchesOnce):
+    """OpenAI can't be reached."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._generate(messages)
+        yield
+
+
+def test_ai_stream_route_reports_failures(client, access_token, offline_agent, monkeypatch, caplog):
+    monkeypatch.setattr(main_agent_module, "get_llm", lambda node: Unreachable())
+    offline_agent(FakeSubAgent())
+
+    # The stream ends with an error event rather than being cut off
+    name, data = stream_events(client, access_token, "hi how are you?")[-1]
+    assert name == "error"
+    assert data["detail"] == "The news assistant failed to answer, please try again"
+
+    # The failure is logged with its traceback
+    [record] = [record for record in caplog.records if record.name == "app.routes.ai_routes"]
+    assert record.levelno == logging.ERROR
+    assert isinstance(record.exc_info[1], openai.APIConnectionError)
+
+
+class SlowToAnswer(SearchesOnce):
+    """Searches at once, then takes a second per token of its answer."""
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            for chunk in self._stream(messages):
+                yield chunk
+            return
+        for token in ("Here ", "is ", "the ", "news."):
+            await asyncio.sleep(1)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def test_ai_stream_route_times_out_while_answering(client, access_token, offline_agent, monkeypatch):
+    monkeypatch.setattr(main_agent_module, "get_llm", lambda node: SlowToAnswer())
+    monkeypatch.setattr(ai_routes, "stream_main_agent", partial(stream_main_agent, timeout=1.5))
+    offline_agent(FakeSubAgent())
+
+    # The deadline covers the generation of the answer too, not only the start of the run
+    events = stream_events(client, access_token, "hi how are you?")
+    assert [name for name, data in events].count("token") < 4
+    assert events[-1] == ("error", {"detail": "The news search took too long, please try again"})
+
+    # Nothing is persisted for the unfinished exchange
+    with Session(engine) as session:
+        assert session.exec(select(Message)).all() == []
+
+
+def test_ai_route_busy_when_openai_queue_is_full(client, access_token, monkeypatch):
+    from app.ai.admission import get_gate
+
+    gate = get_gate("openai")
+    monkeypatch.setattr(gate, "active", gate.concurrency)
+    monkeypatch.setattr(gate, "queued", gate.max_queue)
+
+    response = client.post(
+        "/ai/call_agent",
+        json={"query": "hi how are you?"},
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+
+    # Rejected at once, without waiting for a slot
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_full_tavily_queue_is_a_503(client, access_token, offline_agent, monkeypatch):
+    from app.ai.admission import get_gate
+
+    monkeypatch.setattr(main_agent_module.config, "CLASSIFIER_SHADOW_RATE", 0.0)
+    offline_agent(compile_sub_agent())
+    gate = get_gate("tavily")
+    monkeypatch.setattr(gate, "active", gate.concurrency)
+    monkeypatch.setattr(gate, "queued", gate.max_queue)
+    rejected = gate.stats.rejected
+
+    # The search is turned away, and the assistant doesn't search again into the same queue
+    response = client.post("/ai/call_agent", json={"query": "top headlines today"},
+                           headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert gate.stats.rejected == rejected + 1
+
+    # Once streaming has started the 503 becomes an error event
+    name, data = stream_events(client, access_token, "top headlines today")[-1]
+    assert name == "error"
+    assert data["retry_after"] >= 1
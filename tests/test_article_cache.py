@@ -0,0 +1,56 @@
+import asyncio
+from app.ai.article_cache import ArticleCache
+from app.ai.fetcher import FetchedPage
+
+# Stand-in for PageFetcher that serves one page and honours If-None-Match
+class FakeFetcher:
+    def __init__(self):
+        self.requests = []
+
+    async def fetch(self, url, headers=None, consume=None):
+        self.requests.append(headers or {})
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return FetchedPage(url=url, status_code=304, content_type="", encoding=None, body=b"")
+        return FetchedPage(url=url, status_code=200, content_type="text/html", encoding="utf-8",
+                           body=b"<p>Breaking   news</p>", etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+
+
+def extract(page):
+    return " ".join(page.text.replace("<p>", "").replace("</p>", "").split())
+
+
+def test_fresh_entries_are_served_from_memory():
+    cache = ArticleCache(ttl=60, max_stale=3600, max_entries=10)
+    fetcher = FakeFetcher()
+
+    async def load_twice():
+        return [await cache.load("https://news.example/a", fetcher, extract) for _ in range(2)]
+
+    assert asyncio.run(load_twice()) == ["Breaking news", "Breaking news"]
+    assert len(fetcher.requests) == 1
+    assert cache.stats.misses == 1
+    assert cache.stats.hits == 1
+
+
+def test_stale_entries_are_revalidated():
+    cache = ArticleCache(ttl=0, max_stale=3600, max_entries=10)
+    fetcher = FakeFetcher()
+
+    async def load_twice():
+        return [await cache.load("https://news.example/a", fetcher, extract) for _ in range(2)]
+
+    assert asyncio.run(load_twice()) == ["Breaking news", "Breaking news"]
+    assert fetcher.requests[1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert cache.stats.revalidated == 1
+    assert cache.stats.bytes_downloaded == len(b"<p>Breaking   news</p>")
+
+
+def test_sqlite_tier_survives_restarts(tmp_path):
+    path = str(tmp_path / "articles.db")
+    fetcher = FakeFetcher()
+    asyncio.run(ArticleCache(ttl=60, max_stale=3600, max_entries=10, sqlite_path=path).load("https://news.example/a", fetcher, extract))
+
+    restarted = ArticleCache(ttl=60, max_stale=3600, max_entries=10, sqlite_path=path)
+    assert asyncio.run(restarted.load("https://news.example/a", fetcher, extract)) == "Breaking news"
+    assert len(fetcher.requests) == 1
+    assert restarted.stats.hits == 1
@@ -0,0 +1,130 @@
+import asyncio
+from datetime import datetime, timedelta
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import START, MessagesState, StateGraph
+from sqlalchemy import func, select, update
+from sqlmodel import SQLModel, create_engine
+from app.ai.checkpointer import CHECKPOINTS, CompactingMemorySaver, SQLCheckpointSaver, trim_messages_tail
+
+
+def make_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'checkpoints.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def compile_echo_graph(checkpointer):
+    def echo(state: MessagesState):
+        return {"messages": [AIMessage(content=f"echo: {state['messages'][-1].content}")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", echo)
+    builder.add_edge(START, "echo")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def test_conversations_resume_on_another_worker(tmp_path):
+    engine = make_engine(tmp_path)
+    config = {"configurable": {"thread_id": "conversation-1"}}
+
+    async def run():
+        first_worker = compile_echo_graph(SQLCheckpointSaver(engine))
+        await first_worker.ainvoke({"messages": [HumanMessage(content="hello")]}, config)
+        await first_worker.checkpointer.aflush()
+
+        second_worker = compile_echo_graph(SQLCheckpointSaver(engine))
+        return await second_worker.ainvoke({"messages": [HumanMessage(content="again")]}, config)
+
+    state = asyncio.run(run())
+    assert [message.content for message in state["messages"]] == ["hello", "echo: hello", "again", "echo: again"]
+
+
+def test_writes_are_batched(tmp_path):
+    engine = make_engine(tmp_path)
+    checkpointer = SQLCheckpointSaver(engine, flush_interval=60, compact=False)
+
+    async def run():
+        graph = compile_echo_graph(checkpointer)
+        await graph.ainvoke({"messages": [HumanMessage(content="hello")]}, {"configurable": {"thread_id": "t"}})
+        return checkpointer.pending
+
+    # Nothing has been written yet; the next read writes the whole run at once
+    assert asyncio.run(run()) > 1
+    assert checkpointer.get_tuple({"configurable": {"thread_id": "t"}}) is not None
+    assert checkpointer.pending == 0
+
+
+def test_idle_threads_are_pruned(tmp_path):
+    engine = make_engine(tmp_path)
+    checkpointer = SQLCheckpointSaver(engine, retention_days=30)
+    graph = compile_echo_graph(checkpointer)
+    for thread_id in ("old", "recent"):
+        asyncio.run(graph.ainvoke({"messages": [HumanMessage(content="hi")]}, {"configurable": {"thread_id": thread_id}}))
+    checkpointer.flush()
+    with engine.begin() as connection:
+        connection.execute(update(CHECKPOINTS).where(CHECKPOINTS.c.thread_id == "old")
+                           .values(created_at=datetime.utcnow() - timedelta(days=31)))
+
+    assert checkpointer.prune() > 0
+    assert checkpointer.get_tuple({"configurable": {"thread_id": "old"}}) is None
+    assert checkpointer.get_tuple({"configurable": {"thread_id": "recent"}}) is not None
+
+
+def test_trimmed_tail_starts_at_a_human_message():
+    messages = [
+        HumanMessage(content="q1"), AIMessage(content="", tool_calls=[{"name": "fetch_news", "args": {}, "id": "1"}]),
+        ToolMessage(content="news", tool_call_id="1"), AIMessage(content="a1"),
+        HumanMessage(content="q2"), AIMessage(content="a2"),
+    ]
+    assert [message.content for message in trim_messages_tail(messages, 4)] == ["q2", "a2"]
+    assert trim_messages_tail(messages, 10) == messages
+
+
+def test_trimmed_tail_keeps_the_whole_current_question():
+    def calls(round_: int) -> list:
+        ids = [f"{round_}-{number}" for number in range(3)]
+        return [AIMessage(content="", tool_calls=[{"name": "fetch_news", "args": {}, "id": id_} for id_ in ids]),
+                *(ToolMessage(content="news", tool_call_id=id_) for id_ in ids)]
+
+    # Two rounds of three parallel calls: the last 6 messages would start at a tool result
+    messages = [HumanMessage(content="q1"), AIMessage(content="a1"), HumanMessage(content="q2"), *calls(1), *calls(2)]
+    assert trim_messages_tail(messages, 6) == messages[2:]
+
+
+def test_compaction_keeps_the_latest_checkpoint_and_message_tail(tmp_path):
+    engine = make_engine(tmp_path)
+    checkpointer = SQLCheckpointSaver(engine, message_tail=4)
+    graph = compile_echo_graph(checkpointer)
+    config = {"configurable": {"thread_id": "t"}}
+
+    async def run():
+        for turn in range(5):
+            await graph.ainvoke({"messages": [HumanMessage(content=f"q{turn}")]}, config)
+        await checkpointer.aflush()
+        return await graph.aget_state(config)
+
+    state = asyncio.run(run())
+    assert [message.content for message in state.values["messages"]] == ["q3", "echo: q3", "q4", "echo: q4"]
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(CHECKPOINTS)).scalar() == 1
+
+
+def test_memory_saver_evicts_idle_threads_and_rebuilds_them():
+    history = {}
+    checkpointer = CompactingMemorySaver(max_threads=1, ttl=3600, message_tail=20, rebuild=lambda thread_id: history.get(thread_id, []))
+    graph = compile_echo_graph(checkpointer)
+
+    async def run():
+        for thread_id in ("t1", "t2"):
+            await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, {"configurable": {"thread_id": thread_id}})
+        # What the routes saved in the Message table
+        history["t1"] = [HumanMessage(content="hi"), AIMessage(content="echo: hi")]
+        return await graph.ainvoke({"messages": [HumanMessage(content="back")]}, {"configurable": {"thread_id": "t1"}})
+
+    state = asyncio.run(run())
+    assert checkpointer.evictions == 2
+    assert checkpointer.rebuilds == 1
+    assert [message.content for message in state["messages"]] == ["hi", "echo: hi", "back", "echo: back"]
+    stats = checkpointer.resident_stats()
+    assert stats["threads"] == 1
+    assert stats["bytes"] > 0
@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from app.ai import classifier
+from app.ai.classifier import classify_locally, classify_query
+
+
+@pytest.mark.parametrize("query, label", [
+    ("What happened in the latest match between Pakistan and England?", "single"),
+    ("Can you give me all the latest updates on climate change?", "multiple"),
+    ("What are the current headlines in sports and entertainment?", "multiple"),
+    ("Who won the election in Sri Lanka?", "single"),
+    ("Top stories today", "multiple"),
+])
+def test_confident_local_answers(query, label):
+    local_label, confidence = classify_locally(query)
+    assert local_label == label
+    assert confidence >= 0.75
+
+
+def test_low_confidence_falls_back_to_the_llm(monkeypatch):
+    calls = []
+
+    async def fake_llm(query):
+        calls.append(query)
+        return "single"
+
+    monkeypatch.setattr(classifier, "classify_with_llm", fake_llm)
+    monkeypatch.setattr(classifier, "classifier_stats", classifier.ClassifierStats())
+
+    assert asyncio.run(classify_query("Tell me about the recent policy changes in the education sector.")) == "single"
+    assert asyncio.run(classify_query("Can you give me all the latest updates on climate change?")) == "multiple"
+    assert len(calls) == 1
+    assert classifier.classifier_stats.llm_fallbacks == 1
+    assert classifier.classifier_stats.local == 1
+    assert classifier.classifier_stats.agreements == 1
@@ -0,0 +1,66 @@
+import asyncio
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import config
+from app.db import TimedQueuePool, async_url, engine_options, log_slow_queries, pool_connections, pool_wait_seconds, slow_queries
+from app.history_handlers import add_message_to_conversation, get_or_create_active_conversation, get_recent_messages
+from app.models.user_models import User
+
+
+def test_async_url_picks_the_async_driver():
+    assert async_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    assert async_url("postgresql://user:secret@db:5432/app") == "postgresql+asyncpg://user:secret@db:5432/app"
+    assert async_url("postgres://user:secret@db/app") == "postgresql+asyncpg://user:secret@db/app"
+    assert async_url("postgresql+asyncpg://db/app") == "postgresql+asyncpg://db/app"
+
+
+def test_handlers_run_on_an_async_session(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            user = User(username="reader", email="reader@example.com", hashed_password="x")
+            session.add(user)
+            await session.commit()
+
+            conversation = await get_or_create_active_conversation(session, user.id)
+            assert (await get_or_create_active_conversation(session, user.id)).conversation_id == conversation.conversation_id
+            for number in range(3):
+                await add_message_to_conversation(session, conversation.conversation_id, "human", f"question {number}")
+            recent = await get_recent_messages(session, conversation.conversation_id, 2)
+        await engine.dispose()
+        return [message.content for message in recent]
+
+    assert asyncio.run(scenario()) == ["question 1", "question 2"]
+
+
+def test_pooled_engine_reports_waits_and_connections(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", **engine_options(f"sqlite:///{tmp_path / 'app.db'}", TimedQueuePool))
+    waits_before = sum(pool_wait_seconds.values.get(("sync",), [[0]])[0])
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert pool_connections({"sync": engine})[("sync", "in_use")] == 1
+    assert pool_connections({"sync": engine}) == {("sync", "in_use"): 0, ("sync", "idle"): 1}
+    assert sum(pool_wait_seconds.values[("sync",)][0]) == waits_before + 1
+    assert engine_options("sqlite://", TimedQueuePool) == {"echo": config.DB_ECHO}
+
+
+def test_slow_queries_are_counted_and_sampled(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_SECONDS", 0.0)
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_SAMPLE_RATE", 1.0)
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    log_slow_queries(engine, "test")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT\n  1"))
+    assert slow_queries.values[("test",)] == 1
+    [record] = caplog.records
+    assert record.getMessage().startswith("Slow query on the test engine (") and record.getMessage().endswith("ms): SELECT 1")
+    caplog.clear()
+
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_SAMPLE_RATE", 0.0)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert slow_queries.values[("test",)] == 2
+    assert caplog.records == []
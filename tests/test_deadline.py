@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from langgraph.graph import START, StateGraph
+from typing import TypedDict
+from app.ai.deadline import deadline, remaining, stage_budget, within_budget
+from app.routes.ai_routes import cancel_on_disconnect
+
+
+def test_stage_budgets_come_from_the_remaining_time():
+    assert stage_budget(10) == 10
+    with deadline(5):
+        assert stage_budget(10) <= 5
+        assert stage_budget(2) == 2
+        assert stage_budget(10, reserve=4) <= 1
+        # A nested deadline never extends the enclosing one
+        with deadline(60):
+            assert remaining() <= 5
+    assert remaining() is None
+
+
+class State(TypedDict):
+    remaining: float
+
+
+def test_graph_nodes_see_the_deadline():
+    async def node(state: State):
+        return {"remaining": remaining()}
+
+    builder = StateGraph(State)
+    builder.add_node("node", node)
+    builder.add_edge(START, "node")
+    graph = builder.compile()
+
+    async def run():
+        with deadline(5):
+            return await graph.ainvoke({"remaining": -1})
+
+    assert 0 < asyncio.run(run())["remaining"] <= 5
+
+
+def test_slow_stages_are_cancelled():
+    cancelled = asyncio.Event()
+
+    async def slow_call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run():
+        with deadline(0.05):
+            with pytest.raises(TimeoutError):
+                await within_budget(slow_call())
+        return cancelled.is_set()
+
+    assert asyncio.run(run())
+
+
+class DisconnectingRequest:
+    async def receive(self):
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+
+def test_runs_are_cancelled_when_the_client_disconnects():
+    async def agent_run():
+        await asyncio.sleep(10)
+
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await cancel_on_disconnect(DisconnectingRequest(), agent_run())
+        return error.value.status_code
+
+    assert asyncio.run(run()) == 499
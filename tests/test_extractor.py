@@ -0,0 +1,59 @@
+from app.ai.extractor import extract_article_text, is_boilerplate_name
+
+STORY = "<p>Officials said the measure would take effect next month.</p>" * 5
+PAGE = f"""<html><head><title>Title</title><script>var state = {{}};</script><style>p {{}}</style></head>
+<body><nav><a href="/">Home</a> <a href="/world">World</a></nav>
+<div id="cookie-consent">We use cookies</div>
+<article><header><h1>Talks   resume</h1></header>
+<div class="share-bar">Share on X</div>{STORY}<aside>Related stories</aside></article>
+<footer>All rights reserved</footer></body></html>""".encode()
+
+
+def test_only_the_article_text_is_kept():
+    text = extract_article_text(PAGE)
+    assert text.startswith("Talks resume Officials said")
+    for boilerplate in ("Home", "cookies", "Share", "Related", "rights", "var state", "Title"):
+        assert boilerplate not in text
+
+
+def test_whitespace_is_collapsed():
+    text = extract_article_text(b"<div>\n\t Breaking <b>news</b>\n\n<p>from   the</p>city </div>")
+    assert text == "Breaking news from the city"
+
+
+def test_pages_without_article_markup_keep_the_page_text():
+    text = extract_article_text(b"<html><body><nav>Menu</nav><font>Floods cut off villages</font></body></html>")
+    assert text == "Floods cut off villages"
+
+
+def test_byte_budget_and_chunk_boundaries():
+    body = ("<p>" + "café " * 100 + "</p>").encode()
+    # Chunks of 3 bytes split the two-byte "é" across feeds
+    assert extract_article_text(body, chunk_size=3) == " ".join(["café"] * 100)
+    assert len(extract_article_text(body, max_bytes=53)) < 60
+
+
+def test_page_classes_never_hide_the_story():
+    # Classes WordPress themes and consent managers put on <html>/<body> and layout wrappers
+    wordpress_body = ('<body class="post-template-default single single-post postid-4182 single-format-standard '
+                      'wp-embed-responsive has-sidebar menu-open cookies-not-set modal-open">')
+    pages = [
+        f"{wordpress_body}<article>{STORY}</article></body>",
+        f'<html class="cookie-consent-pending js"><body><div>{STORY}</div></body></html>',
+        # mdBook's root, which once emptied the extraction of whole pages
+        f'<html lang="en" class="light sidebar-visible" dir="ltr"><body><div id="content"><main>{STORY}</main></div></body></html>',
+        f'<body><div class="site-content has-sidebar"><div class="sidebar-layout"><main>{STORY}</main></div></div></body>',
+        f'<body><form id="aspnetForm"><div id="article-body" itemprop="articleBody">{STORY}</div></form></body>',
+    ]
+    for page in pages:
+        assert extract_article_text(page.encode()).startswith("Officials said"), page
+
+
+def test_class_tokens_are_matched_whole():
+    for name in ("cookie-consent", "share-bar", "social-share", "site-footer", "related-posts", "cookieBanner", "ad-slot"):
+        assert is_boilerplate_name(name), name
+    for name in ("article-banner", "share-price", "has-sidebar", "menu-open", "cookies-not-set", "single-post"):
+        assert not is_boilerplate_name(name), name
+    text = extract_article_text(f'<div class="article-banner">Markets rally</div><div class="share-price">120p</div>{STORY}'.encode())
+    assert text.startswith("Markets rally 120p Officials said")
+
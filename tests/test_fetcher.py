@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.ai.extractor import create_extractor
+from app.ai.fetcher import FetchError, PageFetcher
+
+ARTICLE = b"<html><body><article><p>Breaking news.</p></article></body></html>"
+
+# Local HTTP server that misbehaves on purpose so the fetcher's limits can be checked
+class NewsSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def send_body(self, body: bytes, content_type: str = "text/html; charset=utf-8"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/article":
+            self.send_body(ARTICLE)
+        elif self.path == "/slow":
+            time.sleep(1)
+            self.send_body(ARTICLE)
+        elif self.path == "/drip":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            for _ in range(10):
+                self.wfile.write(b"x" * 10)
+                self.wfile.flush()
+                time.sleep(0.2)
+        elif self.path == "/huge":
+            self.send_body(b"<p>" + b"a" * 1_000_000 + b"</p>")
+        elif self.path == "/long":
+            self.send_body(b"<html><body><article>" + b"<p>Another paragraph of the story.</p>" * 30_000 + b"</article></body></html>")
+        elif self.path == "/report.pdf":
+            self.send_body(b"%PDF-1.4", "application/pdf")
+        elif self.path == "/clip":
+            self.send_body(b"\x00" * 100, "video/mp4")
+        elif self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path.startswith("/hold"):
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            time.sleep(0.2)
+            with self.server.lock:
+                self.server.in_flight -= 1
+            self.send_body(ARTICLE)
+
+
+@pytest.fixture
+def news_site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NewsSiteHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def run_with_fetcher(coro_factory, **limits):
+    async def main():
+        fetcher = PageFetcher(**limits)
+        try:
+            return await coro_factory(fetcher)
+        finally:
+            await fetcher.aclose()
+    return asyncio.run(main())
+
+
+def test_fetch_page(news_site):
+    server, base_url = news_site
+    page = run_with_fetcher(lambda fetcher: fetcher.fetch(f"{base_url}/article"))
+    assert page.status_code == 200
+    assert page.content_type == "text/html"
+    assert page.text == ARTICLE.decode()
+    assert page.truncated is False
+
+
+def test_connections_are_reused(news_site):
+    server, base_url = news_site
+
+    async def fetch_many(fetcher):
+        for _ in range(5):
+            await fetcher.fetch(f"{base_url}/article")
+
+    run_with_fetcher(fetch_many)
+    assert server.connections == 1
+
+
+def test_per_host_connection_limit(news_site):
+    server, base_url = news_site
+
+    async def fetch_concurrently(fetcher):
+        await asyncio.gather(*(fetcher.fetch(f"{base_url}/hold/{i}") for i in range(6)))
+
+    run_with_fetcher(fetch_concurrently, max_connections_per_host=2)
+    assert server.max_in_flight == 2
+
+
+def test_read_timeout(news_site):
+    server, base_url = news_site
+    with pytest.raises(FetchError):
+        run_with_fetcher(lambda fetcher: fetcher.fetch(f"{base_url}/slow"), read_timeout=0.3)
+
+
+def test_total_deadline(news_site):
+    # Each chunk arrives within the read timeout but the whole body does not
+    server, base_url = news_site
+    started = time.monotonic()
+    with pytest.raises(FetchError):
+        run_with_fetcher(lambda fetcher: fetcher.fetch(f"{base_url}/drip"), read_timeout=1, total_timeout=0.5)
+    assert time.monotonic() - started < 1
+
+
+def test_body_is_capped(news_site):
+    server, base_url = news_site
+    page = run_with_fetcher(lambda fetcher: fetcher.fetch(f"{base_url}/huge"), max_body_bytes=10_000)
+    assert len(page.body) == 10_000
+    assert page.truncated is True
+
+
+def test_body_is_extracted_while_it_downloads(news_site):
+    server, base_url = news_site
+    page = run_with_fetcher(lambda fetcher: fetcher.fetch(f"{base_url}/article", consume=create_extractor))
+    assert page.body == b""
+    assert page.size == len(ARTICLE)
+    assert page.consumer.text() == "Breaking news."
+
+
+def test_download_stops_once_the_extractor_is_done(news_site):
+    server, base_url = news_site
+    page = run_with_fetcher(lambda fetcher: fetcher.fetch(
+        f"{base_url}/long", consume=lambda encoding: create_extractor(encoding, max_chars=1000)))
+    assert len(page.consumer.text()) >= 1000
+    assert page.size < 500_000
+    assert page.truncated is True
+
+
+@pytest.mark.parametrize("path", ["/report.pdf", "/clip", "/missing"])
+def test_unusable_pages_are_skipped(news_site, path):
+    server, base_url = news_site
+    with pytest.raises(FetchError):
+        run_with_fetcher(lambda fetcher: fetcher.fetch(f"{base_url}{path}"))
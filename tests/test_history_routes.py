@@ -1,21 +1,21 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, Session, create_engine, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.main import app
-from app.db import get_session
+from app.db import async_url, get_session
 from app.models.history_models import Conversation, Message
 
 # Create SQLite database for testing
 SQLITE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLITE_URL, connect_args={"check_same_thread": False})
+async_engine = create_async_engine(async_url(SQLITE_URL))
 
 # Override the get_session function to use the test SQLite database
-def override_get_session():
-    session = Session(engine)
-    try:
+async def override_get_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
-    finally:
-        session.close()
 
 app.dependency_overrides[get_session] = override_get_session
 
@@ -174,11 +174,6 @@ def test_get_all_user_conversations(client, access_token):
     assert response.status_code == 200
     conversation_data = response.json()
 
-    # Print or inspect the response data structure
-    print("Response data:", conversation_data)
-    
-    user_id = conversation_data["user_id"]
-
     response = client.post(
         "/history/start_new_conversation/",
         headers={"Authorization": f"Bearer {access_token}"}
@@ -187,12 +182,34 @@ def test_get_all_user_conversations(client, access_token):
 
     # Get all conversations for the user
     response = client.get(
-        f"/history/get_all_user_conversations/{user_id}/",
+        "/history/get_all_user_conversations/",
         headers={"Authorization": f"Bearer {access_token}"}
     )
     assert response.status_code == 200
-    conversations = response.json()
-    assert len(conversations) == 2
+    page = response.json()
+    assert len(page["conversations"]) == 2
+    assert page["next_cursor"] is None
+
+def test_get_all_user_conversations_pages(client, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    started = [client.post("/history/start_new_conversation/", headers=headers).json()["conversation_id"] for _ in range(5)]
+
+    # Newest first, two at a time, each conversation exactly once
+    listed, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        page = client.get("/history/get_all_user_conversations/", params=params, headers=headers).json()
+        assert len(page["conversations"]) <= 2
+        listed += [conversation["conversation_id"] for conversation in page["conversations"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert listed == started[::-1]
+
+    response = client.get("/history/get_all_user_conversations/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+    response = client.get("/history/get_all_user_conversations/", params={"limit": 0}, headers=headers)
+    assert response.status_code == 422
 
 def test_mark_conversation_as_active(client, access_token):
     # Start a conversation first
@@ -333,4 +350,82 @@ def test_exit_conversation(client, access_token, create_conversation_and_message
     history_response = client.get(f"/history/get_conversation_history/{conversation['conversation_id']}/", headers={"Authorization": f"Bearer {access_token}"})
     assert history_response.status_code == 200
     history_data = history_response.json()
-    assert history_data["is_active"] is False  # Confirm it's inactive in the history
\ No newline at end of file
+    assert history_data["is_active"] is False  # Confirm it's inactive in the history
+
+def test_get_conversation_history_pages(client, access_token, create_conversation_and_message):
+    conversation, first_message = create_conversation_and_message
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for number in range(4):
+        client.post(f"/history/add_message/{conversation['conversation_id']}/",
+                    json={"role": "user", "content": f"message {number}"}, headers=headers)
+
+    # The latest messages first, in order within the page, then older pages
+    url = f"/history/get_conversation_history/{conversation['conversation_id']}/"
+    page = client.get(url, params={"limit": 2}, headers=headers).json()
+    assert [message["content"] for message in page["messages"]] == ["message 2", "message 3"]
+    page = client.get(url, params={"limit": 2, "cursor": page["next_cursor"]}, headers=headers).json()
+    assert [message["content"] for message in page["messages"]] == ["message 0", "message 1"]
+    page = client.get(url, params={"limit": 2, "cursor": page["next_cursor"]}, headers=headers).json()
+    assert [message["content"] for message in page["messages"]] == ["Initial message"]
+    assert page["next_cursor"] is None
+
+    # Resuming pages the same way
+    client.get(f"/history/exit_conversation/{conversation['conversation_id']}/", headers=headers)
+    resumed = client.get(f"/history/resume_old_conversation/{conversation['conversation_id']}", params={"limit": 3}, headers=headers).json()
+    assert resumed["is_active"] is True
+    assert [message["content"] for message in resumed["messages"]] == ["message 1", "message 2", "message 3"]
+    assert resumed["next_cursor"] is not None
+
+
+def test_get_conversation_history_etag(client, access_token, create_conversation_and_message):
+    conversation, message = create_conversation_and_message
+    headers = {"Authorization": f"Bearer {access_token}"}
+    url = f"/history/get_conversation_history/{conversation['conversation_id']}/"
+
+    response = client.get(url, headers=headers)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    # Unchanged: 304 without a body, for the same page only
+    unchanged = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["ETag"] == etag
+    assert client.get(url, headers={**headers, "If-None-Match": f'"stale", W/{etag}'}).status_code == 304
+    assert client.get(url, params={"limit": 1}, headers={**headers, "If-None-Match": etag}).status_code == 200
+
+    # Every change to the conversation or its messages changes the ETag
+    seen = {etag}
+    changes = [
+        lambda: client.post(f"/history/add_message/{conversation['conversation_id']}/",
+                            json={"role": "user", "content": "another"}, headers=headers),
+        lambda: client.patch(f"/history/update_message/{message['message_id']}/", json={"content": "edited"}, headers=headers),
+        lambda: client.get(f"/history/exit_conversation/{conversation['conversation_id']}/", headers=headers),
+    ]
+    for change in changes:
+        assert change().status_code == 200
+        response = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag not in seen
+        seen.add(etag)
+
+    missing = client.get("/history/get_conversation_history/missing/", headers={**headers, "If-None-Match": etag})
+    assert missing.status_code == 404
+
+
+def test_cursors_of_the_wrong_rows_are_rejected(client, access_token, create_conversation_and_message):
+    conversation, message = create_conversation_and_message
+    headers = {"Authorization": f"Bearer {access_token}"}
+    client.post("/history/start_new_conversation/", headers=headers)
+    client.post(f"/history/add_message/{conversation['conversation_id']}/",
+                json={"role": "user", "content": "another"}, headers=headers)
+    conversations_cursor = client.get("/history/get_all_user_conversations/", params={"limit": 1}, headers=headers).json()["next_cursor"]
+    history_url = f"/history/get_conversation_history/{conversation['conversation_id']}/"
+    messages_cursor = client.get(history_url, params={"limit": 1}, headers=headers).json()["next_cursor"]
+
+    # Conversations are keyed by string ids, messages by integer ones
+    response = client.get("/history/get_all_user_conversations/", params={"cursor": messages_cursor}, headers=headers)
+    assert response.status_code == 400
+    response = client.get(history_url, params={"cursor": conversations_cursor}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,22 @@
+import asyncio
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from app import config
+from app.ai.llm import LatencyCallback, NodeLatency, get_llm
+
+
+def test_nodes_get_their_own_models():
+    classifier = get_llm("classifier")
+    assert classifier.model_name == config.CLASSIFIER_MODEL
+    assert classifier.temperature == config.CLASSIFIER_TEMPERATURE
+    assert classifier.max_tokens == config.CLASSIFIER_MAX_TOKENS
+    assert get_llm("assistant").model_name == config.ASSISTANT_MODEL
+    assert get_llm("classifier") is classifier
+
+
+def test_latency_is_recorded_per_call():
+    latency = NodeLatency()
+    model = FakeListChatModel(responses=["single", "multiple"], callbacks=[LatencyCallback(latency)])
+    asyncio.run(model.ainvoke("Is this a single story?"))
+    model.invoke("Is this a single story?")
+    assert latency.calls == 2
+    assert latency.as_dict()["average_seconds"] >= 0
@@ -0,0 +1,32 @@
+import asyncio
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+from app.ai.llm_cache import LLMResponseCache
+
+
+def ask(model, query):
+    # Messages of the graph state carry random ids
+    return asyncio.run(model.ainvoke([SystemMessage(content="You are a news assistant."), HumanMessage(content=query)]))
+
+
+def test_identical_prompts_skip_the_model():
+    cache = LLMResponseCache(ttl=60, max_entries=10)
+    model = FakeListChatModel(responses=["first", "second", "third"], cache=cache)
+
+    assert ask(model, "latest news on elections").content == "first"
+    answer = ask(model, "latest news on elections")
+    assert answer.content == "first"
+    assert answer.id != "first"
+    assert ask(model, "latest news on football").content == "second"
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+
+def test_sqlite_tier_is_shared(tmp_path):
+    path = str(tmp_path / "llm.db")
+    ask(FakeListChatModel(responses=["stored"], cache=LLMResponseCache(ttl=60, max_entries=10, sqlite_path=path)), "q")
+
+    other_worker = LLMResponseCache(ttl=60, max_entries=10, sqlite_path=path)
+    assert ask(FakeListChatModel(responses=["stored"], cache=other_worker), "q").content == "stored"
+    assert other_worker.stats.misses == 1
+    assert other_worker.disk.stats.hits == 1
@@ -0,0 +1,158 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from app.ai import main_agent
+from app.ai.admission import Overloaded
+from app.ai.checkpointer import CompactingMemorySaver
+from app.ai.main_agent import call_main_agent, compile_main_agent, tool_rounds
+
+
+def tool_call_message() -> AIMessage:
+    return AIMessage("", tool_calls=[{"name": "fetch_news", "args": {"query": "news"}, "id": str(uuid4())}])
+
+
+def test_tool_rounds_count_only_the_current_question():
+    messages = [
+        HumanMessage("first question"),
+        tool_call_message(),
+        ToolMessage("[]", tool_call_id="1"),
+        AIMessage("first answer"),
+        HumanMessage("second question"),
+        tool_call_message(),
+        ToolMessage("[]", tool_call_id="2"),
+        tool_call_message(),
+    ]
+    assert tool_rounds(messages) == 2
+    assert tool_rounds(messages[:5]) == 0
+
+
+class AlwaysSearching(BaseChatModel):
+    """Asks for another search on every turn unless tool calls are switched off."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "always-searching"
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_choice=None, **kwargs):
+        message = AIMessage("Final answer") if tool_choice == "none" else tool_call_message()
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**kwargs)
+
+
+class FakeSubAgent:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, state):
+        self.calls += 1
+        return {"final_news": []}
+
+
+def test_tool_loop_is_capped(monkeypatch):
+    monkeypatch.setattr(main_agent, "get_llm", lambda node: AlwaysSearching())
+    monkeypatch.setattr(main_agent, "create_checkpointer", lambda engine, rebuild: CompactingMemorySaver())
+    monkeypatch.setattr(main_agent.config, "MAX_TOOL_ROUNDS", 2)
+    sub_agent = FakeSubAgent()
+    agent = compile_main_agent(sub_agent)
+
+    response = asyncio.run(call_main_agent("latest news", str(uuid4()), agent))
+
+    assert sub_agent.calls == 2
+    assert response["messages"][-1]["content"] == "Final answer"
+
+
+class FailingSubAgent:
+    def __init__(self, error: Exception):
+        self.error = error
+        self.calls = 0
+
+    async def ainvoke(self, state):
+        self.calls += 1
+        raise self.error
+
+
+def test_overloaded_search_fails_the_run(monkeypatch):
+    monkeypatch.setattr(main_agent, "get_llm", lambda node: AlwaysSearching())
+    monkeypatch.setattr(main_agent, "create_checkpointer", lambda engine, rebuild: CompactingMemorySaver())
+    sub_agent = FailingSubAgent(Overloaded("tavily", 3))
+    agent = compile_main_agent(sub_agent)
+
+    with pytest.raises(Overloaded):
+        asyncio.run(call_main_agent("latest news", str(uuid4()), agent))
+    # Not retried by the assistant
+    assert sub_agent.calls == 1
+
+
+def test_other_search_errors_go_back_to_the_assistant(monkeypatch):
+    monkeypatch.setattr(main_agent, "get_llm", lambda node: AlwaysSearching())
+    monkeypatch.setattr(main_agent, "create_checkpointer", lambda engine, rebuild: CompactingMemorySaver())
+    monkeypatch.setattr(main_agent.config, "MAX_TOOL_ROUNDS", 1)
+    agent = compile_main_agent(FailingSubAgent(RuntimeError("search failed")))
+
+    response = asyncio.run(call_main_agent("latest news", str(uuid4()), agent))
+
+    assert response["messages"][-1]["content"] == "Final answer"
+
+
+class SearchingWithoutQuery(AlwaysSearching):
+    """Calls fetch_news without its query argument, then answers from the error it gets back."""
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_choice=None, **kwargs):
+        if isinstance(messages[-1], ToolMessage):
+            assert messages[-1].content.startswith("Error:")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage("Final answer"))])
+        message = AIMessage("", tool_calls=[{"name": "fetch_news", "args": {}, "id": str(uuid4())}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_invalid_tool_arguments_go_back_to_the_assistant(monkeypatch):
+    monkeypatch.setattr(main_agent, "get_llm", lambda node: SearchingWithoutQuery())
+    monkeypatch.setattr(main_agent, "create_checkpointer", lambda engine, rebuild: CompactingMemorySaver())
+    sub_agent = FakeSubAgent()
+    agent = compile_main_agent(sub_agent)
+
+    response = asyncio.run(call_main_agent("latest news", str(uuid4()), agent))
+
+    assert sub_agent.calls == 0
+    assert response["messages"][-1]["content"] == "Final answer"
+
+
+class SearchingInParallel(AlwaysSearching):
+    """Asks for three searches at once, and checks each request like OpenAI does."""
+
+    requests: list = []  # the messages of each call
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_choice=None, **kwargs):
+        self.requests.append(messages)
+        pending = set()
+        for message in messages:
+            if isinstance(message, ToolMessage):
+                assert message.tool_call_id in pending, "tool message without its tool call"
+                pending.discard(message.tool_call_id)
+            else:
+                assert not pending, "tool calls without their results"
+                pending = {call["id"] for call in getattr(message, "tool_calls", None) or []}
+        if tool_choice == "none":
+            return ChatResult(generations=[ChatGeneration(message=AIMessage("Final answer"))])
+        calls = [{"name": "fetch_news", "args": {"query": f"news {number}"}, "id": str(uuid4())} for number in range(3)]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("", tool_calls=calls))])
+
+
+def test_assistant_context_keeps_tool_calls_with_their_results(monkeypatch):
+    model = SearchingInParallel()
+    monkeypatch.setattr(main_agent, "get_llm", lambda node: model)
+    monkeypatch.setattr(main_agent, "create_checkpointer", lambda engine, rebuild: CompactingMemorySaver())
+    monkeypatch.setattr(main_agent.config, "MAX_TOOL_ROUNDS", 2)
+    agent = compile_main_agent(FakeSubAgent())
+
+    response = asyncio.run(call_main_agent("latest news", str(uuid4()), agent))
+
+    assert response["messages"][-1]["content"] == "Final answer"
+    # The answer was written seeing the question, past the 6-message window
+    last_request = model.requests[-1]
+    assert any(isinstance(message, HumanMessage) and message.content == "latest news" for message in last_request)
@@ -0,0 +1,61 @@
+import asyncio
+from typing import TypedDict
+import pytest
+from fastapi.testclient import TestClient
+from langgraph.graph import START, StateGraph
+from app.main import app
+from app.metrics import Counter, Histogram, node_errors, node_metrics, node_seconds
+
+
+def test_histograms_render_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test latency", ("node",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "a")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{node="a",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{node="a",le="1"} 3' in lines
+    assert 'test_seconds_bucket{node="a",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{node="a"} 4' in lines
+    assert 'test_seconds_sum{node="a"} 3.65' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "Test counter", ("error",))
+    counter.inc('bad "quote"\n', amount=2)
+    assert counter.render()[-1] == 'test_total{error="bad \\"quote\\"\\n"} 2'
+
+
+def test_metrics_endpoint_reports_requests_by_route():
+    client = TestClient(app)
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+
+
+class State(TypedDict):
+    value: int
+
+
+def test_graph_nodes_are_timed():
+    async def fast(state: State):
+        return {"value": 1}
+
+    async def broken(state: State):
+        raise ValueError("broken node")
+
+    builder = StateGraph(State)
+    builder.add_node("fast", fast)
+    builder.add_node("broken", broken)
+    builder.add_edge(START, "fast")
+    builder.add_edge("fast", "broken")
+    graph = builder.compile()
+
+    with pytest.raises(ValueError):
+        asyncio.run(graph.ainvoke({"value": 0}, {"callbacks": [node_metrics]}))
+
+    bucket_counts, _ = node_seconds.values[("fast",)]
+    assert sum(bucket_counts) >= 1
+    assert ("__start__",) not in node_seconds.values
+    assert node_errors.values[("broken", "ValueError")] >= 1
@@ -0,0 +1,163 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.history_handlers import (add_message_to_conversation, create_conversation, get_all_user_conversations,
+                                  get_conversation_history, get_or_create_active_conversation, get_recent_messages,
+                                  mark_conversation_as_active)
+from app.migrations import MIGRATIONS, MigrationError, current_version, upgrade
+from app.models import ai_models  # noqa: F401, registers the checkpoint tables
+from app.models.history_models import Conversation
+from app.models.user_models import User
+
+
+def index_names(engine) -> dict[str, set[str]]:
+    inspector = inspect(engine)
+    return {table: {index["name"] for index in inspector.get_indexes(table)} for table in inspector.get_table_names()}
+
+
+def column_names(engine) -> dict[str, set[str]]:
+    inspector = inspect(engine)
+    return {table: {column["name"] for column in inspector.get_columns(table)} for table in inspector.get_table_names()}
+
+
+def test_upgrade_migrates_once_and_matches_the_models(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    assert upgrade(engine) == [migration.version for migration in MIGRATIONS]
+    assert upgrade(engine) == []
+    with engine.connect() as connection:
+        assert current_version(connection) == len(MIGRATIONS)
+
+    # The models declare the same tables, columns and indexes the migrations create
+    from_models = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    SQLModel.metadata.create_all(from_models)
+    for names in (index_names, column_names):
+        migrated = names(engine)
+        migrated.pop("schema_version")
+        assert migrated == names(from_models)
+
+
+def test_upgrade_keeps_the_latest_active_conversation_of_existing_databases(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    upgrade(engine, target=1)  # a database from before the indexes
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (id, username, email, hashed_password, created_at) "
+                                "VALUES (1, 'reader', 'reader@example.com', 'x', :now)"), {"now": now})
+        for conversation_id, age in (("old", 2), ("newer", 1), ("newest", 0)):
+            connection.execute(text("INSERT INTO conversation (conversation_id, user_id, created_at, is_active) "
+                                    "VALUES (:id, 1, :created_at, 1)"), {"id": conversation_id, "created_at": now - timedelta(hours=age)})
+
+    assert upgrade(engine) == [2, 3, 4]
+    with engine.connect() as connection:
+        active = connection.execute(text("SELECT conversation_id FROM conversation WHERE is_active = 1")).scalars().all()
+    assert active == ["newest"]
+
+
+def test_upgrade_refuses_duplicate_emails_of_existing_databases(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    upgrade(engine, target=1)  # a database from before the indexes
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        for user_id, email in ((1, "reader@example.com"), (2, "other@example.com"), (3, "reader@example.com")):
+            connection.execute(text("INSERT INTO user (id, username, email, hashed_password, created_at) "
+                                    "VALUES (:id, 'reader', :email, 'x', :now)"), {"id": user_id, "email": email, "now": now})
+
+    # The error names the duplicates, and the database stays as it was
+    with pytest.raises(MigrationError, match=r"reader@example\.com \(2 users, ids 1 to 3\)"):
+        upgrade(engine)
+    with engine.connect() as connection:
+        assert current_version(connection) == 1
+
+    # Once they are resolved, the migrations apply
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE user SET email = 'reader+2@example.com' WHERE id = 3"))
+    assert upgrade(engine) == [2, 3, 4]
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    upgrade(engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    statements = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    async def scenario():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            user = User(username="reader", email="reader@example.com", hashed_password="x")
+            session.add(user)
+            await session.commit()
+            statements.clear()
+
+            # What login, call_agent and the history routes run
+            (await session.exec(select(User).where(User.email == "reader@example.com"))).first()
+            conversation = await get_or_create_active_conversation(session, user.id)
+            await add_message_to_conversation(session, conversation.conversation_id, "human", "question")
+            await get_recent_messages(session, conversation.conversation_id, 20)
+            await add_message_to_conversation(session, conversation.conversation_id, "ai", "answer")
+            await create_conversation(session, user.id)
+            page = await get_all_user_conversations(session, user.id, limit=1)
+            await get_all_user_conversations(session, user.id, limit=1, cursor=page["next_cursor"])
+            page = await get_conversation_history(session, conversation.conversation_id, limit=1)
+            await get_conversation_history(session, conversation.conversation_id, limit=1, cursor=page["next_cursor"])
+            await mark_conversation_as_active(session, conversation.conversation_id)
+
+            plans = []
+            for statement, parameters in statements:
+                rows = (await session.connection()).exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                plans.append((statement, [row[-1] for row in (await rows).all()]))
+        await async_engine.dispose()
+        return plans
+
+    plans = asyncio.run(scenario())
+    assert len(plans) >= 8
+    for statement, plan in plans:
+        # SEARCH is a lookup through an index or the primary key, SCAN reads the whole table
+        assert all(step.startswith(("SEARCH", "USE TEMP B-TREE")) for step in plan), (statement, plan)
+
+
+def test_one_active_conversation_per_user(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    upgrade(engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+
+    async def scenario():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            user = User(username="reader", email="reader@example.com", hashed_password="x")
+            session.add(user)
+            await session.commit()
+            conversations = [await create_conversation(session, user.id) for _ in range(3)]
+            await mark_conversation_as_active(session, conversations[0].conversation_id)
+            active = (await session.exec(select(Conversation.conversation_id).where(Conversation.is_active == True))).all()
+        await async_engine.dispose()
+        return conversations[0].conversation_id, active
+
+    first, active = asyncio.run(scenario())
+    assert active == [first]
+
+
+def test_updated_at_is_backfilled_from_the_latest_message(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    upgrade(engine, target=3)  # a database from before updated_at
+    created_at = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (id, username, email, hashed_password, created_at) "
+                                "VALUES (1, 'reader', 'reader@example.com', 'x', :at)"), {"at": created_at})
+        for conversation_id in ("quiet", "talked"):
+            connection.execute(text("INSERT INTO conversation (conversation_id, user_id, created_at, is_active) "
+                                    "VALUES (:id, 1, :at, 0)"), {"id": conversation_id, "at": created_at})
+        for hours in (1, 2):
+            connection.execute(text("INSERT INTO message (conversation_id, role, content, created_at) "
+                                    "VALUES ('talked', 'human', 'hi', :at)"), {"at": created_at + timedelta(hours=hours)})
+
+    assert upgrade(engine) == [4]
+    with engine.connect() as connection:
+        updated_at = dict(connection.execute(text("SELECT conversation_id, updated_at FROM conversation")).all())
+    assert updated_at == {"quiet": str(created_at), "talked": str(created_at + timedelta(hours=2))}
@@ -0,0 +1,35 @@
+from app.ai.packing import article_budget, estimate_tokens, pack_articles, trim_text
+
+FILLER = "The council met on Tuesday to review the agenda for the coming season. "
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 400) == 100
+    # Short words and numbers cost at least a token each
+    assert estimate_tokens("1 2 3 4 5 6 7 8") == 8
+
+
+def test_article_budget_scales_with_article_count():
+    assert article_budget(6000, 1, 400, 4000) == 4000
+    assert article_budget(6000, 3, 400, 4000) == 1960
+    assert article_budget(6000, 30, 400, 4000) == 400
+
+
+def test_trim_text_keeps_lead_and_relevant_sentences():
+    text = "Floods hit the northern province on Monday. " + FILLER * 40 + "Rescue teams evacuated 3,000 residents from flooded villages."
+    trimmed = trim_text(text, 60, query="flood evacuation residents", snippet="Thousands evacuated after floods")
+    assert estimate_tokens(trimmed) <= 60
+    assert trimmed.startswith("Floods hit the northern province on Monday.")
+    assert trimmed.endswith("Rescue teams evacuated 3,000 residents from flooded villages.")
+
+
+def test_short_articles_are_untouched():
+    assert trim_text("Short story.", 100) == "Short story."
+
+
+def test_pack_articles_fits_the_budget():
+    articles = [{"url": f"https://news.example/{i}", "content": "Snippet", "details": FILLER * 200} for i in range(3)]
+    packed = pack_articles(articles, "council agenda", total_budget=1500, min_tokens=100, max_tokens=4000)
+    assert [article["url"] for article in packed] == [article["url"] for article in articles]
+    assert sum(estimate_tokens(article["details"]) for article in packed) <= 1500
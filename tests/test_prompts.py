@@ -0,0 +1,22 @@
+from datetime import date
+from app.ai.prompts import ASSISTANT_PREFIX, assistant_system_messages, assistant_system_tokens
+
+
+def test_instructions_are_the_same_every_day():
+    monday = assistant_system_messages(date(2024, 10, 14))
+    tuesday = assistant_system_messages(date(2024, 10, 15))
+    # Byte-identical prefix, so the provider's prompt cache keeps matching
+    assert monday[0] is tuesday[0] is ASSISTANT_PREFIX.message
+    assert "2024" not in monday[0].content
+
+
+def test_the_date_follows_the_instructions():
+    messages = assistant_system_messages(date(2024, 10, 14))
+    assert messages[-1].content == "Today's date is October 14, 2024."
+    assert assistant_system_messages(date(2024, 10, 14))[-1] is messages[-1]
+    assert assistant_system_messages(date(2024, 10, 15))[-1].content == "Today's date is October 15, 2024."
+
+
+def test_token_counts_are_precomputed():
+    assert ASSISTANT_PREFIX.tokens > 300
+    assert ASSISTANT_PREFIX.tokens < assistant_system_tokens(date(2024, 10, 14)) < ASSISTANT_PREFIX.tokens + 20
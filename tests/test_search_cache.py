@@ -0,0 +1,56 @@
+import asyncio
+from app.ai.search_cache import SearchCache
+
+# Stand-in for the Tavily call that counts how often it is really made
+class FakeSearch:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return [{"url": "https://news.example/a", "content": "Breaking news"}]
+
+
+def test_concurrent_identical_queries_share_one_call():
+    cache = SearchCache(ttl=60, max_entries=10)
+    upstream = FakeSearch()
+
+    async def search_concurrently():
+        return await asyncio.gather(*(cache.search("Latest news on Mars", 3, upstream) for _ in range(10)))
+
+    results = asyncio.run(search_concurrently())
+    assert upstream.calls == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats.coalesced == 9
+
+
+def test_normalized_queries_hit_the_cache():
+    cache = SearchCache(ttl=60, max_entries=10)
+    upstream = FakeSearch()
+
+    async def search_variants():
+        await cache.search("Latest news on Mars", 3, upstream)
+        await cache.search("  latest NEWS on  mars ", 3, upstream)
+        await cache.search("latest news on mars", 1, upstream)
+
+    asyncio.run(search_variants())
+    # A different max_results is a different search
+    assert upstream.calls == 2
+    stats = cache.stats_dict()
+    assert stats["hits"] == 1
+    assert stats["saved_calls"] == 1
+    assert stats["saved_seconds"] > 0
+
+
+def test_expired_results_are_searched_again():
+    cache = SearchCache(ttl=0, max_entries=10)
+    upstream = FakeSearch()
+
+    async def search_twice():
+        await cache.search("latest news on mars", 3, upstream)
+        await asyncio.sleep(0.01)
+        await cache.search("latest news on mars", 3, upstream)
+
+    asyncio.run(search_twice())
+    assert upstream.calls == 2
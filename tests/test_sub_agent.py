@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from app.ai import tools
+from app.ai.tools import DUPLICATE_DETAILS, combine_news, needs_scraping, web_loader
+from app.ai.turn import new_turn
+
+LONG_RAW_CONTENT = "Full article text. " * 200
+
+
+def test_needs_scraping():
+    assert needs_scraping({"url": "https://news.example/a", "content": "Snippet", "raw_content": None})
+    assert needs_scraping({"url": "https://news.example/a", "content": "Snippet", "raw_content": "Too short"})
+    assert needs_scraping({"url": "https://news.example/a", "content": "Snippet", "raw_content": LONG_RAW_CONTENT + "..."})
+    assert not needs_scraping({"url": "https://news.example/a", "content": "Snippet", "raw_content": LONG_RAW_CONTENT})
+
+
+def test_combine_news_matches_scrapped_pages_by_url():
+    state = {
+        "tavily_news": [
+            {"url": "https://news.example/a", "content": "Snippet a", "raw_content": LONG_RAW_CONTENT},
+            {"url": "https://news.example/b", "content": "Snippet b", "raw_content": None},
+            {"url": "https://news.example/c", "content": "Snippet c", "raw_content": "Short"},
+        ],
+        # Scrapped pages arrive in completion order
+        "scrapped_news": [
+            {"url": "https://news.example/c", "details": "Page c"},
+            {"url": "https://news.example/b", "details": "Page b"},
+        ],
+    }
+    final_news = combine_news(state)["final_news"]
+    assert [news["url"] for news in final_news] == ["https://news.example/a", "https://news.example/b", "https://news.example/c"]
+    assert final_news[0]["details"] == LONG_RAW_CONTENT.strip()
+    assert final_news[1]["details"] == "Page b"
+    assert final_news[2]["details"] == "Page c"
+
+
+def test_combine_news_falls_back_to_the_snippet():
+    state = {
+        "tavily_news": [{"url": "https://news.example/a", "content": "Snippet a", "raw_content": None}],
+        # The page timed out or failed
+        "scrapped_news": [{"url": "https://news.example/a", "details": ""}],
+    }
+    assert combine_news(state)["final_news"][0]["details"] == "Snippet a"
+
+
+def test_combine_news_returns_each_article_once_per_turn():
+    state = {
+        "tavily_news": [{"url": "https://news.example/a", "content": "Snippet a", "raw_content": LONG_RAW_CONTENT}],
+        "scrapped_news": [],
+    }
+    with new_turn():
+        first = combine_news(state)["final_news"][0]
+        again = combine_news(state)["final_news"][0]
+    assert first["details"] == LONG_RAW_CONTENT.strip()
+    assert again == {"url": "https://news.example/a", "content": "Snippet a", "details": DUPLICATE_DETAILS}
+
+    # A new turn gets the article again
+    with new_turn():
+        assert combine_news(state)["final_news"][0]["details"] == LONG_RAW_CONTENT.strip()
+
+
+class SlowArticleCache:
+    def __init__(self, delay, error=None):
+        self.delay = delay
+        self.error = error
+        self.loads = 0
+
+    async def load(self, url, fetcher, extract, consume=None):
+        self.loads += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return "Page text"
+
+
+def test_web_loader_drops_pages_past_the_deadline(monkeypatch, caplog):
+    monkeypatch.setattr(tools, "get_article_cache", lambda: SlowArticleCache(delay=5))
+
+    async def load():
+        started = time.monotonic()
+        result = await web_loader({"url": "https://slow.example/a", "deadline": started + 0.1})
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(load())
+    assert result == {"scrapped_news": [{"url": "https://slow.example/a", "details": ""}]}
+    assert elapsed < 1
+    assert caplog.record_tuples == [("app.ai.tools", logging.INFO, "Dropped https://slow.example/a: still loading at the scrape deadline")]
+
+
+def test_web_loader_survives_broken_pages(monkeypatch, caplog):
+    monkeypatch.setattr(tools, "get_article_cache", lambda: SlowArticleCache(delay=0, error=ValueError("bad page")))
+    result = asyncio.run(web_loader({"url": "https://broken.example/a", "deadline": time.monotonic() + 5}))
+    assert result == {"scrapped_news": [{"url": "https://broken.example/a", "details": ""}]}
+    assert caplog.record_tuples == [("app.ai.tools", logging.WARNING, "Failed to load https://broken.example/a: ValueError('bad page')")]
+
+
+def test_concurrent_calls_of_a_turn_load_a_page_once(monkeypatch):
+    cache = SlowArticleCache(delay=0.05)
+    monkeypatch.setattr(tools, "get_article_cache", lambda: cache)
+
+    async def load():
+        state = {"url": "https://news.example/a", "deadline": time.monotonic() + 5}
+        with new_turn():
+            return await asyncio.gather(web_loader(state), web_loader(state))
+
+    results = asyncio.run(load())
+    assert cache.loads == 1
+    assert all(result["scrapped_news"][0]["details"] == "Page text" for result in results)